@@ -0,0 +1,272 @@
+"""
+Admission control for the routes that queue work.
+
+Each gated route admits a fixed number of requests at once; further requests
+wait in a bounded FIFO queue for at most a set time. A request that finds
+the queue full, or is still waiting when its time runs out, is rejected
+straight away with 429 and a ``Retry-After`` estimated from the route's
+recent service time, so overload turns into fast rejections rather than
+slow responses on every endpoint. An optional token bucket per client
+(keyed by address, or by a header set by a trusted proxy) rejects clients
+that send faster than their rate before they take a slot.
+
+The gate runs in the route's ``handle``, before FastAPI reads the body. A
+``Content-Length`` above the route's body limit is rejected (413) without
+reading anything, and bodies without one are counted as they stream in and
+cut off at the limit, so an oversized upload never reaches a temp file in
+full.
+
+Limits are per server process and rely on the event loop rather than
+locks: every method is called from the loop that serves the route.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+# Retry-After bounds, in seconds
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+DEFAULT_MAX_CLIENTS = 10000
+
+def too_many_requests(detail: str, retry_after: float) -> HTTPException:
+    """429 telling the client how many whole seconds to wait"""
+    seconds = min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(retry_after)))
+    return HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(seconds)})
+
+class RateLimiter:
+    """Token bucket per client: ``rate`` requests a second, bursts of up to ``burst``
+
+    Only the most recently seen ``max_clients`` buckets are kept; a client
+    whose bucket was dropped starts again with a full one.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = DEFAULT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str) -> float:
+        """Spend one token, returning 0, or the seconds until the client has one"""
+        now = time.monotonic()
+        bucket = self._buckets.pop(client, None)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens, updated = bucket
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "burst": self.burst, "clients": len(self._buckets)}
+
+class RouteGate:
+    """Concurrency limit, bounded wait queue, body size limit and rate limit for one route"""
+
+    def __init__(self, name: str, concurrency: int, max_queued: int, queue_timeout: float,
+                 max_body_bytes: Optional[int] = None, rate_limiter: Optional[RateLimiter] = None,
+                 client_header: Optional[str] = None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self.max_body_bytes = max_body_bytes or None
+        self.rate_limiter = rate_limiter
+        self.client_header = client_header.lower().encode("latin-1") if client_header else None
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Exponentially weighted mean seconds per admitted request, for Retry-After
+        self._service_seconds = 0.0
+        self.admitted = 0
+        self.peak_queued = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0, "rate_limited": 0, "too_large": 0}
+
+    def retry_after(self) -> float:
+        """Seconds until a slot is likely to be free for a request arriving now"""
+        return self._service_seconds * (len(self._waiters) + 1) / self.concurrency
+
+    def check(self, scope: Dict[str, Any]) -> None:
+        """Reject a request before it takes a slot: over its client's rate or declaring too large a body"""
+        if self.rate_limiter is not None:
+            wait = self.rate_limiter.take(self._client(scope))
+            if wait > 0:
+                self.rejected["rate_limited"] += 1
+                raise too_many_requests("Rate limit exceeded, retry later", wait)
+        if self.max_body_bytes is not None:
+            for name, value in scope["headers"]:
+                if name == b"content-length":
+                    try:
+                        declared = int(value)
+                    except ValueError:
+                        break
+                    if declared > self.max_body_bytes:
+                        raise self._too_large()
+                    break
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in FIFO order; 429 when the queue is full or the wait times out"""
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            self.rejected["queue_full"] += 1
+            raise too_many_requests(f"Too many {self.name} requests queued, retry later", self.retry_after())
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        timer = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            # release() hands its slot over with True; _expire() gives up with False
+            granted = await waiter
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            else:
+                self._discard(waiter)
+            raise
+        finally:
+            timer.cancel()
+        if not granted:
+            self.rejected["queue_timeout"] += 1
+            raise too_many_requests(f"Timed out in the {self.name} queue, retry later", self.retry_after())
+        self.admitted += 1
+
+    def release(self, seconds: Optional[float] = None) -> None:
+        """Free a slot, handing it straight to the longest waiting request"""
+        if seconds is not None:
+            self._service_seconds += 0.2 * (seconds - self._service_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def limit_body(self, receive: Callable) -> Callable:
+        """Wrap ``receive`` to cut the body off with 413 once it passes the limit"""
+        limit = self.max_body_bytes
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise self._too_large()
+            return message
+
+        return limited_receive
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "max_queued": self.max_queued,
+            "peak_queued": self.peak_queued,
+            "queue_timeout_s": self.queue_timeout,
+            "max_body_bytes": self.max_body_bytes,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_service_ms": round(self._service_seconds * 1000, 3)
+        }
+        if self.rate_limiter is not None:
+            stats["rate_limit"] = self.rate_limiter.stats()
+        return stats
+
+    def _client(self, scope: Dict[str, Any]) -> str:
+        if self.client_header is not None:
+            for name, value in scope["headers"]:
+                if name == self.client_header:
+                    # X-Forwarded-For style lists name the original client first
+                    return value.decode("latin-1").split(",", 1)[0].strip()
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    def _expire(self, waiter: asyncio.Future) -> None:
+        if not waiter.done():
+            self._discard(waiter)
+            waiter.set_result(False)
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _too_large(self) -> HTTPException:
+        self.rejected["too_large"] += 1
+        return HTTPException(status_code=413, detail=f"Request body exceeds {self.max_body_bytes} bytes")
+
+class AdmissionRoute(APIRoute):
+    """API route that passes requests through its gate, if it has one (see install_gates)"""
+
+    gate: Optional[RouteGate] = None
+
+    async def handle(self, scope, receive, send) -> None:
+        gate = self.gate
+        if gate is None:
+            await super().handle(scope, receive, send)
+            return
+        gate.check(scope)
+        await gate.acquire()
+        started = time.perf_counter()
+        try:
+            if gate.max_body_bytes is not None:
+                receive = gate.limit_body(receive)
+            await super().handle(scope, receive, send)
+        finally:
+            gate.release(time.perf_counter() - started)
+
+def install_gates(routes: Iterable[Any], gates: Dict[Tuple[str, str], RouteGate]) -> None:
+    """Attach each gate to the AdmissionRoute registered for its (path, method)"""
+    remaining = dict(gates)
+    for route in routes:
+        if not isinstance(route, AdmissionRoute):
+            continue
+        for method in route.methods:
+            gate = remaining.pop((route.path, method), None)
+            if gate is not None:
+                route.gate = gate
+    if remaining:
+        raise ValueError(f"No admission route for {sorted(remaining)}")
+
+def create_route_gate(name: str, concurrency: int, max_queued: int, queue_timeout: float,
+                      max_body_bytes: Optional[int] = None) -> RouteGate:
+    """Build a gate whose defaults are overridden by {NAME}_CONCURRENCY / {NAME}_WAIT_QUEUE /
+    {NAME}_WAIT_TIMEOUT / {NAME}_RATE_LIMIT / {NAME}_RATE_BURST and RATE_LIMIT_CLIENT_HEADER"""
+    prefix = name.upper()
+    rate = float(os.getenv(f"{prefix}_RATE_LIMIT", 0))
+    rate_limiter = None
+    if rate > 0:
+        burst = int(os.getenv(f"{prefix}_RATE_BURST", 0)) or max(1, math.ceil(rate))
+        rate_limiter = RateLimiter(rate, burst)
+    return RouteGate(
+        name,
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", concurrency)),
+        max_queued=int(os.getenv(f"{prefix}_WAIT_QUEUE", max_queued)),
+        queue_timeout=float(os.getenv(f"{prefix}_WAIT_TIMEOUT", queue_timeout)),
+        max_body_bytes=max_body_bytes,
+        rate_limiter=rate_limiter,
+        client_header=os.getenv("RATE_LIMIT_CLIENT_HEADER") or None
+    )
@@ -0,0 +1,84 @@
+"""
+Memoized validation results.
+
+A risk assessment is a function of the normalized deal record, the rule set
+and the noise seed (see rules.noise_seed), so results are cached under a
+digest of exactly those inputs. Re-validating an unchanged deal, validating
+after a no-op edit, or revisiting an earlier /simulate scenario is then a
+dictionary lookup. Any change to the record, including a new sanctions
+watchlist version, or to the rule configuration produces a different key.
+
+Without deterministic scoring the cached result keeps the noise drawn when
+it was first computed.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from normalization import NormalizedDeal
+
+class AssessmentCache:
+    """Bounded LRU of assessment results keyed by their inputs"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every change, so a snapshot can skip an unchanged cache
+        self.version = 0
+
+    @staticmethod
+    def key(record: NormalizedDeal, rule_set_id: str, seed: Optional[str], kind: str = "assessment") -> str:
+        """Digest of the record, rule set ID, noise seed and result kind"""
+        digest = hashlib.sha256(record.model_dump_json().encode("utf-8"))
+        digest.update(f"|{rule_set_id}|{seed}|{kind}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.version += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def entries(self) -> List[Tuple[str, Any]]:
+        """Every entry, least recently used first"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def load(self, entries: List[Tuple[str, Any]]) -> None:
+        """Add restored entries (see snapshot.py) behind those added since startup"""
+        with self._lock:
+            current = self._entries
+            self._entries = OrderedDict((key, value) for key, value in entries if key not in current)
+            self._entries.update(current)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,499 @@
+"""
+Append-only audit log of deal events (upload, extraction, validation,
+simulation, delete).
+
+Events are appended to segment files under AUDIT_LOG_DIR. Each server
+process owns one ``writer-N`` directory (claimed with an exclusive file lock)
+and rotates to a new segment once the current one reaches
+AUDIT_SEGMENT_BYTES. Segments are never rewritten.
+
+``record`` only encodes the event and queues it, so request handlers never
+wait for the disk. A writer thread takes everything queued since its last
+commit, writes it in one call and fsyncs once (group commit); under load
+each fsync covers many events, and AUDIT_COMMIT_INTERVAL caps the fsync
+rate. Events become readable once their batch is on disk.
+
+Every record is framed as::
+
+    payload length (u32) | CRC32 (u32) | epoch microseconds (i64) | deal ID length (u16) | deal ID | JSON payload
+
+so the indexes can be rebuilt from the segments alone. At startup (and,
+for other processes' writer directories, before each read) the segments
+are scanned into a per-deal offset index and a sparse time index. Reads go
+through a read-only mmap of each segment. A torn record at the end of this
+process's last segment, left by a crash, is truncated before appending.
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one writer directory per log
+    fcntl = None
+
+from serialization import dumps, loads
+
+EVENT_TYPES = ("upload", "extraction", "validation", "simulation", "delete")
+
+RECORD_HEADER = struct.Struct("<IIqH")
+SEGMENT_SUFFIX = ".seg"
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_COMMIT_INTERVAL = 0.005
+# Records between entries of a segment's time index
+TIME_INDEX_INTERVAL = 256
+# Offset bits in a packed (segment, offset) index entry
+OFFSET_BITS = 40
+# Records read per lock acquisition by range queries
+READ_BATCH = 256
+
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+class _Segment:
+    """One segment file and how far it has been indexed"""
+
+    __slots__ = ("segment_id", "writer", "number", "path", "indexed", "map",
+                 "first_time", "last_time", "times", "offsets", "records")
+
+    def __init__(self, segment_id: int, writer: int, number: int, path: str):
+        self.segment_id = segment_id
+        self.writer = writer
+        self.number = number
+        self.path = path
+        self.indexed = 0
+        self.map: Optional[mmap.mmap] = None
+        self.first_time: Optional[int] = None
+        self.last_time: Optional[int] = None
+        # Sparse time index: every TIME_INDEX_INTERVAL-th record's timestamp and offset
+        self.times = array("q")
+        self.offsets = array("Q")
+        self.records = 0
+
+    def view(self, end: int) -> mmap.mmap:
+        """A mapping covering at least the first ``end`` bytes, remapped as the file grows"""
+        if self.map is None or len(self.map) < end:
+            if self.map is not None:
+                self.map.close()
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map
+
+class AuditLog:
+    """Segmented append-only event log with group-commit writes and indexed reads"""
+
+    def __init__(self, directory: str, segment_bytes: int = DEFAULT_SEGMENT_BYTES,
+                 commit_interval: float = DEFAULT_COMMIT_INTERVAL):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._by_path: Dict[str, _Segment] = {}
+        self._by_deal: Dict[str, array] = {}
+
+        self._pending: List[Tuple[int, bytes, bytes]] = []
+        self._pending_lock = threading.Condition(threading.Lock())
+        self._last_timestamp = 0
+        self._appended = 0
+        self._committed = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.events_written = 0
+        self.commits = 0
+        self.bytes_written = 0
+        self.write_errors = 0
+
+        self.writer, self._writer_lock = self._claim_writer()
+        self._writer_dir = os.path.join(directory, f"writer-{self.writer}")
+        with self._lock:
+            self._refresh(include_own=True)
+        self._open_active_segment()
+
+    # Writing
+
+    def record(self, deal_id: str, event_type: str, title: str, description: str, user: str = "System",
+               status: str = "completed", severity: Optional[str] = None,
+               details: Optional[Dict[str, Any]] = None) -> None:
+        """Queue an event; it is written and fsynced by the writer thread"""
+        payload: Dict[str, Any] = {
+            "type": event_type,
+            "title": title,
+            "description": description,
+            "user": user,
+            "status": status
+        }
+        if severity is not None:
+            payload["severity"] = severity
+        if details:
+            payload["details"] = details
+        encoded = dumps(payload)
+        deal_key = deal_id.encode("utf-8")
+        with self._pending_lock:
+            # Monotonic per writer, so each segment is in timestamp order
+            timestamp = max(time.time_ns() // 1000, self._last_timestamp)
+            self._last_timestamp = timestamp
+            self._pending.append((timestamp, deal_key, encoded))
+            self._appended += 1
+            if len(self._pending) == 1:
+                self._pending_lock.notify()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Commit everything queued so far and stop the writer thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._pending_lock:
+            self._stopping = True
+            self._pending_lock.notify()
+        thread.join()
+        self._thread = None
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every event recorded before the call is on disk"""
+        with self._pending_lock:
+            target = self._appended
+            return self._pending_lock.wait_for(lambda: self._committed >= target, timeout)
+
+    def _run(self) -> None:
+        last_commit = 0.0
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._stopping:
+                    self._pending_lock.wait()
+                if not self._pending:
+                    return
+            # Let more events join the batch rather than fsyncing once per event
+            wait = last_commit + self.commit_interval - time.monotonic()
+            if wait > 0 and not self._stopping:
+                time.sleep(wait)
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            queued = len(batch)
+            try:
+                self._commit(batch)
+            except OSError:
+                # Requeue what is not on disk yet and retry; a full or failing disk must not take requests down
+                self.write_errors += 1
+                with self._pending_lock:
+                    self._pending[:0] = batch
+                    self._committed += queued - len(batch)
+                    self._pending_lock.notify_all()
+                time.sleep(max(self.commit_interval, 0.1))
+                continue
+            last_commit = time.monotonic()
+            with self._pending_lock:
+                self._committed += queued
+                self._pending_lock.notify_all()
+
+    def _commit(self, batch: List[Tuple[int, bytes, bytes]]) -> None:
+        """Write and fsync a batch, removing events from it as they become durable"""
+        frames = []
+        size = 0
+        for timestamp, deal_key, payload in batch[:]:
+            header = RECORD_HEADER.pack(len(payload), zlib.crc32(payload, zlib.crc32(deal_key)),
+                                        timestamp, len(deal_key))
+            frame = header + deal_key + payload
+            if self._active_size + size + len(frame) > self.segment_bytes and (size or self._active_size):
+                self._write(frames, size, batch)
+                self._rotate()
+                frames, size = [], 0
+            frames.append(frame)
+            size += len(frame)
+        self._write(frames, size, batch)
+
+    def _write(self, frames: List[bytes], size: int, batch: List[Tuple[int, bytes, bytes]]) -> None:
+        if not frames:
+            return
+        view = memoryview(b"".join(frames))
+        try:
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+            _fdatasync(self._fd)
+        except OSError:
+            # Cut off a partial write so the next commit does not follow a torn record
+            try:
+                os.ftruncate(self._fd, self._active_size)
+            except OSError:
+                pass
+            raise
+        del batch[:len(frames)]
+        self._active_size += size
+        self.bytes_written += size
+        self.commits += 1
+        with self._lock:
+            self.events_written += self._scan(self._active, verify=False)
+
+    def _rotate(self) -> None:
+        os.close(self._fd)
+        number = self._active.number + 1
+        with self._lock:
+            self._active = self._add_segment(self.writer, number,
+                                             os.path.join(self._writer_dir, f"{number:08d}{SEGMENT_SUFFIX}"))
+        self._fd = os.open(self._active.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active_size = 0
+        _fsync_directory(self._writer_dir)
+
+    def _claim_writer(self) -> Tuple[int, Optional[int]]:
+        """The first writer directory no other live process holds"""
+        number = 0
+        while True:
+            writer_dir = os.path.join(self.directory, f"writer-{number}")
+            os.makedirs(writer_dir, exist_ok=True)
+            if fcntl is None:
+                return number, None
+            fd = os.open(os.path.join(writer_dir, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return number, fd
+            except OSError:
+                os.close(fd)
+                number += 1
+
+    def _open_active_segment(self) -> None:
+        own = [segment for segment in self._segments if segment.writer == self.writer]
+        if own:
+            self._active = own[-1]
+            # Drop a torn record left by a crash mid-write
+            if os.path.getsize(self._active.path) > self._active.indexed:
+                os.truncate(self._active.path, self._active.indexed)
+        else:
+            with self._lock:
+                self._active = self._add_segment(self.writer, 0,
+                                                 os.path.join(self._writer_dir, f"{0:08d}{SEGMENT_SUFFIX}"))
+        self._fd = os.open(self._active.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._active_size = self._active.indexed
+
+    # Indexing
+
+    def _add_segment(self, writer: int, number: int, path: str) -> _Segment:
+        segment = _Segment(len(self._segments), writer, number, path)
+        self._segments.append(segment)
+        self._by_path[path] = segment
+        return segment
+
+    def _refresh(self, include_own: bool = False) -> None:
+        """Index segments and records written by other processes (and, at startup, our own)"""
+        try:
+            writer_dirs = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in sorted(writer_dirs):
+            if not name.startswith("writer-"):
+                continue
+            try:
+                writer = int(name[len("writer-"):])
+            except ValueError:
+                continue
+            if writer == self.writer and not include_own:
+                continue
+            writer_dir = os.path.join(self.directory, name)
+            for filename in sorted(os.listdir(writer_dir)):
+                if not filename.endswith(SEGMENT_SUFFIX):
+                    continue
+                path = os.path.join(writer_dir, filename)
+                segment = self._by_path.get(path)
+                if segment is None:
+                    segment = self._add_segment(writer, int(filename[:-len(SEGMENT_SUFFIX)]), path)
+                if os.path.getsize(path) > segment.indexed:
+                    self._scan(segment, verify=True)
+
+    def _scan(self, segment: _Segment, verify: bool) -> int:
+        """Index records appended to a segment since the last scan; stops at a torn or partial record"""
+        size = os.path.getsize(segment.path)
+        if size <= segment.indexed:
+            return 0
+        data = segment.view(size)
+        offset = segment.indexed
+        indexed = 0
+        by_deal = self._by_deal
+        base = segment.segment_id << OFFSET_BITS
+        while offset + RECORD_HEADER.size <= size:
+            length, checksum, timestamp, key_length = RECORD_HEADER.unpack_from(data, offset)
+            key_start = offset + RECORD_HEADER.size
+            end = key_start + key_length + length
+            if end > size:
+                break
+            deal_key = data[key_start:key_start + key_length]
+            if verify and zlib.crc32(data[key_start + key_length:end], zlib.crc32(deal_key)) != checksum:
+                break
+            deal_id = deal_key.decode("utf-8")
+            refs = by_deal.get(deal_id)
+            if refs is None:
+                refs = by_deal[deal_id] = array("Q")
+            refs.append(base | offset)
+            if segment.records % TIME_INDEX_INTERVAL == 0:
+                segment.times.append(timestamp)
+                segment.offsets.append(offset)
+            if segment.first_time is None:
+                segment.first_time = timestamp
+            segment.last_time = timestamp
+            segment.records += 1
+            indexed += 1
+            offset = end
+        segment.indexed = offset
+        return indexed
+
+    # Reading
+
+    def _read(self, segment: _Segment, offset: int) -> Tuple[int, Dict[str, Any], int]:
+        """Decode the record at ``offset``; returns its timestamp, event and the next offset"""
+        data = segment.view(segment.indexed)
+        length, _, timestamp, key_length = RECORD_HEADER.unpack_from(data, offset)
+        key_start = offset + RECORD_HEADER.size
+        end = key_start + key_length + length
+        event = {
+            "id": f"{segment.writer}.{segment.number}.{offset}",
+            "deal_id": data[key_start:key_start + key_length].decode("utf-8"),
+            "timestamp": (EPOCH + timedelta(microseconds=timestamp)).astimezone().replace(tzinfo=None).isoformat()
+        }
+        event.update(loads(data[key_start + key_length:end]))
+        return timestamp, event, end
+
+    def events(self, deal_id: str) -> List[Dict[str, Any]]:
+        """Every committed event for a deal, oldest first"""
+        with self._lock:
+            self._refresh()
+            refs = self._by_deal.get(deal_id)
+            if refs is None:
+                return []
+            mask = (1 << OFFSET_BITS) - 1
+            records = [self._read(self._segments[ref >> OFFSET_BITS], ref & mask)[:2] for ref in refs]
+        # Several writers may hold events for one deal; their segments interleave in time
+        records.sort(key=lambda record: record[0])
+        return [event for _, event in records]
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              event_type: Optional[str] = None, after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Committed events with ``start <= timestamp < end`` (epoch seconds), oldest first
+
+        ``after`` is the ID of the last event already seen; the query resumes
+        just past it. Segments are read lazily, a batch at a time, so a
+        long range can be streamed without loading it.
+        """
+        start = None if start is None else round(start * 1e6)
+        end = None if end is None else round(end * 1e6)
+        cursor = None
+        with self._lock:
+            self._refresh()
+            if after is not None:
+                cursor = self._cursor(after)
+                start = cursor[0] if start is None else max(start, cursor[0])
+            segments = [segment for segment in self._segments
+                        if segment.records
+                        and (start is None or segment.last_time >= start)
+                        and (end is None or segment.first_time < end)]
+
+        # Segments are each in time order; merge them by (timestamp, writer, segment, offset)
+        streams = [self._segment_events(segment, start, end) for segment in segments]
+        for key, event in heapq.merge(*streams, key=lambda item: item[0]):
+            if cursor is not None and key <= cursor:
+                continue
+            if event_type is not None and event["type"] != event_type:
+                continue
+            yield event
+
+    def _cursor(self, event_id: str) -> Tuple[int, int, int, int]:
+        try:
+            writer, number, offset = (int(part) for part in event_id.split("."))
+        except ValueError:
+            raise ValueError(f"Invalid audit event ID: {event_id}")
+        path = os.path.join(self.directory, f"writer-{writer}", f"{number:08d}{SEGMENT_SUFFIX}")
+        segment = self._by_path.get(path)
+        if segment is None or offset >= segment.indexed:
+            raise ValueError(f"Unknown audit event ID: {event_id}")
+        timestamp = RECORD_HEADER.unpack_from(segment.view(segment.indexed), offset)[2]
+        return timestamp, writer, number, offset
+
+    def _segment_events(self, segment: _Segment, start: Optional[int],
+                        end: Optional[int]) -> Iterator[Tuple[Tuple[int, int, int, int], Dict[str, Any]]]:
+        with self._lock:
+            limit = segment.indexed
+            offset = 0
+            if start is not None and segment.times:
+                # Last sampled record at or before start; scan forward from there
+                position = bisect_right(segment.times, start) - 1
+                if position > 0:
+                    offset = segment.offsets[position]
+        while offset < limit:
+            batch = []
+            with self._lock:
+                for _ in range(READ_BATCH):
+                    if offset >= limit:
+                        break
+                    timestamp, event, next_offset = self._read(segment, offset)
+                    batch.append(((timestamp, segment.writer, segment.number, offset), event))
+                    offset = next_offset
+            for key, event in batch:
+                if end is not None and key[0] >= end:
+                    return
+                if start is None or key[0] >= start:
+                    yield key, event
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "writer": self.writer,
+            "segments": len(self._segments),
+            "deals": len(self._by_deal),
+            "events_written": self.events_written,
+            "commits": self.commits,
+            "bytes_written": self.bytes_written,
+            "pending": pending,
+            "write_errors": self.write_errors
+        }
+
+    def close(self) -> None:
+        self.stop()
+        os.close(self._fd)
+        with self._lock:
+            for segment in self._segments:
+                if segment.map is not None:
+                    segment.map.close()
+                    segment.map = None
+        if self._writer_lock is not None:
+            os.close(self._writer_lock)
+
+def _fsync_directory(path: str) -> None:
+    """Make a newly created segment's directory entry durable"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def create_audit_log() -> AuditLog:
+    """Build the audit log configured by AUDIT_LOG_DIR / AUDIT_SEGMENT_BYTES / AUDIT_COMMIT_INTERVAL"""
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit")
+    return AuditLog(
+        os.getenv("AUDIT_LOG_DIR", default_dir),
+        segment_bytes=int(os.getenv("AUDIT_SEGMENT_BYTES", DEFAULT_SEGMENT_BYTES)),
+        commit_interval=float(os.getenv("AUDIT_COMMIT_INTERVAL", DEFAULT_COMMIT_INTERVAL))
+    )
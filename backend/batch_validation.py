@@ -0,0 +1,78 @@
+"""
+Column-oriented validation for scoring many deals in one pass.
+
+Normalized deal records are loaded into per-field columns and every compiled
+rule is evaluated rule-major over whole columns, producing an outcome code per
+deal. Scores are summed column-wise; validation dicts are only materialized for the deals a
+caller asks about.
+"""
+
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from normalization import NormalizedDeal
+from rules import CompiledRuleSet, finalize_score
+
+class DealColumns:
+    """Normalized records for many deals, stored one list per field"""
+
+    def __init__(self, deal_ids: List[str], records: List[NormalizedDeal]):
+        self.deal_ids = deal_ids
+        self.size = len(deal_ids)
+        self._records = records
+        self._columns: Dict[str, List[Any]] = {}
+
+    def column(self, field: str) -> List[Any]:
+        if field not in self._columns:
+            self._columns[field] = [getattr(r, field) for r in self._records]
+        return self._columns[field]
+
+class BatchOutcome:
+    """Per-rule outcome codes and final scores for a set of deal columns"""
+
+    def __init__(self, columns: DealColumns, rule_set: CompiledRuleSet, seeds: Optional[List[Optional[str]]] = None):
+        self.columns = columns
+        self.rule_set = rule_set
+        self.codes: List[List[Optional[str]]] = []
+        raw = [0] * columns.size
+
+        for step in rule_set.steps:
+            started = time.perf_counter()
+            values = list(zip(*(columns.column(field) for field in step.depends_on)))
+            classify, params = step.classify, step.params
+            codes = [classify(v, params) for v in values]
+            stats = step.stats
+            stats.evaluations += len(codes)
+            stats.seconds += time.perf_counter() - started
+            for code, count in Counter(codes).items():
+                stats.outcomes[code] = stats.outcomes.get(code, 0) + count
+            impacts = step.impacts
+            raw = [s + impacts.get(c, 0) for s, c in zip(raw, codes)]
+            self.codes.append(codes)
+
+        self.raw_scores = raw
+        self.risk_scores: List[int] = []
+        self.risk_levels: List[str] = []
+        for s, seed in zip(raw, seeds or [None] * columns.size):
+            score, level = finalize_score(s, seed)
+            self.risk_scores.append(score)
+            self.risk_levels.append(level)
+
+    def validations(self, i: int) -> List[Dict[str, Any]]:
+        """Materialize the validation dicts for deal ``i`` in rule order"""
+        validations = []
+        for step, codes in zip(self.rule_set.steps, self.codes):
+            code = codes[i]
+            if code is not None:
+                values = tuple(self.columns.column(field)[i] for field in step.depends_on)
+                validations.append(step.materialize(code, values))
+        return validations
+
+    def ai_explanations(self, i: int) -> Dict[str, Dict[str, str]]:
+        explanations = {}
+        for step, codes in zip(self.rule_set.steps, self.codes):
+            code = codes[i]
+            if code is not None and step.outcomes[code].ai_explanation:
+                explanations[step.depends_on[0]] = dict(step.outcomes[code].ai_explanation)
+        return explanations
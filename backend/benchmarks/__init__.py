@@ -0,0 +1,14 @@
+"""
+Benchmarks for the validation engine and API.
+
+Run from the backend directory:
+
+    python -m benchmarks micro
+    python -m benchmarks endpoints --sizes 1000,100000,1000000
+    python -m benchmarks load --duration 30 --concurrency 32
+    python -m benchmarks compare baseline.json current.json --threshold 0.1
+
+Every suite writes a JSON result file (``--output``), and ``--baseline``
+compares the fresh results against a saved file, exiting non-zero when a
+metric regresses by more than ``--threshold``.
+"""
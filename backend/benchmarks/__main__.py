@@ -0,0 +1,89 @@
+"""
+Command line entry point: ``python -m benchmarks <suite> [options]``
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+from benchmarks import endpoints, load, micro
+from benchmarks.results import build_result, compare, load_result, report_comparison, write_result
+
+DEFAULT_DATA_DIR = os.getenv("BENCHMARK_DATA_DIR", os.path.join(tempfile.gettempdir(), "deal-checker-bench"))
+
+def _sizes(text: str):
+    return [int(size.replace("_", "")) for size in text.split(",") if size.strip()]
+
+def _add_output_options(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--output", "-o", help="Write the JSON results to this file")
+    parser.add_argument("--baseline", help="Compare against a saved result file and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Allowed relative regression per metric (default 0.10)")
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    suites = parser.add_subparsers(dest="suite", required=True)
+
+    micro_parser = suites.add_parser("micro", help="Validation engine microbenchmarks")
+    micro_parser.add_argument("--batches", type=int, default=50)
+    micro_parser.add_argument("--batch-size", type=int, default=200)
+    _add_output_options(micro_parser)
+
+    endpoints_parser = suites.add_parser("endpoints", help="In-process endpoint latency at several store sizes")
+    endpoints_parser.add_argument("--sizes", type=_sizes, default=[1000, 100000, 1000000])
+    endpoints_parser.add_argument("--requests", type=int, default=200)
+    endpoints_parser.add_argument("--upload-requests", type=int, default=50)
+    endpoints_parser.add_argument("--endpoints", default=",".join(endpoints.DEFAULT_ENDPOINTS))
+    endpoints_parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    _add_output_options(endpoints_parser)
+
+    load_parser = suites.add_parser("load", help="Mixed workload throughput and tail latency")
+    load_parser.add_argument("--duration", type=float, default=30)
+    load_parser.add_argument("--concurrency", type=int, default=32)
+    load_parser.add_argument("--mix", help="Operation weights, e.g. validate=30,summary=20,deals=10")
+    load_parser.add_argument("--size", type=int, default=100000, help="Seeded deals when running in-process")
+    load_parser.add_argument("--url", help="Target a running server instead of the in-process app")
+    load_parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    _add_output_options(load_parser)
+
+    compare_parser = suites.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    return parser
+
+def main(argv=None) -> int:
+    args = _parser().parse_args(argv)
+
+    if args.suite == "compare":
+        rows = compare(load_result(args.baseline), load_result(args.current), args.threshold)
+        return 0 if report_comparison(rows, args.threshold) else 1
+
+    if args.suite == "micro":
+        config = {"batches": args.batches, "batch_size": args.batch_size}
+        metrics = micro.run(args.batches, args.batch_size)
+    elif args.suite == "endpoints":
+        names = [name.strip() for name in args.endpoints.split(",") if name.strip()]
+        config = {"sizes": args.sizes, "requests": args.requests,
+                  "upload_requests": args.upload_requests, "endpoints": names}
+        metrics = asyncio.run(endpoints.run(args.sizes, args.data_dir, args.requests,
+                                            args.upload_requests, names))
+    else:
+        mix = load.parse_mix(args.mix)
+        config = {"duration": args.duration, "concurrency": args.concurrency, "mix": mix,
+                  "size": None if args.url else args.size, "url": args.url}
+        metrics = asyncio.run(load.run(mix, args.concurrency, args.duration, args.size,
+                                       args.data_dir, args.url))
+
+    result = build_result(args.suite, metrics, config)
+    write_result(result, args.output)
+    if args.baseline:
+        print()
+        rows = compare(load_result(args.baseline), result, args.threshold)
+        return 0 if report_comparison(rows, args.threshold) else 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
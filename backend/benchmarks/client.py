@@ -0,0 +1,139 @@
+"""
+HTTP clients and request mix shared by the endpoint and load benchmarks.
+
+``in_process`` drives the FastAPI app through httpx's ASGI transport with a
+given deal store swapped in, so no server or network is involved;
+``remote`` targets a running server instead. Each operation issues the
+requests one API call needs and raises on an unexpected status.
+"""
+
+import os
+import random
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - httpx is only needed for benchmarks
+    httpx = None
+
+from benchmarks.dataset import deal_id_for
+
+Operation = Callable[["httpx.AsyncClient", Callable[[], str], random.Random], Awaitable[Any]]
+
+def _require_httpx():
+    if httpx is None:
+        raise RuntimeError("Endpoint and load benchmarks need httpx (pip install httpx)")
+
+def _reset_app_state(main: Any, store: Any) -> None:
+    """Point the app at ``store`` with empty caches, so sizes do not share warm entries"""
+    from assessment_cache import AssessmentCache
+    from serialization import EncodedCache
+    from storage import TimedDealStore
+    from summary_cache import SummaryCache
+
+    main.deal_store = TimedDealStore(store)
+    main.assessment_cache = AssessmentCache(max_entries=main.assessment_cache.max_entries)
+    main.summary_cache = SummaryCache(max_entries=main.summary_cache.max_entries)
+    main.deal_detail_cache = EncodedCache(max_entries=main.deal_detail_cache.max_entries)
+
+@asynccontextmanager
+async def in_process(store: Any) -> AsyncIterator["httpx.AsyncClient"]:
+    """Client for the app running in this process against ``store``"""
+    _require_httpx()
+    # Keep benchmark audit events out of the server's own log
+    os.environ.setdefault("AUDIT_LOG_DIR", os.path.join(tempfile.gettempdir(), "deal-checker-bench-audit"))
+    # Benchmark uploads are random bytes; canned fields keep validation doing representative work
+    os.environ.setdefault("EXTRACTOR", "mock")
+    os.environ.setdefault("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "deal-checker-bench-uploads"))
+    import main
+
+    _reset_app_state(main, store)
+    await main.start_workers()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+    finally:
+        await main.stop_workers()
+
+@asynccontextmanager
+async def remote(url: str) -> AsyncIterator["httpx.AsyncClient"]:
+    """Client for a server that is already running at ``url``"""
+    _require_httpx()
+    limits = httpx.Limits(max_connections=1000, max_keepalive_connections=1000)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limits) as client:
+        yield client
+
+def seeded_ids(size: int) -> Callable[[random.Random], str]:
+    return lambda rng: deal_id_for(rng.randrange(size))
+
+async def listed_ids(client: "httpx.AsyncClient", limit: int = 1000) -> Callable[[random.Random], str]:
+    """Deal IDs read from /deals, for servers whose contents are not known in advance"""
+    ids: List[str] = []
+    after = None
+    while len(ids) < limit:
+        params: Dict[str, Any] = {"limit": min(1000, limit - len(ids))}
+        if after:
+            params["after"] = after
+        page = (await client.get("/deals", params=params)).json()
+        ids.extend(deal["deal_id"] for deal in page["deals"])
+        after = page.get("next_cursor")
+        if not after:
+            break
+    if not ids:
+        raise RuntimeError("The server has no deals to benchmark against")
+    return lambda rng: rng.choice(ids)
+
+def _check(response: "httpx.Response", *expected: int) -> "httpx.Response":
+    if response.status_code not in (expected or (200,)):
+        raise RuntimeError(f"{response.request.method} {response.request.url.path}: HTTP {response.status_code}")
+    return response
+
+async def op_upload(client, pick_id, rng) -> str:
+    """Upload a unique document and wait for its job to finish; returns the new deal ID"""
+    body = os.urandom(2048)
+    response = _check(await client.post(
+        "/upload", files={"file": ("bench.pdf", body, "application/pdf")}
+    ), 202)
+    job = response.json()
+    # The event stream ends when the job reaches a terminal state
+    _check(await client.get(job["events_url"]))
+    status = _check(await client.get(job["status_url"])).json()
+    if status["status"] != "completed":
+        raise RuntimeError(f"Upload job {status['status']}: {status.get('error')}")
+    return status["result"]["deal_id"]
+
+async def op_validate(client, pick_id, rng):
+    _check(await client.post("/validate", params={"deal_id": pick_id(rng)}))
+
+async def op_simulate(client, pick_id, rng):
+    _check(await client.post("/simulate", json={
+        "deal_id": pick_id(rng),
+        "modified_fields": {
+            "currency": rng.choice(["USD", "EUR", "GBP", "JPY", "XYZ"]),
+            "notional_amount": str(rng.choice([1, 5, 10, 50, 100, 500]) * 1000000)
+        }
+    }))
+
+async def op_summary(client, pick_id, rng):
+    _check(await client.get(f"/summary/{pick_id(rng)}"))
+
+async def op_deals(client, pick_id, rng):
+    params = {"limit": 50}
+    if rng.random() < 0.5:
+        params["risk_level"] = rng.choice(["high", "medium", "low"])
+    _check(await client.get("/deals", params=params))
+
+async def op_deal(client, pick_id, rng):
+    _check(await client.get(f"/deal/{pick_id(rng)}"))
+
+OPERATIONS: Dict[str, Operation] = {
+    "upload": op_upload,
+    "validate": op_validate,
+    "simulate": op_simulate,
+    "summary": op_summary,
+    "deals": op_deals,
+    "deal": op_deal
+}
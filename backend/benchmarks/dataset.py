@@ -0,0 +1,90 @@
+"""
+Synthetic deal stores for endpoint and load benchmarks.
+
+Deals are built from the mock extraction templates, scored in columnar
+batches and written straight to a SQLite store with put_many, so a million
+deals take minutes rather than a million uploads. Stores are cached on disk
+by size and reused when they already hold the expected number of deals.
+"""
+
+import hashlib
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+from batch_validation import BatchOutcome, DealColumns
+from engine import AIValidationEngine
+from normalization import normalize_fields
+from rules import get_rule_set, noise_seed
+from storage import SQLiteDealStore
+
+SEED_BATCH_SIZE = 10000
+TEMPLATE_COUNT = 256
+
+def deal_id_for(i: int) -> str:
+    return f"bench-{i:07d}"
+
+def content_hash_for(i: int) -> str:
+    return hashlib.sha256(f"bench-document-{i}".encode("utf-8")).hexdigest()
+
+def _templates() -> List[Dict[str, Any]]:
+    engine = AIValidationEngine()
+    templates = []
+    for i in range(TEMPLATE_COUNT):
+        fields = engine.extract_fields_from_document(f"template-{i}.pdf", content_hash_for(i)).dict()
+        record = normalize_fields(fields)
+        templates.append({"fields": fields, "record": record, "normalized": record.model_dump(mode="json")})
+    return templates
+
+def _deal_batch(start: int, stop: int, templates: List[Dict[str, Any]], rng: random.Random) -> List[Dict[str, Any]]:
+    rule_set = get_rule_set()
+    chosen = [templates[rng.randrange(len(templates))] for _ in range(start, stop)]
+    deal_ids = [deal_id_for(i) for i in range(start, stop)]
+    hashes = [content_hash_for(i) for i in range(start, stop)]
+    outcome = BatchOutcome(DealColumns(deal_ids, [t["record"] for t in chosen]), rule_set,
+                           [noise_seed(h) for h in hashes])
+
+    base = datetime(2024, 1, 1)
+    deals = []
+    for j, template in enumerate(chosen):
+        uploaded_at = base + timedelta(seconds=start + j)
+        deals.append({
+            "deal_id": deal_ids[j],
+            "filename": f"{deal_ids[j]}.pdf",
+            "uploaded_at": uploaded_at.isoformat(),
+            "content_hash": hashes[j],
+            "extracted_fields": template["fields"],
+            "normalized": template["normalized"],
+            "risk_assessment": {
+                "risk_score": outcome.risk_scores[j],
+                "risk_level": outcome.risk_levels[j],
+                "validations": outcome.validations(j),
+                "ai_explanations": outcome.ai_explanations(j),
+                "benchmark_comparison": []
+            },
+            "rule_set_id": rule_set.rule_set_id,
+            "status": "validated",
+            "validated_at": (uploaded_at + timedelta(seconds=1)).isoformat()
+        })
+    return deals
+
+def seeded_store(size: int, data_dir: str, rng_seed: int = 7) -> SQLiteDealStore:
+    """A SQLite store holding exactly ``size`` synthetic deals, built or reused from ``data_dir``"""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"deals-{size}.db")
+    if os.path.exists(path):
+        store = SQLiteDealStore(path)
+        if store.count() == size:
+            return store
+        store.close()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    store = SQLiteDealStore(path)
+    templates = _templates()
+    rng = random.Random(rng_seed)
+    for start in range(0, size, SEED_BATCH_SIZE):
+        store.put_many(_deal_batch(start, min(size, start + SEED_BATCH_SIZE), templates, rng))
+    return store
@@ -0,0 +1,57 @@
+"""
+In-process endpoint benchmarks at several store sizes.
+
+For each size a seeded SQLite store is swapped into the app, and each
+endpoint is called sequentially so the latencies measure one request with
+no queueing in front of it.
+"""
+
+import random
+import time
+from typing import Dict, List
+
+from benchmarks.client import OPERATIONS, in_process, seeded_ids
+from benchmarks.dataset import seeded_store
+from benchmarks.results import percentiles
+
+DEFAULT_ENDPOINTS = ("upload", "validate", "simulate", "summary", "deals", "deal")
+WARMUP_REQUESTS = 5
+
+async def run(sizes: List[int], data_dir: str, requests: int = 200, upload_requests: int = 50,
+              endpoints=DEFAULT_ENDPOINTS) -> Dict[str, float]:
+    metrics: Dict[str, float] = {}
+    for size in sizes:
+        store = seeded_store(size, data_dir)
+        pick_id = seeded_ids(size)
+        rng = random.Random(size)
+        uploaded: List[str] = []
+        try:
+            async with in_process(store) as client:
+                for name in endpoints:
+                    op = OPERATIONS[name]
+                    count = upload_requests if name == "upload" else requests
+                    for _ in range(WARMUP_REQUESTS):
+                        result = await op(client, pick_id, rng)
+                        if name == "upload":
+                            uploaded.append(result)
+
+                    samples = []
+                    started = time.perf_counter()
+                    for _ in range(count):
+                        start = time.perf_counter()
+                        result = await op(client, pick_id, rng)
+                        samples.append((time.perf_counter() - start) * 1000)
+                        if name == "upload":
+                            uploaded.append(result)
+                    elapsed = time.perf_counter() - started
+
+                    prefix = f"endpoints.{size}.{name}"
+                    for stat, value in percentiles(samples).items():
+                        metrics[f"{prefix}.{stat}_ms"] = value
+                    metrics[f"{prefix}.throughput_rps"] = count / elapsed
+        finally:
+            # Keep the cached store at its seeded size for the next run
+            for deal_id in uploaded:
+                store.delete(deal_id)
+            store.close()
+    return metrics
@@ -0,0 +1,91 @@
+"""
+Mixed-workload load generator.
+
+A fixed number of concurrent clients each pick an operation by weight and
+issue it back to back until the duration runs out. Reports overall and
+per-operation throughput, p50/p95/p99 latency and error counts. Runs
+in-process against a seeded store by default, or against a live server with
+``--url``.
+"""
+
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.client import OPERATIONS, in_process, listed_ids, remote, seeded_ids
+from benchmarks.dataset import seeded_store
+from benchmarks.results import percentiles
+
+DEFAULT_MIX = {"validate": 30, "simulate": 20, "summary": 20, "deals": 15, "deal": 10, "upload": 5}
+
+def parse_mix(text: Optional[str]) -> Dict[str, int]:
+    """``validate=30,summary=20,...`` into operation weights"""
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation in mix: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+async def _drive(client, pick_id, mix: Dict[str, int], concurrency: int, duration: float,
+                 rng_seed: int) -> Dict[str, float]:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples: Dict[str, List[float]] = {name: [] for name in names}
+    errors: Dict[str, int] = {name: 0 for name in names}
+    uploaded: List[str] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(index: int):
+        rng = random.Random(rng_seed + index)
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                result = await OPERATIONS[name](client, pick_id, rng)
+            except Exception:
+                errors[name] += 1
+                continue
+            samples[name].append((time.perf_counter() - start) * 1000)
+            if name == "upload":
+                uploaded.append(result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    # Leave the target with the deals it started with
+    for deal_id in uploaded:
+        await client.delete(f"/deal/{deal_id}")
+
+    metrics: Dict[str, float] = {}
+    everything: List[float] = []
+    for name in names:
+        everything.extend(samples[name])
+        for stat, value in percentiles(samples[name]).items():
+            metrics[f"load.{name}.{stat}_ms"] = value
+        metrics[f"load.{name}.throughput_rps"] = len(samples[name]) / elapsed
+        metrics[f"load.{name}.errors"] = errors[name]
+    for stat, value in percentiles(everything).items():
+        metrics[f"load.all.{stat}_ms"] = value
+    metrics["load.all.throughput_rps"] = len(everything) / elapsed
+    metrics["load.all.errors"] = sum(errors.values())
+    return metrics
+
+async def run(mix: Dict[str, int], concurrency: int, duration: float, size: int, data_dir: str,
+              url: Optional[str] = None, rng_seed: int = 11) -> Dict[str, float]:
+    if url:
+        async with remote(url) as client:
+            return await _drive(client, await listed_ids(client), mix, concurrency, duration, rng_seed)
+
+    store = seeded_store(size, data_dir)
+    try:
+        async with in_process(store) as client:
+            return await _drive(client, seeded_ids(size), mix, concurrency, duration, rng_seed)
+    finally:
+        store.close()
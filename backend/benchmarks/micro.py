@@ -0,0 +1,65 @@
+"""
+Microbenchmarks for the validation engine.
+
+Each function is timed over batches of calls against every mock extraction
+template, reporting the per-call mean and the p50/p95/p99 of the batch
+averages in microseconds.
+"""
+
+import shutil
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+from audit import AuditLog
+from engine import AIValidationEngine
+from normalization import normalize_fields
+from rules import get_rule_set
+
+from benchmarks.results import percentiles
+
+def _sample_fields(engine: AIValidationEngine, count: int = 64) -> List[Dict[str, Any]]:
+    return [engine.extract_fields_from_document(f"deal-{i}.pdf", f"{i:064x}").dict() for i in range(count)]
+
+def time_calls(fn: Callable[[int], Any], batches: int, batch_size: int) -> Dict[str, float]:
+    """Per-call timings in microseconds from ``batches`` batches of ``batch_size`` calls"""
+    for i in range(batch_size):
+        fn(i)
+    samples = []
+    for _ in range(batches):
+        start = time.perf_counter()
+        for i in range(batch_size):
+            fn(i)
+        samples.append((time.perf_counter() - start) / batch_size * 1e6)
+    return percentiles(samples)
+
+def run(batches: int = 50, batch_size: int = 200) -> Dict[str, float]:
+    engine = AIValidationEngine()
+    rule_set = get_rule_set()
+    fields = _sample_fields(engine)
+    records = [normalize_fields(f) for f in fields]
+    n = len(records)
+    # What a request handler pays per audit event; the writer thread commits in the background
+    audit_dir = tempfile.mkdtemp(prefix="deal-checker-audit-")
+    audit_log = AuditLog(audit_dir)
+    audit_log.start()
+
+    cases = {
+        "validate_fields": lambda i: engine.validate_fields(records[i % n], rule_set),
+        "rule_evaluation": lambda i: rule_set.evaluate(records[i % n]),
+        "benchmark_comparison": lambda i: engine._generate_benchmark_comparison(records[i % n]),
+        "audit_record": lambda i: audit_log.record(f"deal-{i % n}", "validation", "Risk Score Calculated",
+                                                   "Risk score 42 (Medium Risk)", user="Risk Engine",
+                                                   details={"risk_score": 42}),
+        "normalize_fields": lambda i: normalize_fields(fields[i % n])
+    }
+
+    metrics = {}
+    try:
+        for name, fn in cases.items():
+            for stat, value in time_calls(fn, batches, batch_size).items():
+                metrics[f"micro.{name}.{stat}_us"] = value
+    finally:
+        audit_log.close()
+        shutil.rmtree(audit_dir, ignore_errors=True)
+    return metrics
@@ -0,0 +1,80 @@
+"""
+Benchmark result files and baseline comparison.
+
+A result file is a JSON object with run metadata and a flat ``metrics``
+mapping of dotted metric names to numbers. Metric names ending in ``_rps``
+are throughputs (higher is better); everything else is a latency or cost
+(lower is better).
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Mean and p50/p95/p99 of latency samples"""
+    if not samples:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {"mean": statistics.fmean(ordered), "p50": at(0.50), "p95": at(0.95), "p99": at(0.99)}
+
+def build_result(suite: str, metrics: Dict[str, float], config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "suite": suite,
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "metrics": {name: round(value, 6) for name, value in sorted(metrics.items())}
+    }
+
+def write_result(result: Dict[str, Any], path: Optional[str]) -> None:
+    text = json.dumps(result, indent=2)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+def load_result(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def higher_is_better(metric: str) -> bool:
+    return metric.endswith("_rps")
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Per-metric change against the baseline; ``regressed`` marks changes worse than ``threshold``"""
+    rows = []
+    for metric, before in sorted(baseline["metrics"].items()):
+        after = current["metrics"].get(metric)
+        if after is None or not before:
+            continue
+        change = (after - before) / before
+        worse = -change if higher_is_better(metric) else change
+        rows.append({
+            "metric": metric,
+            "baseline": before,
+            "current": after,
+            "change": round(change, 4),
+            "regressed": worse > threshold
+        })
+    return rows
+
+def report_comparison(rows: List[Dict[str, Any]], threshold: float) -> bool:
+    """Print the comparison table; returns True when nothing regressed"""
+    regressions = [row for row in rows if row["regressed"]]
+    width = max((len(row["metric"]) for row in rows), default=10)
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(f"{row['metric']:<{width}}  {row['baseline']:>14.4f}  {row['current']:>14.4f}  {row['change']:>+8.1%}  {flag}")
+    print(f"\n{len(rows)} metrics compared, {len(regressions)} regressed beyond {threshold:.0%}")
+    return not regressions
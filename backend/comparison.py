@@ -0,0 +1,136 @@
+"""
+Side-by-side comparison of many deals.
+
+Deals are loaded into DealColumns and every result is computed a column at
+a time:
+
+- the field matrix: one list of extracted values per field, aligned with
+  ``deal_ids``;
+- differing fields: fields whose normalized values are not all equal, so
+  "100000000" and "100000000.00" count as the same notional. A value that
+  does not parse (such as "100,000,000") normalizes to None and counts as
+  missing;
+- outliers: deals whose notional, rate, settlement lag or tenor is far from
+  the group, by the modified z-score (median absolute deviation). Notionals
+  are compared as stated, without currency conversion;
+- risk deltas: every deal is scored in one BatchOutcome pass and compared
+  with the baseline deal and the group median, together with the rules
+  whose score impact differs from the baseline's.
+"""
+
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+from batch_validation import BatchOutcome, DealColumns
+from normalization import NormalizedDeal
+from rules import CompiledRuleSet
+
+# Extracted field -> normalized attribute its values are compared on
+COMPARED_FIELDS = {
+    "counterparty": "counterparty",
+    "notional_amount": "notional",
+    "currency": "currency_code",
+    "interest_rate": "rate",
+    "trade_date": "trade_date",
+    "maturity_date": "maturity_date",
+    "settlement_date": "settlement_date",
+    "collateral": "collateral",
+    "termination_clause": "termination_clause"
+}
+
+# Outlier metric -> normalized attribute
+OUTLIER_METRICS = {
+    "notional": "notional",
+    "rate": "rate",
+    "settlement_lag_days": "settlement_days",
+    "tenor_days": "tenor_days"
+}
+
+# Modified z-score above which a value is an outlier (Iglewicz and Hoaglin)
+OUTLIER_THRESHOLD = 3.5
+# Fewest known values a metric needs before outliers are reported
+MIN_OUTLIER_SAMPLE = 4
+
+def _differences(columns: DealColumns) -> Dict[str, Dict[str, Any]]:
+    differing = {}
+    for field, attribute in COMPARED_FIELDS.items():
+        values = columns.column(attribute)
+        distinct = set(values)
+        if len(distinct) > 1:
+            differing[field] = {
+                "distinct_values": len(distinct),
+                "missing": sum(1 for value in values if value is None)
+            }
+    return differing
+
+def _outliers(deal_ids: List[str], values: List[Optional[float]]) -> Dict[str, Any]:
+    known = [(deal_id, value) for deal_id, value in zip(deal_ids, values) if value is not None]
+    numbers = [value for _, value in known]
+    if not numbers:
+        return {"count": 0, "outliers": []}
+
+    center = median(numbers)
+    summary = {"count": len(numbers), "min": min(numbers), "max": max(numbers),
+               "median": center, "mean": sum(numbers) / len(numbers), "outliers": []}
+    if len(numbers) < MIN_OUTLIER_SAMPLE:
+        return summary
+
+    deviations = [abs(value - center) for value in numbers]
+    # 0.6745 makes the MAD consistent with a standard deviation; fall back to the mean
+    # absolute deviation when more than half the values are identical
+    mad = median(deviations)
+    scale = mad / 0.6745 if mad else 1.253314 * sum(deviations) / len(deviations)
+    if not scale:
+        return summary
+    summary["outliers"] = [
+        {"deal_id": deal_id, "value": value, "score": round((value - center) / scale, 2),
+         "direction": "high" if value > center else "low"}
+        for (deal_id, value), deviation in zip(known, deviations)
+        if deviation / scale > OUTLIER_THRESHOLD
+    ]
+    return summary
+
+def _risk(outcome: BatchOutcome, baseline: int) -> Dict[str, Any]:
+    scores = outcome.risk_scores
+    group_median = median(scores)
+    deal_ids = outcome.columns.deal_ids
+
+    # Per-rule impact columns, differenced against the baseline deal's impact
+    drivers: Dict[str, List[Dict[str, Any]]] = {}
+    for step, codes in zip(outcome.rule_set.steps, outcome.codes):
+        impacts = step.impacts
+        base_code = codes[baseline]
+        base_impact = impacts.get(base_code, 0)
+        for deal_id, code, impact in zip(deal_ids, codes, (impacts.get(code, 0) for code in codes)):
+            if impact != base_impact:
+                drivers.setdefault(deal_id, []).append({
+                    "rule": step.rule_id, "outcome": code, "baseline_outcome": base_code,
+                    "impact_delta": impact - base_impact
+                })
+
+    return {
+        "baseline_deal_id": deal_ids[baseline],
+        "median_score": group_median,
+        "scores": scores,
+        "levels": outcome.risk_levels,
+        "delta_vs_baseline": [score - scores[baseline] for score in scores],
+        "delta_vs_median": [score - group_median for score in scores],
+        "drivers": drivers
+    }
+
+def compare_deals(deal_ids: List[str], extracted: List[Dict[str, Any]], records: List[NormalizedDeal],
+                  rule_set: CompiledRuleSet, seeds: List[Optional[str]], baseline: int = 0) -> Dict[str, Any]:
+    """Field matrix, differences, outliers and risk deltas for deals aligned by index
+
+    ``baseline`` is the index of the deal the risk deltas are measured from.
+    """
+    columns = DealColumns(deal_ids, records)
+    matrix = {field: [fields.get(field) for fields in extracted] for field in COMPARED_FIELDS}
+    return {
+        "deal_ids": deal_ids,
+        "matrix": matrix,
+        "differing_fields": _differences(columns),
+        "outliers": {metric: _outliers(deal_ids, columns.column(attribute))
+                     for metric, attribute in OUTLIER_METRICS.items()},
+        "risk": _risk(BatchOutcome(columns, rule_set, seeds), baseline)
+    }
@@ -0,0 +1,308 @@
+"""
+Extracted document text, stored for offset lookups.
+
+Each document's text is written once, during extraction, as UTF-8 to
+``{text_id}.txt`` with sections separated by form feeds. Beside it,
+``{text_id}.idx`` holds the byte offset at which every section and every
+line starts. Readers memory-map both files and copy out only the range they
+need, so serving a window of a very large document costs the same as
+serving one of a small document. Offsets everywhere (extraction evidence,
+validation evidence, Range requests) are byte offsets into the UTF-8 text.
+
+Documents are keyed by text ID (extractor version and content hash), so
+re-uploads of the same document share one copy.
+"""
+
+import mmap
+import os
+import re
+import struct
+import uuid
+from array import array
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from extraction import SECTION_SEPARATOR
+from normalization import source_fields
+from rules import RULES_BY_ID
+
+INDEX_MAGIC = b"DCTX"
+INDEX_VERSION = 1
+# Magic, version, text size, section count, line count; then the section and line start offsets
+INDEX_HEADER = struct.Struct("<4sHxxQQQ")
+READ_CHUNK_SIZE = 64 * 1024
+# Largest window one ``around`` read returns
+MAX_WINDOW = 1024 * 1024
+# Longest source excerpt put in a validation's document_snippet
+SNIPPET_BYTES = 240
+
+# Extracted fields each rule's inputs come from, in input order
+EVIDENCE_FIELDS = {rule_id: source_fields(rule.depends_on) for rule_id, rule in RULES_BY_ID.items()}
+
+class TextWriter:
+    """Appends a document's sections to a temporary file; ``commit`` publishes it"""
+
+    def __init__(self, directory: str, text_id: str):
+        self.directory = directory
+        self.text_id = text_id
+        suffix = f".{uuid.uuid4().hex}.tmp"
+        self._text_path = os.path.join(directory, f"{text_id}.txt{suffix}")
+        self._index_path = os.path.join(directory, f"{text_id}.idx{suffix}")
+        self._file = open(self._text_path, "wb")
+        self._size = 0
+        self._sections = array("Q")
+        self._lines = array("Q")
+
+    def append(self, data: bytes) -> None:
+        """Add the next section's UTF-8 text"""
+        if self._sections:
+            self._file.write(SECTION_SEPARATOR)
+            self._size += len(SECTION_SEPARATOR)
+        self._sections.append(self._size)
+        self._lines.append(self._size)
+        newline = data.find(b"\n")
+        while newline >= 0:
+            self._lines.append(self._size + newline + 1)
+            newline = data.find(b"\n", newline + 1)
+        self._file.write(data)
+        self._size += len(data)
+
+    def commit(self) -> None:
+        self._file.close()
+        with open(self._index_path, "wb") as index:
+            index.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self._size,
+                                          len(self._sections), len(self._lines)))
+            self._sections.tofile(index)
+            self._lines.tofile(index)
+        # The index goes last: readers treat a text without one as absent
+        os.replace(self._text_path, os.path.join(self.directory, f"{self.text_id}.txt"))
+        os.replace(self._index_path, os.path.join(self.directory, f"{self.text_id}.idx"))
+
+    def abort(self) -> None:
+        self._file.close()
+        for path in (self._text_path, self._index_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def _map(path: str) -> Tuple[Any, Any]:
+    handle = open(path, "rb")
+    try:
+        return handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Empty files cannot be mapped
+        return handle, b""
+
+class DocumentText:
+    """A stored document, memory-mapped; use as a context manager"""
+
+    def __init__(self, text_path: str, index_path: str):
+        self._index_file, self._index = _map(index_path)
+        self._text_file, self._text = _map(text_path)
+        magic, version, self.size, sections, lines = INDEX_HEADER.unpack_from(self._index)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            self.close()
+            raise ValueError(f"Unsupported text index {index_path}")
+        start = INDEX_HEADER.size
+        view = memoryview(self._index)
+        self._sections = view[start:start + sections * 8].cast("Q")
+        self._lines = view[start + sections * 8:start + (sections + lines) * 8].cast("Q")
+
+    def __enter__(self) -> "DocumentText":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        # Views must be released before their map can close
+        for name in ("_sections", "_lines"):
+            view = getattr(self, name, None)
+            if view is not None:
+                view.release()
+        for handle in (self._index, self._text):
+            if isinstance(handle, mmap.mmap):
+                handle.close()
+        self._index_file.close()
+        self._text_file.close()
+
+    @property
+    def section_count(self) -> int:
+        return len(self._sections)
+
+    @property
+    def line_count(self) -> int:
+        return len(self._lines)
+
+    def read(self, start: int, end: int) -> bytes:
+        """Bytes ``[start, end)``, clamped to the text"""
+        return self._text[max(0, start):max(0, min(end, self.size))]
+
+    def iter_range(self, start: int, end: int) -> Iterator[bytes]:
+        """Bytes ``[start, end)`` in chunks of at most READ_CHUNK_SIZE"""
+        for offset in range(start, end, READ_CHUNK_SIZE):
+            yield self.read(offset, min(end, offset + READ_CHUNK_SIZE))
+
+    def section_of(self, offset: int) -> int:
+        """1-based section containing ``offset``"""
+        return max(1, bisect_right(self._sections, offset))
+
+    def line_of(self, offset: int) -> int:
+        """1-based line containing ``offset``"""
+        return max(1, bisect_right(self._lines, offset))
+
+    def line_bounds(self, line: int) -> Tuple[int, int]:
+        """Start and end offsets of a 1-based line, without its newline"""
+        start = self._lines[line - 1]
+        end = self._lines[line] - 1 if line < len(self._lines) else self.size
+        return start, max(start, end)
+
+    def window(self, around: int, size: int) -> Dict[str, Any]:
+        """About ``size`` bytes of text centred on ``around``, trimmed to whole characters"""
+        around = min(max(0, around), self.size)
+        start = max(0, min(around - size // 2, self.size - size))
+        data = self.read(start, start + size)
+        # Skip a character cut off at the start; one cut off at the end is dropped by decoding
+        lead = 0
+        while lead < len(data) and data[lead] & 0xC0 == 0x80:
+            lead += 1
+        text = data[lead:].decode("utf-8", errors="ignore")
+        start += lead
+        return {
+            "start": start,
+            "end": start + len(text.encode("utf-8")),
+            "size": self.size,
+            "section": self.section_of(around),
+            "line": self.line_of(around),
+            "text": text
+        }
+
+    def passages(self, size: int) -> Iterator[Tuple[int, int]]:
+        """``[start, end)`` runs of whole lines of about ``size`` bytes, never crossing a section
+
+        Lines longer than ``size`` are cut at a space (or a character boundary).
+        """
+        sections, lines = self._sections, self._lines
+        next_section = 1
+        start = end = 0
+        for line in range(len(lines)):
+            line_start = lines[line]
+            line_end = lines[line + 1] if line + 1 < len(lines) else self.size
+            at_section = next_section < len(sections) and line_start == sections[next_section]
+            if at_section:
+                next_section += 1
+            if end > start and (at_section or line_end - start > size):
+                yield start, end
+                start = line_start
+            while line_end - start > size:
+                cut = self._text.rfind(b" ", start + 1, start + size)
+                if cut < 0:
+                    cut = start + size
+                    while self._text[cut] & 0xC0 == 0x80:
+                        cut -= 1
+                yield start, cut
+                start = cut
+            end = line_end
+        if end > start:
+            yield start, end
+
+    def excerpt(self, start: int, end: int) -> str:
+        """The line holding ``[start, end)``, cut to about SNIPPET_BYTES around it"""
+        line_start, line_end = self.line_bounds(self.line_of(start))
+        if line_end - line_start > SNIPPET_BYTES:
+            margin = max(0, SNIPPET_BYTES - (end - start)) // 2
+            line_start = max(line_start, start - margin)
+            line_end = min(line_end, line_start + SNIPPET_BYTES)
+        return self.read(line_start, line_end).decode("utf-8", errors="ignore").strip()
+
+class DocumentTextStore:
+    """Directory of stored document texts"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, text_id: str) -> Tuple[str, str]:
+        if not text_id or os.sep in text_id or text_id.startswith("."):
+            raise ValueError(f"Invalid text ID '{text_id}'")
+        return (os.path.join(self.directory, f"{text_id}.txt"),
+                os.path.join(self.directory, f"{text_id}.idx"))
+
+    def writer(self, text_id: str) -> TextWriter:
+        self._paths(text_id)
+        return TextWriter(self.directory, text_id)
+
+    def exists(self, text_id: str) -> bool:
+        return os.path.exists(self._paths(text_id)[1])
+
+    def open(self, text_id: str) -> Optional[DocumentText]:
+        """The stored text, or None if there is none"""
+        text_path, index_path = self._paths(text_id)
+        try:
+            return DocumentText(text_path, index_path)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, text_id: str) -> None:
+        for path in self._paths(text_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+def attach_evidence(validations: List[Dict[str, Any]], extraction: Optional[Dict[str, Any]],
+                    text: Optional[DocumentText]) -> List[Dict[str, Any]]:
+    """Copies of ``validations`` carrying the source offsets of the fields each rule read
+
+    ``evidence`` lists a ``{field, start, end}`` span per input field that was
+    found in the document. With the document text at hand, the snippet quotes
+    the source line of the first span instead of the rule's template.
+    """
+    found = (extraction or {}).get("fields") or {}
+    if not found:
+        return validations
+    attached = []
+    for validation in validations:
+        evidence = [{"field": field, "start": found[field]["start"], "end": found[field]["end"]}
+                    for field in EVIDENCE_FIELDS.get(validation.get("rule_id"), ()) if field in found]
+        if not evidence:
+            attached.append(validation)
+            continue
+        validation = {**validation, "evidence": evidence}
+        if text is not None:
+            # Keep the rule's verdict after the quoted template: '"Currency: XYZ" - Non-standard code'
+            _, quoted, note = (validation.get("document_snippet") or "").rpartition('" - ')
+            note = note if quoted else ""
+            quote = text.excerpt(evidence[0]["start"], evidence[0]["end"])
+            validation["document_snippet"] = f'"{quote}" - {note}' if note else f'"{quote}"'
+        attached.append(validation)
+    return attached
+
+def byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """``[start, end)`` for a single ``Range: bytes=`` range of a ``size``-byte text
+
+    Returns None for a header to ignore (malformed, or several ranges) and
+    raises ValueError for a range that cannot be satisfied.
+    """
+    match = re.fullmatch(r"\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*", header)
+    if match is None or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(0, size - int(last)), size
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    end = min(size, int(last) + 1) if last else size
+    if start >= size:
+        raise ValueError("Range starts past the end of the text")
+    return start, end
+
+def create_text_store() -> DocumentTextStore:
+    """Build the store configured by DOCUMENT_TEXT_DIR"""
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "texts")
+    return DocumentTextStore(os.getenv("DOCUMENT_TEXT_DIR", default_dir))
@@ -0,0 +1,253 @@
+"""
+AI validation engine and the result models it produces.
+
+Kept free of app state (storage, queues, caches) so worker processes can
+import it and hold their own pre-warmed engine instance.
+"""
+
+from pydantic import BaseModel
+from typing import Dict, List, Optional, Any, Tuple
+from datetime import datetime
+
+from rules import CompiledRuleSet, finalize_score, get_rule_set, noise_source
+from normalization import NormalizedDeal
+
+# Pydantic Models
+class ExtractedFields(BaseModel):
+    counterparty: Optional[str] = None
+    notional_amount: Optional[str] = None
+    currency: Optional[str] = None
+    interest_rate: Optional[str] = None
+    trade_date: Optional[str] = None
+    maturity_date: Optional[str] = None
+    settlement_date: Optional[str] = None
+    collateral: Optional[str] = None
+    termination_clause: Optional[str] = None
+
+class ValidationResult(BaseModel):
+    field: str
+    status: str  # "valid", "warning", "error"
+    explanation: str
+    severity: str  # "low", "medium", "high"
+    confidence: Optional[float] = None
+    standard_value: Optional[str] = None
+    document_snippet: Optional[str] = None
+    rule_id: Optional[str] = None
+    # Where the fields the rule read were found: [{"field", "start", "end"}], byte offsets into the document text
+    evidence: Optional[List[Dict[str, Any]]] = None
+
+class RiskAssessment(BaseModel):
+    risk_score: int
+    risk_level: str
+    validations: List[ValidationResult]
+    ai_explanations: Dict[str, Dict[str, str]]
+    benchmark_comparison: List[Dict[str, Any]]
+
+# Mock AI Logic and Rules Engine
+class AIValidationEngine:
+    # Bump when extraction output changes so cached results are not reused
+    extractor_version = "mock-3"
+    
+    def __init__(self):
+        self.standard_benchmarks = {
+            "interest_rate": {"required": True, "standard": "Must be specified"},
+            "termination_clause": {"required": True, "standard": "30 days notice"},
+            "currency": {"required": True, "standard": "ISO 4217 format"},
+            "settlement_date": {"required": True, "standard": "T+2 settlement"},
+            "collateral": {"required": False, "standard": "Government bonds preferred"}
+        }
+        
+    def extract_fields_from_document(self, filename: str, content_hash: str) -> ExtractedFields:
+        """Simulate AI document extraction with realistic mock data (EXTRACTOR=mock; see extraction.py)"""
+        
+        # Mock extraction based on filename patterns or random selection
+        mock_extractions = [
+            {
+                "counterparty": "ABC Bank Ltd.",
+                "notional_amount": "100000000",
+                "currency": "USD",
+                "interest_rate": None,  # Intentionally missing
+                "trade_date": "2024-01-15",
+                "maturity_date": "2025-01-15",
+                "settlement_date": "2024-01-17",
+                "collateral": "Government Bonds",
+                "termination_clause": None
+            },
+            {
+                "counterparty": "Global Finance Corp",
+                "notional_amount": "50000000",
+                "currency": "EUR",
+                "interest_rate": "3.25",
+                "trade_date": "2024-01-14",
+                "maturity_date": "2025-01-14",
+                "settlement_date": "2024-01-16",
+                "collateral": "Corporate Bonds",
+                "termination_clause": "30 days"
+            },
+            {
+                "counterparty": "International Bank",
+                "notional_amount": "75000000",
+                "currency": "GBP",
+                "interest_rate": "4.75",
+                "trade_date": "2024-01-13",
+                "maturity_date": "2025-01-13",
+                "settlement_date": "2024-01-15",
+                "collateral": None,
+                "termination_clause": "14 days"
+            }
+        ]
+        
+        # Select extraction based on the document content hash so results are stable
+        digest = bytes.fromhex(content_hash)
+        extraction_index = digest[0] % len(mock_extractions)
+        selected_extraction = dict(mock_extractions[extraction_index])
+        
+        # Simulate AI uncertainty, derived from the content so it is reproducible
+        if digest[1] < 77:  # ~30% chance to make a field missing
+            fields_to_potentially_miss = ["interest_rate", "termination_clause", "collateral"]
+            field_to_miss = fields_to_potentially_miss[digest[2] % len(fields_to_potentially_miss)]
+            selected_extraction[field_to_miss] = None
+            
+        return ExtractedFields(**selected_extraction)
+    
+    def validate_fields(self, fields: NormalizedDeal, rule_set: Optional[CompiledRuleSet] = None,
+                        seed: Optional[str] = None) -> RiskAssessment:
+        """Run comprehensive validation with AI-powered risk assessment"""
+        
+        rule_set = rule_set or get_rule_set()
+        evaluation = rule_set.evaluate(fields)
+        
+        validations = [ValidationResult(**v) for v in evaluation.validations()]
+        
+        # Add AI uncertainty noise, clamp to 0-100 and determine risk level
+        risk_score, risk_level = finalize_score(evaluation.raw_score, seed)
+        
+        # Generate benchmark comparison
+        benchmark_comparison = self._generate_benchmark_comparison(fields)
+        
+        return RiskAssessment(
+            risk_score=risk_score,
+            risk_level=risk_level,
+            validations=validations,
+            ai_explanations=evaluation.ai_explanations(),
+            benchmark_comparison=benchmark_comparison
+        )
+    
+    def score_fields(self, fields: NormalizedDeal, rule_set: Optional[CompiledRuleSet] = None,
+                     seed: Optional[str] = None) -> Tuple[int, str, List[ValidationResult]]:
+        """Risk score, level and validations only, for what-if scenarios that need nothing else"""
+        
+        rule_set = rule_set or get_rule_set()
+        evaluation = rule_set.evaluate(fields)
+        risk_score, risk_level = finalize_score(evaluation.raw_score, seed)
+        return risk_score, risk_level, [ValidationResult(**v) for v in evaluation.validations()]
+    
+    def generate_summary(self, deal_id: str, risk_assessment: Dict[str, Any], seed: Optional[str] = None) -> Dict[str, Any]:
+        """Generate AI-powered plain English summary of a stored risk assessment"""
+
+        risk_score = risk_assessment.get("risk_score", 0)
+        validations = risk_assessment.get("validations", [])
+
+        # Bucket issues by severity and note insight triggers in one pass
+        critical_fields = []
+        warning_fields = []
+        rate_error = counterparty_warning = False
+        for v in validations:
+            severity, status, field = v.get("severity"), v.get("status"), v.get("field", "")
+            if severity == "high":
+                critical_fields.append(v["field"])
+            elif severity == "medium":
+                warning_fields.append(v["field"])
+            if status == "error" and "Interest Rate" in field:
+                rate_error = True
+            elif status == "warning" and "Counterparty" in field:
+                counterparty_warning = True
+
+        if risk_score >= 70:
+            risk_description = "high risk"
+            recommendation = "Recommend immediate human review and additional due diligence before proceeding."
+        elif risk_score >= 40:
+            risk_description = "moderate risk"
+            recommendation = "Consider additional verification of flagged items before approval."
+        else:
+            risk_description = "low risk"
+            recommendation = "Deal appears suitable for standard processing workflow."
+
+        # Build detailed summary
+        summary_parts = [
+            f"This financial agreement presents {risk_description} with an overall score of {risk_score}/100."
+        ]
+
+        if critical_fields:
+            summary_parts.append(f"Critical concerns identified: {', '.join(critical_fields)}.")
+
+        if warning_fields:
+            summary_parts.append(f"Additional attention required for: {', '.join(warning_fields)}.")
+
+        summary_parts.append(recommendation)
+
+        # Add specific insights
+        insights = []
+        if rate_error:
+            insights.append("Missing interest rate specification creates pricing uncertainty and regulatory compliance risk.")
+
+        if counterparty_warning:
+            insights.append("Counterparty verification incomplete - enhanced due diligence recommended.")
+
+        return {
+            "deal_id": deal_id,
+            "risk_score": risk_score,
+            "risk_level": risk_assessment.get("risk_level", "Unknown"),
+            "summary": " ".join(summary_parts),
+            "key_insights": insights,
+            "critical_issues_count": len(critical_fields),
+            "warning_issues_count": len(warning_fields),
+            "generated_at": datetime.now().isoformat(),
+            "confidence": round(noise_source(seed, "summary").uniform(0.88, 0.96), 2)
+        }
+
+    def _generate_benchmark_comparison(self, fields: NormalizedDeal) -> List[Dict[str, Any]]:
+        """Generate industry benchmark comparison data"""
+        
+        comparisons = []
+        
+        # Interest Rate Benchmark
+        comparisons.append({
+            "field": "Interest Rate Specification",
+            "standard": "Required (ISDA 2002)",
+            "extracted": "Missing" if not fields.interest_rate else f"{fields.interest_rate}% (Compliant)",
+            "status": "violation" if not fields.interest_rate else "compliant",
+            "description": "All derivative contracts must specify interest rate terms"
+        })
+        
+        # Termination Clause
+        comparisons.append({
+            "field": "Termination Clause",
+            "standard": "30 days notice",
+            "extracted": "Missing" if not fields.termination_clause else f"{fields.termination_clause} (Compliant)",
+            "status": "warning" if not fields.termination_clause else "compliant",
+            "description": "Standard market practice requires termination provisions"
+        })
+        
+        # Currency
+        comparisons.append({
+            "field": "Currency Denomination",
+            "standard": "ISO 4217 format",
+            "extracted": f"{fields.currency_code} (Compliant)" if fields.currency_code else "Missing",
+            "status": "compliant" if fields.currency_code else "violation",
+            "description": "Currency code follows international standards"
+        })
+        
+        # Settlement Period
+        if fields.settlement_days is not None:
+            settlement_days = fields.settlement_days
+            
+            comparisons.append({
+                "field": "Settlement Period",
+                "standard": "T+2 (Standard)",
+                "extracted": f"T+{settlement_days} ({'Compliant' if settlement_days == 2 else 'Non-standard'})",
+                "status": "compliant" if settlement_days == 2 else "warning",
+                "description": "Settlement timing aligns with market conventions"
+            })
+        
+        return comparisons
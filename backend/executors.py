@@ -0,0 +1,173 @@
+"""
+Executor for CPU-bound engine work.
+
+Validation (single and batched), simulation, comparison and summary
+generation are pure computation, so the API hands them to a pool instead of
+running them on the event loop. The pool is a thread pool by default;
+``CPU_EXECUTOR=process`` uses worker processes (sidestepping the GIL) and
+``inline`` runs calls directly for debugging.
+Every worker holds its own pre-warmed AIValidationEngine.
+
+Task functions are module-level and take picklable arguments. Compiled rule
+sets hold closures, so tasks receive a rule set's overrides and look the
+compiled set up in the worker, compiling it there on first use.
+
+Worker processes return the per-rule metrics they recorded with each result,
+and the executor merges them into the API process's counters.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from batch_validation import BatchOutcome, DealColumns
+from comparison import compare_deals
+from engine import AIValidationEngine, RiskAssessment, ValidationResult
+from metrics import RULE_STATS
+from normalization import NormalizedDeal, normalize_fields
+from rules import register_rule_set
+
+EXECUTOR_KINDS = ("thread", "process", "inline")
+
+_engine: Optional[AIValidationEngine] = None
+_in_worker_process = False
+
+def _warm_engine() -> None:
+    """Pool initializer: build the engine and run one validation to warm caches"""
+    global _engine
+    _engine = AIValidationEngine()
+    _engine.validate_fields(normalize_fields({}), register_rule_set({}))
+
+def _init_worker_process() -> None:
+    global _in_worker_process
+    _in_worker_process = True
+    _warm_engine()
+
+def worker_engine() -> AIValidationEngine:
+    if _engine is None:
+        _warm_engine()
+    return _engine
+
+def validate_task(record: NormalizedDeal, overrides: Dict[str, Dict[str, Any]], seed: Optional[str] = None) -> RiskAssessment:
+    return worker_engine().validate_fields(record, register_rule_set(overrides), seed)
+
+def simulate_task(record: NormalizedDeal, overrides: Dict[str, Dict[str, Any]],
+                  seed: Optional[str] = None) -> Tuple[int, str, List[ValidationResult]]:
+    return worker_engine().score_fields(record, register_rule_set(overrides), seed)
+
+def summarize_task(deal_id: str, risk_assessment: Dict[str, Any], seed: Optional[str] = None) -> Dict[str, Any]:
+    return worker_engine().generate_summary(deal_id, risk_assessment, seed)
+
+def batch_validate_task(deal_ids: List[str], records: List[NormalizedDeal], overrides: Dict[str, Dict[str, Any]],
+                        seeds: List[Optional[str]], details: bool = False,
+                        benchmarks: bool = False) -> List[Dict[str, Any]]:
+    """Score a batch in one columnar pass: each deal's score and level, with its validations and AI
+    explanations if ``details`` and its benchmark comparison if ``benchmarks``"""
+    outcome = BatchOutcome(DealColumns(deal_ids, records), register_rule_set(overrides), seeds)
+    engine = worker_engine()
+    results = []
+    for i, record in enumerate(records):
+        result: Dict[str, Any] = {"risk_score": outcome.risk_scores[i], "risk_level": outcome.risk_levels[i]}
+        if details:
+            result["validations"] = outcome.validations(i)
+            result["ai_explanations"] = outcome.ai_explanations(i)
+        if benchmarks:
+            result["benchmark_comparison"] = engine._generate_benchmark_comparison(record)
+        results.append(result)
+    return results
+
+def compare_task(deal_ids: List[str], fields: List[Dict[str, Any]], records: List[NormalizedDeal],
+                 overrides: Dict[str, Dict[str, Any]], seeds: List[Optional[str]], baseline: int = 0) -> Dict[str, Any]:
+    return compare_deals(deal_ids, fields, records, register_rule_set(overrides), seeds, baseline=baseline)
+
+def _ping() -> int:
+    worker_engine()
+    return os.getpid()
+
+def _timed_call(fn: Callable[..., Any], args: Tuple[Any, ...]) -> Tuple[float, float, Any, Optional[Dict[str, Any]]]:
+    """Run ``fn`` in the worker, returning its start time, run time, result and (from worker processes) rule metrics"""
+    started = time.time()
+    result = fn(*args)
+    elapsed = time.time() - started
+    return started, elapsed, result, RULE_STATS.drain() if _in_worker_process else None
+
+class CPUExecutor:
+    """Thread, process or inline pool with queue depth and wait-time counters"""
+
+    def __init__(self, kind: str = "thread", workers: Optional[int] = None):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind '{kind}', expected one of {', '.join(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self._pool: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    async def start(self) -> None:
+        """Create the pool and pre-warm every worker"""
+        if self._pool is not None or self.kind == "inline":
+            worker_engine()
+            return
+        if self.kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker_process)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu",
+                                            initializer=_warm_engine)
+        # Process pools spawn workers on demand; force them all up before serving
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, _ping) for _ in range(self.workers)))
+
+    async def stop(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a task function on the pool and await its result"""
+        submitted = time.time()
+        self.pending += 1
+        try:
+            if self._pool is None:
+                started, elapsed, result, rule_metrics = _timed_call(fn, args)
+            else:
+                loop = asyncio.get_running_loop()
+                started, elapsed, result, rule_metrics = await loop.run_in_executor(self._pool, _timed_call, fn, args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+
+        if rule_metrics:
+            RULE_STATS.merge(rule_metrics)
+        wait = max(0.0, started - submitted)
+        self.completed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_run += elapsed
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "in_flight": min(self.pending, self.workers),
+            "queue_depth": max(0, self.pending - self.workers),
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 3) if self.completed else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 3),
+            "avg_run_ms": round(self.total_run / self.completed * 1000, 3) if self.completed else 0.0
+        }
+
+def create_cpu_executor() -> CPUExecutor:
+    """Build the executor selected by CPU_EXECUTOR / CPU_WORKERS"""
+    workers = os.getenv("CPU_WORKERS")
+    return CPUExecutor(kind=os.getenv("CPU_EXECUTOR", "thread").lower(),
+                       workers=int(workers) if workers else None)
@@ -0,0 +1,212 @@
+"""
+Bulk export of deals and their analysis results.
+
+GET /export streams one record kind per file:
+
+- ``deals``: one row per deal (listing fields, score and extracted fields)
+- ``validations``: one row per validation result
+- ``benchmarks``: one row per benchmark comparison
+- ``audit``: one row per audit log event, read from the AuditLog
+
+Output is CSV, NDJSON, Parquet or an Arrow IPC stream. Deals are read from
+DealStore.iter_encoded (audit events from AuditLog.query) a batch at a time
+and encoded into chunks of roughly CHUNK_SIZE bytes, so memory use stays
+flat however many deals match. An NDJSON deal export passes the stored JSON
+through without decoding it, and NDJSON audit events keep their nested
+``details``. Parquet and Arrow output need pyarrow.
+"""
+
+import csv
+import io
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from engine import ExtractedFields
+from serialization import dumps, loads
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows")
+}
+COLUMNAR_FORMATS = ("parquet", "arrow")
+
+CHUNK_SIZE = 64 * 1024
+ROWS_PER_BATCH = 8192
+
+EXTRACTED_FIELDS = list(ExtractedFields.model_fields)
+
+# (column, type) per record kind; every type not listed is a nullable string
+COLUMNS: Dict[str, List[Tuple[str, str]]] = {
+    "deals": [("deal_id", "string"), ("filename", "string"), ("uploaded_at", "string"),
+              ("validated_at", "string"), ("status", "string"), ("rule_set_id", "string"),
+              ("risk_score", "int64"), ("risk_level", "string")]
+             + [(field, "string") for field in EXTRACTED_FIELDS],
+    "validations": [("deal_id", "string"), ("field", "string"), ("status", "string"), ("severity", "string"),
+                    ("confidence", "float64"), ("explanation", "string"), ("standard_value", "string"),
+                    ("document_snippet", "string")],
+    "benchmarks": [("deal_id", "string"), ("field", "string"), ("standard", "string"), ("extracted", "string"),
+                   ("status", "string"), ("description", "string")],
+    "audit": [("deal_id", "string"), ("id", "string"), ("timestamp", "string"), ("type", "string"),
+              ("title", "string"), ("description", "string"), ("user", "string"), ("severity", "string"),
+              ("status", "string"), ("details", "string")]
+}
+EXPORT_KINDS = tuple(COLUMNS)
+
+def date_bounds(start: Optional[str], end: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """ISO 8601 bounds for a date or datetime range; raises ValueError for malformed values
+
+    Dates cover whole days, so ``end=2024-03-31`` includes that day. Datetimes
+    are used as given, with ``end`` exclusive.
+    """
+    def parse(value: str, is_end: bool) -> str:
+        try:
+            parsed = datetime.fromisoformat(value)
+        except ValueError:
+            raise ValueError(f"Invalid date: {value}")
+        if is_end and len(value) == 10:
+            parsed += timedelta(days=1)
+        return parsed.isoformat()
+
+    lower = parse(start, False) if start else None
+    upper = parse(end, True) if end else None
+    if lower and upper and lower >= upper:
+        raise ValueError("start must be before end")
+    return lower, upper
+
+def _rows(kind: str, deal: Dict[str, Any]) -> Iterator[Tuple[Any, ...]]:
+    deal_id = deal["deal_id"]
+    risk_assessment = deal.get("risk_assessment") or {}
+    if kind == "deals":
+        fields = deal.get("extracted_fields") or {}
+        yield (deal_id, deal.get("filename"), deal.get("uploaded_at"), deal.get("validated_at"),
+               deal.get("status"), deal.get("rule_set_id"), risk_assessment.get("risk_score"),
+               risk_assessment.get("risk_level"), *(fields.get(field) for field in EXTRACTED_FIELDS))
+        return
+
+    items = {
+        "validations": risk_assessment.get("validations"),
+        "benchmarks": risk_assessment.get("benchmark_comparison")
+    }[kind] or []
+    names = [name for name, _ in COLUMNS[kind][1:]]
+    for item in items:
+        yield (deal_id, *(item.get(name) for name in names))
+
+def _records(kind: str, source: Iterable[Any]) -> Iterator[Tuple[Any, ...]]:
+    if kind == "audit":
+        names = [name for name, _ in COLUMNS[kind][:-1]]
+        for event in source:
+            details = event.get("details")
+            yield (*(event.get(name) for name in names), dumps(details).decode("utf-8") if details else None)
+        return
+    for data in source:
+        yield from _rows(kind, loads(data))
+
+def _ndjson(kind: str, encoded: Iterable[bytes]) -> Iterator[bytes]:
+    chunk: List[bytes] = []
+    size = 0
+    if kind == "deals":
+        lines = encoded
+    elif kind == "audit":
+        lines = (dumps(event) for event in encoded)
+    else:
+        names = [name for name, _ in COLUMNS[kind]]
+        lines = (dumps(dict(zip(names, row))) for row in _records(kind, encoded))
+    for line in lines:
+        chunk.append(line)
+        size += len(line) + 1
+        if size >= CHUNK_SIZE:
+            yield b"\n".join(chunk) + b"\n"
+            chunk, size = [], 0
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+def _csv(kind: str, encoded: Iterable[bytes]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in COLUMNS[kind]])
+    for row in _records(kind, encoded):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the response as they accumulate
+
+    Tracks the absolute position because Parquet records file offsets in its footer.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _columnar(kind: str, export_format: str, encoded: Iterable[bytes]) -> Iterator[bytes]:
+    columns = COLUMNS[kind]
+    schema = pyarrow.schema([(name, getattr(pyarrow, column_type)()) for name, column_type in columns])
+    sink = _ChunkSink()
+    if export_format == "parquet":
+        writer = pyarrow.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    string_columns = {i for i, (_, column_type) in enumerate(columns) if column_type == "string"}
+
+    def batch(rows: List[Tuple[Any, ...]]):
+        arrays = []
+        for i, values in enumerate(zip(*rows)):
+            if i in string_columns:
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pyarrow.array(values, type=schema.field(i).type))
+        return pyarrow.RecordBatch.from_arrays(arrays, schema=schema)
+
+    rows: List[Tuple[Any, ...]] = []
+    for row in _records(kind, encoded):
+        rows.append(row)
+        if len(rows) >= ROWS_PER_BATCH:
+            writer.write_batch(batch(rows))
+            rows = []
+            yield sink.drain()
+    if rows:
+        writer.write_batch(batch(rows))
+    writer.close()
+    yield sink.drain()
+
+def format_available(export_format: str) -> bool:
+    return export_format not in COLUMNAR_FORMATS or pyarrow is not None
+
+def export_stream(kind: str, export_format: str, encoded: Iterable[Any]) -> Iterator[bytes]:
+    """Encoded export body chunks for a stream of stored deals (audit events for ``audit``)"""
+    if export_format == "ndjson":
+        return _ndjson(kind, encoded)
+    if export_format == "csv":
+        return _csv(kind, encoded)
+    if pyarrow is None:
+        raise RuntimeError(f"{export_format} export needs pyarrow installed")
+    return _columnar(kind, export_format, encoded)
@@ -0,0 +1,210 @@
+"""
+Asynchronous job queue for document processing.
+
+/upload hands extraction and validation to a bounded pool of asyncio workers
+and returns a job ID straight away. Jobs are ordered by priority (smaller
+documents first, then submission order), can be cancelled while queued or
+between stages, and are retried with backoff when a stage fails. Every state
+change is pushed to subscribers, which /jobs/{id}/events relays as
+Server-Sent Events. An optional ``on_change`` callback sees every state
+change too; with several server processes it mirrors jobs into the shared
+store so any process can answer /jobs/{id}.
+"""
+
+import asyncio
+import itertools
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    pass
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    """A unit of queued work and its progress"""
+
+    def __init__(self, handler: Callable[["Job"], Awaitable[Any]], payload: Dict[str, Any], priority: int):
+        self.job_id = str(uuid.uuid4())
+        self.handler = handler
+        self.payload = payload
+        self.priority = priority
+        self.status = "queued"
+        self.stage = "queued"
+        self.progress = 0
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.result: Optional[Any] = None
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+        self.cancel_requested = False
+        self.on_change: Optional[Callable[["Job"], None]] = None
+        self._subscribers: List[asyncio.Queue] = []
+
+    def report(self, stage: str, progress: int, status: Optional[str] = None) -> None:
+        """Record progress and notify subscribers"""
+        self.stage = stage
+        self.progress = progress
+        if status is not None:
+            self.status = status
+        self.updated_at = datetime.now().isoformat()
+        event = self.to_dict()
+        for subscriber in self._subscribers:
+            subscriber.put_nowait(event)
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def check_cancelled(self) -> None:
+        """Raise JobCancelled if cancellation was requested; handlers call this between stages"""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": self.progress,
+            "attempts": self.attempts,
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            **{k: v for k, v in self.payload.items() if k in ("deal_id", "filename", "size")}
+        }
+
+class JobQueue:
+    """Priority queue drained by a fixed number of worker tasks"""
+
+    def __init__(self, concurrency: int = 4, max_queued: int = 1000, max_retries: int = 2,
+                 retry_backoff: float = 0.5, retain_finished: int = 10000,
+                 on_change: Optional[Callable[[Job], None]] = None):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.retain_finished = retain_finished
+        self.on_change = on_change
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+        # Backoff timers of jobs waiting to retry, referenced so they are not collected mid-sleep
+        self._retries: Set[asyncio.Task] = set()
+        self._sequence = itertools.count()
+
+    async def start(self) -> None:
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        tasks = self._workers + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._retries.clear()
+
+    def submit(self, handler: Callable[[Job], Awaitable[Any]], payload: Dict[str, Any], priority: int = 0) -> Job:
+        """Queue a job; lower priority values run first"""
+        if self._queue is None:
+            raise RuntimeError("Job queue has not been started")
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull()
+        job = Job(handler, payload, priority)
+        job.on_change = self.on_change
+        self._jobs[job.job_id] = job
+        if self.on_change is not None:
+            self.on_change(job)
+        self._enqueue(job)
+        self._trim()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return job
+        job.cancel_requested = True
+        if job.status in ("queued", "retrying"):
+            # Workers skip cancelled jobs when they reach the head of the queue, and retries are not re-queued
+            job.report(job.stage, job.progress, status="cancelled")
+        return job
+
+    async def events(self, job_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Current job state followed by every change until the job finishes"""
+        job = self._jobs[job_id]
+        subscriber: asyncio.Queue = asyncio.Queue()
+        job._subscribers.append(subscriber)
+        try:
+            yield job.to_dict()
+            while not job.done:
+                event = await subscriber.get()
+                yield event
+        finally:
+            job._subscribers.remove(subscriber)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "concurrency": self.concurrency,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queued": self.max_queued,
+            "jobs": statuses
+        }
+
+    def _enqueue(self, job: Job) -> None:
+        self._queue.put_nowait((job.priority, next(self._sequence), job))
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - self.retain_finished)]:
+            del self._jobs[job_id]
+
+    async def _retry_later(self, job: Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        if job.cancel_requested:
+            if not job.done:
+                job.report(job.stage, job.progress, status="cancelled")
+            return
+        job.report("queued", job.progress, status="queued")
+        self._enqueue(job)
+
+    async def _worker(self) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.cancel_requested:
+                    continue
+                job.attempts += 1
+                job.report("starting", job.progress, status="running")
+                try:
+                    job.result = await job.handler(job)
+                    job.report("done", 100, status="completed")
+                except JobCancelled:
+                    job.report(job.stage, job.progress, status="cancelled")
+                except Exception as e:
+                    job.error = str(e)
+                    if job.attempts <= self.max_retries:
+                        job.report("retrying", job.progress, status="retrying")
+                        retry = asyncio.create_task(self._retry_later(job, self.retry_backoff * 2 ** (job.attempts - 1)))
+                        self._retries.add(retry)
+                        retry.add_done_callback(self._retries.discard)
+                    else:
+                        job.report(job.stage, job.progress, status="failed")
+            finally:
+                self._queue.task_done()
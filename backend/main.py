@@ -1,20 +1,62 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Header, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Literal, Tuple
 import json
+import math
 import uuid
-import random
-from datetime import datetime, timedelta
+import hashlib
+import os
+import asyncio
+from datetime import date, datetime
 import re
+import time
+from itertools import islice
+
+from engine import AIValidationEngine, ExtractedFields, ValidationResult
+from rules import (
+    CompiledRuleSet,
+    get_rule_set,
+    noise_seed,
+    noise_source,
+    register_rule_set,
+)
+from portfolio import by_key, maturity_ladder
+from normalization import NormalizedDeal, normalize_fields
+from storage import create_deal_store
+from extraction import EXTRACTOR_VERSION, DocumentError, extract_document
+from extraction_cache import ExtractionCache
+from document_text import MAX_WINDOW, attach_evidence, byte_range, create_text_store
+from search import MAX_RESULTS, create_search_index, highlights, parse_query
+from snapshot import create_state_snapshotter
+from assessment_cache import AssessmentCache
+from serialization import EncodedCache, FastJSONResponse
+from summary_cache import CachedSummary, SummaryCache, assessment_fingerprint, etag_matches
+from jobs import TERMINAL_STATUSES, Job, JobCancelled, JobQueue, QueueFull
+from executors import (
+    batch_validate_task, compare_task, create_cpu_executor, simulate_task, summarize_task, validate_task
+)
+from scenarios import ScenarioGrid, axis_size, expand_axis
+from sanctions import get_screener
+from audit import create_audit_log
+from export import EXPORT_FORMATS, date_bounds, export_stream, format_available
+from metrics import EXTRACTION_SECONDS, InstrumentedRoute, render as render_metrics
+from admission import AdmissionRoute, create_route_gate, install_gates, too_many_requests
 
 app = FastAPI(
     title="AI Deal Checker API",
     description="Backend service for AI-powered financial document analysis",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
+class GatedRoute(InstrumentedRoute, AdmissionRoute):
+    """Admission runs inside the metrics wrapper, so rejected requests are counted as 429 / 413"""
+
+# Every API route records its latency and in-flight count for /metrics
+app.router.route_class = GatedRoute
+
 # Enable CORS for React frontend
 app.add_middleware(
     CORSMiddleware,
@@ -24,41 +66,101 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for demo purposes
-deals_storage: Dict[str, Dict] = {}
+# Deal storage backend (SQLite by default, see storage.py)
+deal_store = create_deal_store()
 
-# Pydantic Models
-class ExtractedFields(BaseModel):
-    counterparty: Optional[str] = None
-    notional_amount: Optional[str] = None
-    currency: Optional[str] = None
-    interest_rate: Optional[str] = None
-    trade_date: Optional[str] = None
-    maturity_date: Optional[str] = None
-    settlement_date: Optional[str] = None
-    collateral: Optional[str] = None
-    termination_clause: Optional[str] = None
-
-class ValidationResult(BaseModel):
-    field: str
-    status: str  # "valid", "warning", "error"
-    explanation: str
-    severity: str  # "low", "medium", "high"
-    confidence: Optional[float] = None
-    standard_value: Optional[str] = None
-    document_snippet: Optional[str] = None
-
-class RiskAssessment(BaseModel):
-    risk_score: int
-    risk_level: str
-    validations: List[ValidationResult]
-    ai_explanations: Dict[str, str]
-    benchmark_comparison: List[Dict[str, Any]]
-    audit_trail: List[Dict[str, Any]]
+# Append-only deal event log (see audit.py); each server process writes its own segments
+audit_log = create_audit_log()
+
+# Extracted document text with section/line offsets, read through mmap (see document_text.py)
+text_store = create_text_store()
+
+# BM25 passage index over document text, validations and AI explanations (see search.py)
+search_index = create_search_index(text_store.open, deal_store.get, deal_store.list_page)
+# Longest /deal/{deal_id}/ask waits for the deal's queued changes to be indexed
+SEARCH_INDEX_WAIT = 5.0
+
+# Extraction results keyed by document content hash and extractor version
+extraction_cache = ExtractionCache(
+    max_entries=int(os.getenv("EXTRACTION_CACHE_SIZE", 10000)),
+    disk_dir=os.getenv("EXTRACTION_CACHE_DIR") or None
+)
+
+# Validation results keyed by normalized record, rule set and noise seed
+assessment_cache = AssessmentCache(max_entries=int(os.getenv("ASSESSMENT_CACHE_SIZE", 10000)))
+
+# Encoded /summary bodies, rebuilt only when a deal's assessment changes
+summary_cache = SummaryCache(max_entries=int(os.getenv("SUMMARY_CACHE_SIZE", 10000)))
+
+# Encoded /deal/{deal_id} bodies, dropped whenever the deal is written
+deal_detail_cache = EncodedCache(max_entries=int(os.getenv("DEAL_DETAIL_CACHE_SIZE", 10000)))
+
+def summary_is_current(deal_id: str, cached: CachedSummary) -> bool:
+    """Whether a summary restored from a snapshot was built from the deal's current assessment"""
+    deal_data = deal_store.get(deal_id)
+    return deal_data is not None and cached.fingerprint == assessment_fingerprint(deal_data.get("risk_assessment", {}))
+
+# Periodic snapshots of the memory deal store and the caches, restored at startup (see snapshot.py)
+state_snapshot = create_state_snapshotter(deal_store, assessment_cache, summary_cache, summary_is_current)
 
+# Server processes sharing the deal store (run.py WORKERS); jobs are mirrored to it when > 1
+WORKERS = int(os.getenv("WORKERS", 1))
+# How long finished upload jobs stay visible to other processes
+SHARED_JOB_TTL = 24 * 3600
+SHARED_JOB_POLL_INTERVAL = 0.1
+
+# Return the existing deal when the same document is uploaded again
+DEDUP_UPLOADS = os.getenv("DEDUP_UPLOADS", "false").lower() == "true"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Uploaded documents wait here for their extraction job, then are removed
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+
+# "document" reads fields from the uploaded PDF/DOCX (extraction.py); "mock" picks canned fields by content hash
+EXTRACTORS = ("document", "mock")
+EXTRACTOR = os.getenv("EXTRACTOR", "document").lower()
+if EXTRACTOR not in EXTRACTORS:
+    raise ValueError(f"Unknown extractor '{EXTRACTOR}', expected one of {', '.join(EXTRACTORS)}")
+
+# Background extraction + validation workers for /upload
+job_queue = JobQueue(
+    concurrency=int(os.getenv("JOB_CONCURRENCY", 4)),
+    max_queued=int(os.getenv("JOB_QUEUE_SIZE", 1000)),
+    max_retries=int(os.getenv("JOB_MAX_RETRIES", 2))
+)
+
+# Validation, simulation and summaries run here instead of on the event loop
+cpu_executor = create_cpu_executor()
+
+# Document sections being parsed at once per extraction; bounds its memory use
+EXTRACTION_WINDOW = int(os.getenv("EXTRACTION_WINDOW", 0)) or cpu_executor.workers * 2
+
+# Seconds one document may take to read before it is stored as unreadable; 0 disables
+EXTRACTION_TIMEOUT = float(os.getenv("EXTRACTION_TIMEOUT", 60))
+
+# Largest Cartesian product /simulate/grid will evaluate in one request
+SIMULATION_GRID_MAX_POINTS = int(os.getenv("SIMULATION_GRID_MAX_POINTS", 100000))
+
+# Most deals one /compare request may include
+COMPARE_MAX_DEALS = int(os.getenv("COMPARE_MAX_DEALS", 1000))
+
+# Seconds between watchlist change checks; 0 disables polling (POST /sanctions/reload still works)
+SANCTIONS_RELOAD_INTERVAL = float(os.getenv("SANCTIONS_RELOAD_INTERVAL", 0))
+
+# Admission control: concurrent requests, waiting requests and body size (see admission.py)
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+upload_gate = create_route_gate("upload", concurrency=8, max_queued=32, queue_timeout=30.0,
+                                max_body_bytes=MAX_UPLOAD_BYTES)
+validate_gate = create_route_gate("validate", concurrency=32, max_queued=256, queue_timeout=5.0)
+
+# Retry-After when the upload job queue is full
+JOB_QUEUE_RETRY_AFTER = 5
+
+# Pydantic Models
 class SimulationRequest(BaseModel):
     deal_id: str
     modified_fields: Dict[str, str]
+    rule_set_id: Optional[str] = None
+    commit: bool = False  # apply the modified fields to the stored deal and re-validate it
 
 class SimulationResponse(BaseModel):
     deal_id: str
@@ -66,412 +168,451 @@ class SimulationResponse(BaseModel):
     new_risk_score: int
     score_change: int
     updated_validations: List[ValidationResult]
+    committed: bool = False
 
-# Mock AI Logic and Rules Engine
-class AIValidationEngine:
-    def __init__(self):
-        self.critical_fields = ["counterparty", "notional_amount", "interest_rate"]
-        self.standard_benchmarks = {
-            "interest_rate": {"required": True, "standard": "Must be specified"},
-            "termination_clause": {"required": True, "standard": "30 days notice"},
-            "currency": {"required": True, "standard": "ISO 4217 format"},
-            "settlement_date": {"required": True, "standard": "T+2 settlement"},
-            "collateral": {"required": False, "standard": "Government bonds preferred"}
-        }
-        
-    def extract_fields_from_document(self, filename: str) -> ExtractedFields:
-        """Simulate AI document extraction with realistic mock data"""
-        
-        # Mock extraction based on filename patterns or random selection
-        mock_extractions = [
-            {
-                "counterparty": "ABC Bank Ltd.",
-                "notional_amount": "100000000",
-                "currency": "USD",
-                "interest_rate": None,  # Intentionally missing
-                "trade_date": "2024-01-15",
-                "maturity_date": "2025-01-15",
-                "settlement_date": "2024-01-17",
-                "collateral": "Government Bonds",
-                "termination_clause": None
-            },
-            {
-                "counterparty": "Global Finance Corp",
-                "notional_amount": "50000000",
-                "currency": "EUR",
-                "interest_rate": "3.25",
-                "trade_date": "2024-01-14",
-                "maturity_date": "2025-01-14",
-                "settlement_date": "2024-01-16",
-                "collateral": "Corporate Bonds",
-                "termination_clause": "30 days"
-            },
-            {
-                "counterparty": "International Bank",
-                "notional_amount": "75000000",
-                "currency": "GBP",
-                "interest_rate": "4.75",
-                "trade_date": "2024-01-13",
-                "maturity_date": "2025-01-13",
-                "settlement_date": "2024-01-15",
-                "collateral": None,
-                "termination_clause": "14 days"
-            }
-        ]
-        
-        # Select extraction based on filename hash for consistency
-        extraction_index = hash(filename) % len(mock_extractions)
-        selected_extraction = mock_extractions[extraction_index]
-        
-        # Add some randomness to simulate AI uncertainty
-        if random.random() < 0.3:  # 30% chance to make a field missing
-            fields_to_potentially_miss = ["interest_rate", "termination_clause", "collateral"]
-            field_to_miss = random.choice(fields_to_potentially_miss)
-            selected_extraction[field_to_miss] = None
-            
-        return ExtractedFields(**selected_extraction)
+class GridAxis(BaseModel):
+    values: Optional[List[str]] = None
+    start: Optional[str] = None
+    stop: Optional[str] = None
+    step: Optional[float] = None  # days for date fields
+
+class SimulationGridRequest(BaseModel):
+    deal_id: str
+    axes: Dict[str, GridAxis]
+    rule_set_id: Optional[str] = None
+    include_validations: bool = False
+
+class BatchValidationRequest(BaseModel):
+    deal_ids: List[str]
+    include_validations: bool = False
+    persist: bool = True
+    rule_set_id: Optional[str] = None
+
+class CompareRequest(BaseModel):
+    deal_ids: List[str]
+    baseline_deal_id: Optional[str] = None
+    rule_set_id: Optional[str] = None
+
+class RuleOverride(BaseModel):
+    enabled: Optional[bool] = None
+    impact: Optional[int] = None
+    severity: Optional[str] = None  # "low", "medium", "high"
+    params: Optional[Dict[str, Any]] = None
+    outcome_impacts: Optional[Dict[str, int]] = None
+
+class RuleSetRequest(BaseModel):
+    rules: Dict[str, RuleOverride]
+
+class AskRequest(BaseModel):
+    question: str
+    limit: int = 5
+
+# Initialize AI engine
+ai_engine = AIValidationEngine()
+
+def normalized_record(deal_data: Dict[str, Any]) -> NormalizedDeal:
+    """The parsed record stored at upload, built once for deals that predate it
     
-    def validate_fields(self, fields: ExtractedFields) -> RiskAssessment:
-        """Run comprehensive validation with AI-powered risk assessment"""
-        
-        validations = []
-        risk_score = 0
-        ai_explanations = {}
-        
-        # Critical field validation
-        for field in self.critical_fields:
-            field_value = getattr(fields, field)
-            if not field_value:
-                severity = "high" if field == "interest_rate" else "medium"
-                risk_increase = 30 if field == "interest_rate" else 20
-                risk_score += risk_increase
-                
-                validation = ValidationResult(
-                    field=field.replace("_", " ").title(),
-                    status="error",
-                    explanation=f"Missing {field.replace('_', ' ')} - critical for risk assessment",
-                    severity=severity,
-                    confidence=0.95,
-                    standard_value="Required" if field == "interest_rate" else "Present",
-                    document_snippet=f'"{field.replace("_", " ").title()}: [MISSING]" - Field not found in document'
-                )
-                validations.append(validation)
-                
-                # AI explanation
-                if field == "interest_rate":
-                    ai_explanations[field] = {
-                        "reasoning": "Interest rate is fundamental for derivative pricing and risk calculation. Without it, the deal cannot be properly valued or hedged.",
-                        "regulation": "ISDA Master Agreement Section 4.3 requires explicit rate specification",
-                        "recommendation": "Contact counterparty to confirm rate terms before proceeding"
-                    }
-            else:
-                validation = ValidationResult(
-                    field=field.replace("_", " ").title(),
-                    status="valid",
-                    explanation=f"{field.replace('_', ' ').title()} properly specified",
-                    severity="low",
-                    confidence=0.98,
-                    standard_value="Present",
-                    document_snippet=f'"{field.replace("_", " ").title()}: {field_value}" - Successfully extracted'
-                )
-                validations.append(validation)
-        
-        # Date consistency validation
-        if fields.trade_date and fields.maturity_date:
-            trade_date = datetime.strptime(fields.trade_date, "%Y-%m-%d")
-            maturity_date = datetime.strptime(fields.maturity_date, "%Y-%m-%d")
-            
-            if trade_date >= maturity_date:
-                risk_score += 25
-                validations.append(ValidationResult(
-                    field="Date Consistency",
-                    status="error",
-                    explanation="Trade date must be before maturity date",
-                    severity="high",
-                    confidence=0.99,
-                    standard_value="Trade < Maturity",
-                    document_snippet=f'"Trade Date: {fields.trade_date}, Maturity Date: {fields.maturity_date}" - Invalid sequence'
-                ))
-            else:
-                validations.append(ValidationResult(
-                    field="Date Consistency",
-                    status="valid",
-                    explanation="Trade and maturity dates are consistent",
-                    severity="low",
-                    confidence=0.99,
-                    standard_value="Trade < Maturity",
-                    document_snippet=f'"Trade Date: {fields.trade_date}, Maturity Date: {fields.maturity_date}" - Valid sequence'
-                ))
-        
-        # Currency validation
-        if fields.currency:
-            valid_currencies = ["USD", "EUR", "GBP", "JPY", "CHF", "CAD", "AUD"]
-            if fields.currency in valid_currencies:
-                validations.append(ValidationResult(
-                    field="Currency",
-                    status="valid",
-                    explanation="Currency code follows ISO 4217 standard",
-                    severity="low",
-                    confidence=0.99,
-                    standard_value="ISO 4217",
-                    document_snippet=f'"Currency: {fields.currency}" - Valid ISO code'
-                ))
-            else:
-                risk_score += 15
-                validations.append(ValidationResult(
-                    field="Currency",
-                    status="warning",
-                    explanation="Non-standard currency code detected",
-                    severity="medium",
-                    confidence=0.85,
-                    standard_value="ISO 4217",
-                    document_snippet=f'"Currency: {fields.currency}" - Non-standard code'
-                ))
-        
-        # Counterparty risk assessment (mock sanctions check)
-        if fields.counterparty:
-            # Simulate sanctions database check
-            high_risk_entities = ["Sanctioned Corp", "Blocked Entity Ltd", "Restricted Bank"]
-            if any(entity in fields.counterparty for entity in high_risk_entities):
-                risk_score += 50
-                validations.append(ValidationResult(
-                    field="Counterparty Sanctions",
-                    status="error",
-                    explanation="Entity appears on sanctions watchlist",
-                    severity="high",
-                    confidence=0.92,
-                    standard_value="Clean entity",
-                    document_snippet=f'"Counterparty: {fields.counterparty}" - Flagged in sanctions database'
-                ))
-            elif "Bank" not in fields.counterparty:
-                risk_score += 10
-                validations.append(ValidationResult(
-                    field="Counterparty Type",
-                    status="warning",
-                    explanation="Non-bank counterparty may require additional due diligence",
-                    severity="medium",
-                    confidence=0.78,
-                    standard_value="Financial institution",
-                    document_snippet=f'"Counterparty: {fields.counterparty}" - Non-bank entity'
-                ))
-            else:
-                validations.append(ValidationResult(
-                    field="Counterparty Verification",
-                    status="valid",
-                    explanation="Counterparty appears to be legitimate financial institution",
-                    severity="low",
-                    confidence=0.88,
-                    standard_value="Financial institution",
-                    document_snippet=f'"Counterparty: {fields.counterparty}" - Verified bank entity'
-                ))
-        
-        # Notional amount risk assessment
-        if fields.notional_amount:
-            try:
-                notional = float(fields.notional_amount)
-                if notional > 100000000:  # $100M threshold
-                    risk_score += 15
-                    validations.append(ValidationResult(
-                        field="Notional Amount",
-                        status="warning",
-                        explanation="Large notional amount increases exposure risk",
-                        severity="medium",
-                        confidence=0.95,
-                        standard_value="< $100M",
-                        document_snippet=f'"Notional Amount: ${notional:,.0f}" - Exceeds threshold'
-                    ))
-                else:
-                    validations.append(ValidationResult(
-                        field="Notional Amount",
-                        status="valid",
-                        explanation="Notional amount within acceptable risk parameters",
-                        severity="low",
-                        confidence=0.95,
-                        standard_value="< $100M",
-                        document_snippet=f'"Notional Amount: ${notional:,.0f}" - Within limits'
-                    ))
-            except ValueError:
-                risk_score += 20
-                validations.append(ValidationResult(
-                    field="Notional Amount",
-                    status="error",
-                    explanation="Invalid notional amount format",
-                    severity="high",
-                    confidence=0.99,
-                    standard_value="Numeric format",
-                    document_snippet=f'"Notional Amount: {fields.notional_amount}" - Invalid format'
-                ))
-        
-        # Settlement period validation
-        if fields.trade_date and fields.settlement_date:
-            trade_date = datetime.strptime(fields.trade_date, "%Y-%m-%d")
-            settlement_date = datetime.strptime(fields.settlement_date, "%Y-%m-%d")
-            settlement_days = (settlement_date - trade_date).days
-            
-            if settlement_days == 2:  # T+2 is standard
-                validations.append(ValidationResult(
-                    field="Settlement Period",
-                    status="valid",
-                    explanation="T+2 settlement aligns with market standards",
-                    severity="low",
-                    confidence=0.95,
-                    standard_value="T+2",
-                    document_snippet=f'"Settlement: T+{settlement_days}" - Standard period'
-                ))
-            elif settlement_days > 5:
-                risk_score += 10
-                validations.append(ValidationResult(
-                    field="Settlement Period",
-                    status="warning",
-                    explanation="Extended settlement period may increase counterparty risk",
-                    severity="medium",
-                    confidence=0.88,
-                    standard_value="T+2",
-                    document_snippet=f'"Settlement: T+{settlement_days}" - Extended period'
-                ))
-        
-        # Add some randomness to simulate AI uncertainty
-        risk_score += random.randint(-5, 5)
-        risk_score = max(0, min(100, risk_score))  # Clamp between 0-100
-        
-        # Determine risk level
-        if risk_score <= 30:
-            risk_level = "Low Risk"
-        elif risk_score <= 60:
-            risk_level = "Medium Risk"
-        else:
-            risk_level = "High Risk"
-        
-        # Generate benchmark comparison
-        benchmark_comparison = self._generate_benchmark_comparison(fields)
-        
-        # Generate audit trail
-        audit_trail = self._generate_audit_trail(fields, validations)
-        
-        return RiskAssessment(
-            risk_score=risk_score,
-            risk_level=risk_level,
-            validations=validations,
-            ai_explanations=ai_explanations,
-            benchmark_comparison=benchmark_comparison,
-            audit_trail=audit_trail
-        )
+    Records screened against an older watchlist are re-screened first.
+    """
+    if "normalized" not in deal_data:
+        deal_data["normalized"] = normalize_fields(deal_data["extracted_fields"])
+    record = deal_data["normalized"]
+    if record.counterparty and record.sanctions_version != get_screener().version:
+        fields = deal_data["extracted_fields"]
+        record = record.with_changes(fields, {"counterparty": fields.get("counterparty")})
+        deal_data["normalized"] = record
+    return record
+
+async def extract_fields(filename: str, content_hash: str, path: str) -> Dict[str, Any]:
+    """Extracted fields and how they were found, by the configured EXTRACTOR
+
+    A document that cannot be read yields no fields and records why.
+    """
+    if EXTRACTOR == "mock":
+        fields = ai_engine.extract_fields_from_document(filename, content_hash).dict()
+        return {"extracted_fields": fields, "extraction": {"format": "mock"}}
+    # Documents that share a text ID have the same text, so a concurrent writer replaces it with identical bytes
+    text_id = ExtractionCache.key(content_hash, EXTRACTOR_VERSION)
+    writer = await asyncio.to_thread(text_store.writer, text_id)
+    try:
+        extraction = await extract_document(path, cpu_executor.run, EXTRACTION_WINDOW, sink=writer.append,
+                                            timeout=EXTRACTION_TIMEOUT)
+    except DocumentError as e:
+        writer.abort()
+        extraction = {"format": None, "error": str(e), "sections": 0, "size": 0, "confidence": 0.0, "fields": {}}
+    except BaseException:
+        writer.abort()
+        raise
+    else:
+        await asyncio.to_thread(writer.commit)
+        extraction["text_id"] = text_id
+    found = extraction["fields"]
+    fields = {field: found[field]["value"] if field in found else None for field in ExtractedFields.model_fields}
+    return {"extracted_fields": fields, "extraction": extraction}
+
+async def extract_deal(deal_id: str, filename: str, content_hash: str, path: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Extract (or reuse cached) fields for a document and store the new deal
     
-    def _generate_benchmark_comparison(self, fields: ExtractedFields) -> List[Dict[str, Any]]:
-        """Generate industry benchmark comparison data"""
-        
-        comparisons = []
-        
-        # Interest Rate Benchmark
-        comparisons.append({
-            "field": "Interest Rate Specification",
-            "standard": "Required (ISDA 2002)",
-            "extracted": "Missing" if not fields.interest_rate else f"{fields.interest_rate}% (Compliant)",
-            "status": "violation" if not fields.interest_rate else "compliant",
-            "description": "All derivative contracts must specify interest rate terms"
-        })
-        
-        # Termination Clause
-        comparisons.append({
-            "field": "Termination Clause",
-            "standard": "30 days notice",
-            "extracted": "Missing" if not fields.termination_clause else f"{fields.termination_clause} (Compliant)",
-            "status": "warning" if not fields.termination_clause else "compliant",
-            "description": "Standard market practice requires termination provisions"
-        })
-        
-        # Currency
-        comparisons.append({
-            "field": "Currency Denomination",
-            "standard": "ISO 4217 format",
-            "extracted": f"{fields.currency} (Compliant)" if fields.currency else "Missing",
-            "status": "compliant" if fields.currency else "violation",
-            "description": "Currency code follows international standards"
-        })
-        
-        # Settlement Period
-        if fields.trade_date and fields.settlement_date:
-            trade_date = datetime.strptime(fields.trade_date, "%Y-%m-%d")
-            settlement_date = datetime.strptime(fields.settlement_date, "%Y-%m-%d")
-            settlement_days = (settlement_date - trade_date).days
-            
-            comparisons.append({
-                "field": "Settlement Period",
-                "standard": "T+2 (Standard)",
-                "extracted": f"T+{settlement_days} ({'Compliant' if settlement_days == 2 else 'Non-standard'})",
-                "status": "compliant" if settlement_days == 2 else "warning",
-                "description": "Settlement timing aligns with market conventions"
+    Returns the /upload response body and the stored deal.
+    """
+    
+    # Reuse the cached result for known documents
+    started = time.perf_counter()
+    version = ai_engine.extractor_version if EXTRACTOR == "mock" else EXTRACTOR_VERSION
+    cache_key = ExtractionCache.key(content_hash, version)
+    result = extraction_cache.get(cache_key)
+    # Another server process may have deleted the stored text this result points at
+    text_id = (result or {}).get("extraction", {}).get("text_id")
+    if text_id and not await asyncio.to_thread(text_store.exists, text_id):
+        result = None
+    cached = result is not None
+    if not cached:
+        result = await extract_fields(filename, content_hash, path)
+        extraction_cache.put(cache_key, result)
+    EXTRACTION_SECONDS.observe(time.perf_counter() - started, "true" if cached else "false")
+    extracted_fields, extraction = result["extracted_fields"], result["extraction"]
+    
+    # Parse once into the typed record every later stage reads
+    normalized = normalize_fields(extracted_fields)
+    
+    deal_data = {
+        "deal_id": deal_id,
+        "filename": filename,
+        "uploaded_at": datetime.now().isoformat(),
+        "content_hash": content_hash,
+        "extracted_fields": extracted_fields,
+        "extraction": extraction,
+        "normalized": normalized,
+        "status": "extracted"
+    }
+    await asyncio.to_thread(deal_store.put, deal_data)
+    deal_written(deal_id)
+    fields_present = sum(1 for value in extracted_fields.values() if value is not None)
+    audit_log.record(deal_id, "extraction", "Data Extraction Completed",
+                     f"{fields_present} of {len(extracted_fields)} fields extracted", user="AI Engine",
+                     details={"cached": cached, "format": extraction.get("format"), "error": extraction.get("error"),
+                              "parse_errors": normalized.parse_errors})
+    return upload_response(deal_data, deduplicated=False, cached=cached), deal_data
+
+def spool_upload(source: Any, path: str) -> Tuple[str, int]:
+    """Copy an upload to ``path`` a chunk at a time, returning its SHA-256 and size"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as target:
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                target.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        discard_upload(path)
+        raise
+    return hasher.hexdigest(), size
+
+def discard_upload(path: Optional[str]) -> None:
+    """Remove a spooled upload once nothing will extract it"""
+    if path:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+async def assess(record: NormalizedDeal, rule_set: CompiledRuleSet, seed: Optional[str]) -> Dict[str, Any]:
+    """Full assessment as a dict, from the result cache or computed on the CPU executor
+    
+    The model is dumped once when computed; cached dicts are shared, so treat them as read-only.
+    """
+    key = AssessmentCache.key(record, rule_set.rule_set_id, seed)
+    risk_assessment = assessment_cache.get(key)
+    if risk_assessment is None:
+        risk_assessment = (await cpu_executor.run(validate_task, record, rule_set.overrides, seed)).dict()
+        assessment_cache.put(key, risk_assessment)
+    return risk_assessment
+
+def record_validation(deal_id: str, risk_assessment: Dict[str, Any], rule_set_id: str) -> None:
+    """Audit a stored assessment: each flagged validation, then the resulting score"""
+    for validation in risk_assessment["validations"]:
+        if validation["status"] in ("error", "warning"):
+            audit_log.record(deal_id, "validation", f"{validation['field']} {validation['status'].title()}",
+                             validation["explanation"], user="Validation Engine", severity=validation["severity"],
+                             status="flagged" if validation["status"] == "error" else "completed")
+    audit_log.record(deal_id, "validation", "Risk Score Calculated",
+                     f"Risk score {risk_assessment['risk_score']} ({risk_assessment['risk_level']})",
+                     user="Risk Engine", details={"risk_score": risk_assessment["risk_score"], "rule_set_id": rule_set_id})
+
+def epoch_seconds(bound: Optional[str]) -> Optional[float]:
+    """An ISO 8601 bound (local time unless it has an offset) as a Unix timestamp"""
+    return datetime.fromisoformat(bound).timestamp() if bound else None
+
+def deal_written(deal_id: str) -> None:
+    """Drop cached encodings of a deal after it is stored or deleted, and queue it for re-indexing"""
+    deal_detail_cache.invalidate(deal_id)
+    search_index.mark(deal_id)
+
+def sync_caches() -> None:
+    """Drop cached deal bodies and summaries that another server process has rewritten"""
+    changed = deal_store.external_changes()
+    if changed is None:
+        # Fell behind the change log; nothing cached can be trusted
+        for cache in (deal_detail_cache, summary_cache):
+            cache.clear()
+        search_index.mark_all()
+        return
+    for deal_id in changed:
+        deal_written(deal_id)
+        summary_cache.invalidate(deal_id)
+
+def publish_job(job: Job) -> None:
+    """Mirror a job's state into the shared store for the other server processes"""
+    deal_store.put_shared("job", job.job_id, job.to_dict(), ttl=SHARED_JOB_TTL)
+
+def shared_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """A job running in another server process, if any"""
+    return deal_store.get_shared("job", job_id) if WORKERS > 1 else None
+
+async def poll_shared_job(job_id: str):
+    """Events for a job owned by another server process: each state change until it finishes"""
+    last = None
+    while True:
+        state = shared_job(job_id)
+        if state is None:
+            return
+        if state != last:
+            yield state
+            last = state
+        if state["status"] in TERMINAL_STATUSES:
+            return
+        await asyncio.sleep(SHARED_JOB_POLL_INTERVAL)
+
+def check_cancelled(job: Job) -> None:
+    """Job.check_cancelled, also honouring cancellations made through another server process"""
+    if WORKERS > 1 and deal_store.get_shared("job_cancel", job.job_id) is not None:
+        job.cancel_requested = True
+    job.check_cancelled()
+
+def load_records(deal_ids: List[str]) -> Tuple[Dict[str, Dict[str, Any]], List[str], List[str], List[NormalizedDeal]]:
+    """Stored deals by ID, the IDs found and not found (in request order) and the found deals' records"""
+    deals = deal_store.get_many(deal_ids)
+    found_ids = [deal_id for deal_id in deal_ids if deal_id in deals]
+    not_found = [deal_id for deal_id in deal_ids if deal_id not in deals]
+    return deals, found_ids, not_found, [normalized_record(deals[deal_id]) for deal_id in found_ids]
+
+def with_evidence(deal_data: Dict[str, Any], validations: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """A deal's validations with the document offsets of their evidence and its source line as snippet"""
+    extraction = deal_data.get("extraction") or {}
+    if not extraction.get("fields"):
+        return validations
+    text = text_store.open(extraction["text_id"]) if extraction.get("text_id") else None
+    try:
+        return attach_evidence(validations, extraction, text)
+    finally:
+        if text is not None:
+            text.close()
+
+def search_sources(hits: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+    """Search hits with the text of document passages read back and the query's terms located"""
+    terms, _ = parse_query(query)
+    texts = {}
+    sources = []
+    try:
+        for hit in hits:
+            if hit["kind"] != "document":
+                sources.append({**hit, "highlights": highlights(hit["text"], terms)})
+                continue
+            text_id = hit.pop("text_id")
+            if text_id not in texts:
+                texts[text_id] = text_store.open(text_id)
+            text = texts[text_id]
+            if text is None:
+                # Deleted since it was indexed; the index drops it on its next pass
+                continue
+            passage = text.read(hit["start"], hit["end"]).decode("utf-8", errors="ignore")
+            sources.append({
+                **hit,
+                "section": text.section_of(hit["start"]),
+                "line": text.line_of(hit["start"]),
+                "text": passage.strip(),
+                "highlights": highlights(passage, terms, hit["start"])
             })
-        
-        return comparisons
+    finally:
+        for text in texts.values():
+            if text is not None:
+                text.close()
+    return sources
 
-    def _generate_audit_trail(self, fields: ExtractedFields, validations: List[ValidationResult]) -> List[Dict[str, Any]]:
-        """Generate audit trail events for compliance tracking"""
-        
-        from datetime import datetime, timedelta
-        
-        events = []
-        base_time = datetime.now() - timedelta(minutes=5)
-        
-        # Document upload event
-        events.append({
-            "id": "1",
-            "timestamp": (base_time + timedelta(seconds=0)).isoformat(),
-            "type": "upload",
-            "title": "Document Uploaded",
-            "description": "Financial agreement document uploaded successfully",
-            "user": "System",
-            "status": "completed"
-        })
-        
-        # Extraction event
-        events.append({
-            "id": "2",
-            "timestamp": (base_time + timedelta(seconds=13)).isoformat(),
-            "type": "extraction",
-            "title": "Data Extraction Completed",
-            "description": f"{sum(1 for v in fields.dict().values() if v)} fields extracted with high confidence",
-            "user": "AI Engine",
-            "status": "completed"
-        })
-        
-        # Validation events
-        event_id = 3
-        for validation in validations:
-            if validation.status in ["error", "warning"]:
-                events.append({
-                    "id": str(event_id),
-                    "timestamp": (base_time + timedelta(seconds=30 + event_id * 5)).isoformat(),
-                    "type": "validation",
-                    "title": f"{validation.field} {validation.status.title()}",
-                    "description": validation.explanation,
-                    "user": "Validation Engine",
-                    "severity": validation.severity,
-                    "status": "flagged" if validation.status == "error" else "completed"
-                })
-                event_id += 1
-        
-        # Risk calculation event
-        events.append({
-            "id": str(event_id),
-            "timestamp": (base_time + timedelta(minutes=1)).isoformat(),
-            "type": "validation",
-            "title": "Risk Score Calculated",
-            "description": "Comprehensive risk assessment completed",
-            "user": "Risk Engine",
-            "status": "completed"
-        })
-        
-        return events
+async def validate_and_store(deal_data: Dict[str, Any], rule_set: CompiledRuleSet) -> Dict[str, Any]:
+    """Score a deal and persist the assessment"""
+    
+    risk_assessment = await assess(normalized_record(deal_data), rule_set, noise_seed(deal_data.get("content_hash")))
+    # Cached assessments are shared between deals; evidence is per document, so it goes on a copy
+    risk_assessment = {**risk_assessment, "validations": with_evidence(deal_data, risk_assessment["validations"])}
+    deal_data.update({
+        "risk_assessment": risk_assessment,
+        "rule_set_id": rule_set.rule_set_id,
+        "status": "validated",
+        "validated_at": datetime.now().isoformat()
+    })
+    await asyncio.to_thread(deal_store.put, deal_data)
+    deal_written(deal_data["deal_id"])
+    record_validation(deal_data["deal_id"], risk_assessment, rule_set.rule_set_id)
+    await materialize_summary(deal_data)
+    return risk_assessment
 
-# Initialize AI engine
-ai_engine = AIValidationEngine()
+async def materialize_summary(deal_data: Dict[str, Any]) -> CachedSummary:
+    """Build and cache the deal's summary unless the cached one came from the same assessment"""
+    
+    deal_id = deal_data["deal_id"]
+    risk_assessment = deal_data.get("risk_assessment", {})
+    fingerprint = assessment_fingerprint(risk_assessment)
+    cached = summary_cache.current(deal_id, fingerprint)
+    if cached is None:
+        summary = await cpu_executor.run(summarize_task, deal_id, risk_assessment,
+                                         noise_seed(deal_data.get("content_hash")))
+        cached = summary_cache.put(deal_id, fingerprint, summary)
+    return cached
+
+async def process_upload(job: Job) -> Dict[str, Any]:
+    """Job handler for /upload: extraction, then validation with the default rules"""
+    
+    payload = job.payload
+    try:
+        check_cancelled(job)
+        job.report("extracting", 10)
+        result, deal_data = await extract_deal(payload["deal_id"], payload["filename"], payload["content_hash"],
+                                               payload["path"])
+    except Exception as e:
+        # Keep the document while the job will be retried
+        if isinstance(e, JobCancelled) or job.attempts > job_queue.max_retries:
+            discard_upload(payload["path"])
+        raise
+    discard_upload(payload["path"])
+    
+    check_cancelled(job)
+    job.report("validating", 60)
+    risk_assessment = await validate_and_store(deal_data, get_rule_set())
+    
+    result.update({
+        "risk_score": risk_assessment["risk_score"],
+        "risk_level": risk_assessment["risk_level"]
+    })
+    return result
+
+def upload_response(deal_data: Dict[str, Any], deduplicated: bool, cached: bool) -> Dict[str, Any]:
+    """Response body for /upload"""
+    extracted_fields = deal_data["extracted_fields"]
+    extraction = deal_data.get("extraction") or {}
+    confidence = extraction.get("confidence")
+    if confidence is None:
+        # Mock extraction (and deals stored before documents were read) has no measured confidence
+        confidence = round(noise_source(noise_seed(deal_data.get("content_hash")), "extraction").uniform(0.85, 0.98), 2)
+    return {
+        "deal_id": deal_data["deal_id"],
+        "filename": deal_data["filename"],
+        "content_hash": deal_data.get("content_hash"),
+        "extraction_confidence": confidence,
+        "extraction": extraction,
+        "extracted_fields": extracted_fields,
+        "fields_extracted": sum(1 for v in extracted_fields.values() if v is not None),
+        "total_fields": len(extracted_fields),
+        "parse_errors": normalized_record(deal_data).parse_errors,
+        "extraction_cached": cached,
+        "deduplicated": deduplicated
+    }
+
+def get_deal_or_404(deal_id: str) -> Dict[str, Any]:
+    """Fetch a deal from the store or fail with 404"""
+    deal_data = deal_store.get(deal_id)
+    if deal_data is None:
+        raise HTTPException(status_code=404, detail="Deal not found")
+    return deal_data
+
+def resolve_rule_set(rule_set_id: Optional[str]) -> CompiledRuleSet:
+    """Look up a registered rule set or fail with 404
+    
+    Rule sets registered by another server process (or before a restart) are
+    compiled here from their stored configuration.
+    """
+    try:
+        return get_rule_set(rule_set_id)
+    except KeyError:
+        overrides = deal_store.get_shared("rule_set", rule_set_id)
+        if overrides is None:
+            raise HTTPException(status_code=404, detail="Rule set not found")
+        return register_rule_set(overrides)
+
+async def poll_watchlist():
+    """Swap in a new sanctions index whenever the watchlist file changes"""
+    while True:
+        await asyncio.sleep(SANCTIONS_RELOAD_INTERVAL)
+        try:
+            await asyncio.to_thread(get_screener().reload)
+        except Exception:
+            # Keep screening against the current index; the next poll retries
+            pass
+
+@app.on_event("startup")
+async def start_workers():
+    # Deals first: everything below reads the store; the caches follow in the background
+    await asyncio.to_thread(state_snapshot.restore)
+    state_snapshot.start()
+    # Load (or build) the sanctions index before the first upload needs it
+    await asyncio.to_thread(get_screener)
+    if SANCTIONS_RELOAD_INTERVAL > 0:
+        app.state.watchlist_poller = asyncio.create_task(poll_watchlist())
+    await cpu_executor.start()
+    audit_log.start()
+    search_index.start()
+    if WORKERS > 1:
+        job_queue.on_change = publish_job
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_workers():
+    poller = getattr(app.state, "watchlist_poller", None)
+    if poller is not None:
+        poller.cancel()
+    await job_queue.stop()
+    await cpu_executor.stop()
+    # Nothing writes deals any more: the last snapshot is complete
+    await asyncio.to_thread(state_snapshot.stop)
+    # Commit queued audit events before exiting
+    await asyncio.to_thread(audit_log.stop)
+    # Index queued deals and write a snapshot so the next start loads instead of rebuilding
+    await asyncio.to_thread(search_index.stop)
 
 # API Endpoints
 @app.get("/")
 async def root():
     return {"message": "AI Deal Checker API", "version": "1.0.0", "status": "active"}
 
+@app.get("/rules")
+async def list_rules():
+    """Describe the default validation rules"""
+    return get_rule_set().describe()
+
+@app.post("/rulesets")
+async def create_rule_set(request: RuleSetRequest):
+    """Compile and register a rule configuration, returning its content-hash ID"""
+    
+    overrides = {rule_id: override.dict(exclude_none=True) for rule_id, override in request.rules.items()}
+    try:
+        rule_set = register_rule_set(overrides)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+    deal_store.put_shared("rule_set", rule_set.rule_set_id, rule_set.overrides)
+    
+    return rule_set.describe()
+
+@app.get("/rulesets/{rule_set_id}")
+async def get_rule_set_details(rule_set_id: str):
+    """Describe a registered rule configuration"""
+    return resolve_rule_set(rule_set_id).describe()
+
 @app.post("/upload")
 async def upload_document(file: UploadFile = File(...)):
     """Upload and extract fields from financial document"""
@@ -484,226 +625,637 @@ async def upload_document(file: UploadFile = File(...)):
         if file.content_type not in allowed_types:
             raise HTTPException(status_code=400, detail="Unsupported file type")
         
-        # Generate unique deal ID
+        # Spool the body to disk for the extractor, hashing it on the way rather than holding it in one buffer
         deal_id = str(uuid.uuid4())
+        path = os.path.join(UPLOAD_DIR, deal_id)
+        content_hash, size = await asyncio.to_thread(spool_upload, file.file, path)
         
-        # Simulate AI extraction
-        extracted_fields = ai_engine.extract_fields_from_document(file.filename)
+        if DEDUP_UPLOADS:
+            existing_id = deal_store.find_by_content_hash(content_hash)
+            existing = deal_store.get(existing_id) if existing_id else None
+            if existing is not None:
+                discard_upload(path)
+                audit_log.record(existing_id, "upload", "Document Re-uploaded",
+                                 f"{file.filename} matches this deal's document; existing results returned",
+                                 details={"content_hash": content_hash, "size": size})
+                return FastJSONResponse(upload_response(existing, deduplicated=True, cached=True))
         
-        # Store deal data
-        deals_storage[deal_id] = {
+        # Extraction and validation run on the job queue; smaller files first
+        payload = {
             "deal_id": deal_id,
             "filename": file.filename,
-            "uploaded_at": datetime.now().isoformat(),
-            "extracted_fields": extracted_fields.dict(),
-            "status": "extracted"
+            "content_hash": content_hash,
+            "size": size,
+            "path": path
         }
+        try:
+            job = job_queue.submit(process_upload, payload, priority=size)
+        except QueueFull:
+            discard_upload(path)
+            raise too_many_requests("Upload queue is full, retry later", JOB_QUEUE_RETRY_AFTER)
+        audit_log.record(payload["deal_id"], "upload", "Document Uploaded", f"{file.filename} queued for extraction",
+                         details={"job_id": job.job_id, "content_hash": content_hash, "size": size})
         
-        return {
-            "deal_id": deal_id,
-            "filename": file.filename,
-            "extraction_confidence": round(random.uniform(0.85, 0.98), 2),
-            "extracted_fields": extracted_fields.dict(),
-            "fields_extracted": sum(1 for v in extracted_fields.dict().values() if v is not None),
-            "total_fields": len(extracted_fields.dict())
-        }
+        return FastJSONResponse(status_code=202, content={
+            **job.to_dict(),
+            "content_hash": content_hash,
+            "status_url": f"/jobs/{job.job_id}",
+            "events_url": f"/jobs/{job.job_id}/events"
+        })
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Extraction failed: {str(e)}")
 
 @app.post("/validate")
-async def validate_deal(deal_id: str):
+async def validate_deal(deal_id: str, rule_set_id: Optional[str] = None):
     """Validate extracted fields and calculate risk score"""
     
-    if deal_id not in deals_storage:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    started = time.perf_counter()
+    deal_data = get_deal_or_404(deal_id)
+    rule_set = resolve_rule_set(rule_set_id)
     
     try:
-        deal_data = deals_storage[deal_id]
-        extracted_fields = ExtractedFields(**deal_data["extracted_fields"])
+        # Run AI validation and update deal storage
+        risk_assessment = await validate_and_store(deal_data, rule_set)
         
-        # Run AI validation
-        risk_assessment = ai_engine.validate_fields(extracted_fields)
-        
-        # Update deal storage
-        deals_storage[deal_id].update({
-            "risk_assessment": risk_assessment.dict(),
-            "status": "validated",
-            "validated_at": datetime.now().isoformat()
+        return FastJSONResponse({
+            "deal_id": deal_id,
+            "risk_score": risk_assessment["risk_score"],
+            "risk_level": risk_assessment["risk_level"],
+            "validations": risk_assessment["validations"],
+            "ai_explanations": risk_assessment["ai_explanations"],
+            "benchmark_comparison": risk_assessment["benchmark_comparison"],
+            "processing_time_ms": round((time.perf_counter() - started) * 1000, 3),
+            "audit_url": f"/deal/{deal_id}/audit"
         })
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Validation failed: {str(e)}")
+
+@app.post("/validate/batch")
+async def validate_deals_batch(request: BatchValidationRequest):
+    """Score many deals in one columnar pass"""
+    
+    rule_set = resolve_rule_set(request.rule_set_id)
+    persist = request.persist
+    
+    try:
+        # Loading, scoring and storing thousands of deals all happen off the event loop
+        deals, found_ids, not_found, records = await asyncio.to_thread(load_records, request.deal_ids)
+        seeds = [noise_seed(deals[deal_id].get("content_hash")) for deal_id in found_ids]
+        scored = await cpu_executor.run(batch_validate_task, found_ids, records, rule_set.overrides, seeds,
+                                        request.include_validations or persist, persist)
+        
+        def finish() -> List[Dict[str, Any]]:
+            validated_at = datetime.now().isoformat()
+            results = []
+            updated = []
+            for deal_id, outcome in zip(found_ids, scored):
+                result = {
+                    "deal_id": deal_id,
+                    "risk_score": outcome["risk_score"],
+                    "risk_level": outcome["risk_level"]
+                }
+                
+                if "validations" in outcome:
+                    validations = with_evidence(deals[deal_id], outcome["validations"])
+                    if request.include_validations:
+                        result["validations"] = validations
+                        result["ai_explanations"] = outcome["ai_explanations"]
+                    
+                    if persist:
+                        deal_data = deals[deal_id]
+                        deal_data.update({
+                            "risk_assessment": {**outcome, "validations": validations},
+                            "rule_set_id": rule_set.rule_set_id,
+                            "status": "validated",
+                            "validated_at": validated_at
+                        })
+                        updated.append(deal_data)
+                
+                results.append(result)
+            
+            # Persist in one batched write
+            if updated:
+                deal_store.put_many(updated)
+                for deal_data in updated:
+                    deal_written(deal_data["deal_id"])
+                    summary_cache.invalidate_if_changed(deal_data["deal_id"], deal_data["risk_assessment"])
+                    record_validation(deal_data["deal_id"], deal_data["risk_assessment"], rule_set.rule_set_id)
+            return results
+        
+        results = await asyncio.to_thread(finish)
+        
         return {
-            "deal_id": deal_id,
-            "risk_score": risk_assessment.risk_score,
-            "risk_level": risk_assessment.risk_level,
-            "validations": [v.dict() for v in risk_assessment.validations],
-            "ai_explanations": risk_assessment.ai_explanations,
-            "benchmark_comparison": risk_assessment.benchmark_comparison,
-            "processing_time_ms": random.randint(800, 1500)  # Simulate processing time
-            "audit_trail": risk_assessment.audit_trail
+            "results": results,
+            "validated_count": len(results),
+            "not_found": not_found,
+            "parse_errors": {deal_id: record.parse_errors
+                             for deal_id, record in zip(found_ids, records) if record.parse_errors}
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Validation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Batch validation failed: {str(e)}")
+
+@app.post("/compare")
+async def compare(request: CompareRequest):
+    """Field matrix, differing fields, outliers and risk deltas across several deals"""
+    
+    deal_ids = list(dict.fromkeys(request.deal_ids))
+    if len(deal_ids) > COMPARE_MAX_DEALS:
+        raise HTTPException(status_code=400, detail=f"At most {COMPARE_MAX_DEALS} deals can be compared at once")
+    rule_set = resolve_rule_set(request.rule_set_id)
+    
+    deals, found_ids, not_found, records = await asyncio.to_thread(load_records, deal_ids)
+    if len(found_ids) < 2:
+        raise HTTPException(status_code=404, detail=f"At least two existing deals are needed, not found: {not_found}")
+    baseline_id = request.baseline_deal_id or found_ids[0]
+    if baseline_id not in deals:
+        raise HTTPException(status_code=400, detail="baseline_deal_id must be one of the compared deals")
+    
+    found = [deals[deal_id] for deal_id in found_ids]
+    comparison = await cpu_executor.run(
+        compare_task,
+        found_ids,
+        [deal_data["extracted_fields"] for deal_data in found],
+        records,
+        rule_set.overrides,
+        [noise_seed(deal_data.get("content_hash")) for deal_data in found],
+        found_ids.index(baseline_id)
+    )
+    comparison["not_found"] = not_found
+    comparison["rule_set_id"] = rule_set.rule_set_id
+    return comparison
 
 @app.post("/simulate")
 async def simulate_scenario(request: SimulationRequest):
     """Run what-if scenario analysis with modified field values"""
     
-    if request.deal_id not in deals_storage:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    deal_data = get_deal_or_404(request.deal_id)
+    rule_set = resolve_rule_set(request.rule_set_id)
     
     try:
-        deal_data = deals_storage[request.deal_id]
-        original_fields = ExtractedFields(**deal_data["extracted_fields"])
         original_risk_score = deal_data.get("risk_assessment", {}).get("risk_score", 0)
         
-        # Create modified fields
-        modified_fields_dict = original_fields.dict()
-        modified_fields_dict.update(request.modified_fields)
-        modified_fields = ExtractedFields(**modified_fields_dict)
+        # Re-parse only the modified fields on top of the stored record
+        modified_fields = normalized_record(deal_data).with_changes(
+            deal_data["extracted_fields"], request.modified_fields
+        )
         
-        # Run validation on modified fields
-        new_assessment = ai_engine.validate_fields(modified_fields)
+        # Score the modified fields; benchmarks and audit trail are not needed here
+        seed = noise_seed(deal_data.get("content_hash"))
+        key = AssessmentCache.key(modified_fields, rule_set.rule_set_id, seed, kind="score")
+        scored = assessment_cache.get(key)
+        if scored is None:
+            scored = await cpu_executor.run(simulate_task, modified_fields, rule_set.overrides, seed)
+            assessment_cache.put(key, scored)
+        new_risk_score, _, validations = scored
         
-        score_change = new_assessment.risk_score - original_risk_score
+        audit_log.record(request.deal_id, "simulation",
+                         "Scenario Committed" if request.commit else "Scenario Simulated",
+                         f"Changed {', '.join(sorted(request.modified_fields))}: risk score {original_risk_score} -> {new_risk_score}",
+                         user="Scenario Engine",
+                         details={"modified_fields": request.modified_fields, "new_risk_score": new_risk_score,
+                                  "rule_set_id": rule_set.rule_set_id, "committed": request.commit})
+        if request.commit:
+            # The scenario becomes the deal: store the edited fields with a full assessment
+            deal_data["extracted_fields"] = {**deal_data["extracted_fields"], **request.modified_fields}
+            deal_data["normalized"] = modified_fields
+            extraction = deal_data.get("extraction")
+            if extraction and extraction.get("fields"):
+                # Edited values no longer come from the document
+                deal_data["extraction"] = {**extraction, "fields": {
+                    field: found for field, found in extraction["fields"].items() if field not in request.modified_fields
+                }}
+            risk_assessment = await validate_and_store(deal_data, rule_set)
+            new_risk_score, validations = risk_assessment["risk_score"], risk_assessment["validations"]
         
         return SimulationResponse(
             deal_id=request.deal_id,
             original_risk_score=original_risk_score,
-            new_risk_score=new_assessment.risk_score,
-            score_change=score_change,
-            updated_validations=new_assessment.validations
+            new_risk_score=new_risk_score,
+            score_change=new_risk_score - original_risk_score,
+            updated_validations=validations,
+            committed=request.commit
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Simulation failed: {str(e)}")
 
+@app.post("/simulate/grid")
+async def simulate_grid(request: SimulationGridRequest):
+    """Sweep the Cartesian product of per-field value ranges, streamed as NDJSON"""
+    
+    deal_data = get_deal_or_404(request.deal_id)
+    rule_set = resolve_rule_set(request.rule_set_id)
+    
+    if not request.axes:
+        raise HTTPException(status_code=400, detail="At least one axis is required")
+    # Size the grid before building any axis, so an oversized range is rejected without materializing it
+    try:
+        points = math.prod(axis_size(field, **axis.dict()) for field, axis in request.axes.items())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if points > SIMULATION_GRID_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Grid has {points} points, limit is {SIMULATION_GRID_MAX_POINTS}")
+    axes = [(field, expand_axis(field, **axis.dict())) for field, axis in request.axes.items()]
+    
+    grid = ScenarioGrid(normalized_record(deal_data), deal_data["extracted_fields"], axes, rule_set,
+                        seed=noise_seed(deal_data.get("content_hash")))
+    
+    original_risk_score = deal_data.get("risk_assessment", {}).get("risk_score", 0)
+    audit_log.record(request.deal_id, "simulation", "Scenario Grid Simulated",
+                     f"{grid.size} scenarios across {', '.join(field for field, _ in axes)}", user="Scenario Engine",
+                     details={"points": grid.size, "rule_set_id": rule_set.rule_set_id})
+    
+    def lines():
+        # Sent in chunks of rows; a sync generator runs in Starlette's threadpool, off the event loop
+        chunk = []
+        for point in grid.points(request.include_validations):
+            point["score_change"] = point["risk_score"] - original_risk_score
+            chunk.append(json.dumps(point))
+            if len(chunk) == 500:
+                yield "\n".join(chunk) + "\n"
+                chunk = []
+        if chunk:
+            yield "\n".join(chunk) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"X-Grid-Points": str(grid.size)})
+
 @app.get("/summary/{deal_id}")
-async def get_deal_summary(deal_id: str):
+async def get_deal_summary(deal_id: str, if_none_match: Optional[str] = Header(None)):
     """Generate AI-powered plain English summary of deal analysis"""
     
-    if deal_id not in deals_storage:
-        raise HTTPException(status_code=404, detail="Deal not found")
+    sync_caches()
+    cached = summary_cache.get(deal_id)
+    if cached is None:
+        deal_data = get_deal_or_404(deal_id)
+        try:
+            cached = await materialize_summary(deal_data)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Summary generation failed: {str(e)}")
+    
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+@app.get("/sanctions/screen")
+async def screen_counterparty(name: str, limit: int = Query(5, ge=1, le=50)):
+    """Screen a name against the sanctions watchlist"""
+    return get_screener().screen(name, limit=limit)
+
+@app.post("/sanctions/reload")
+async def reload_watchlist():
+    """Rebuild the sanctions index if the watchlist file changed, then swap it in"""
     
+    screener = get_screener()
     try:
-        deal_data = deals_storage[deal_id]
-        risk_assessment = deal_data.get("risk_assessment", {})
-        risk_score = risk_assessment.get("risk_score", 0)
-        validations = risk_assessment.get("validations", [])
-        
-        # Generate AI summary based on risk factors
-        critical_issues = [v for v in validations if v.get("severity") == "high"]
-        warning_issues = [v for v in validations if v.get("severity") == "medium"]
-        
-        if risk_score >= 70:
-            risk_description = "high risk"
-            recommendation = "Recommend immediate human review and additional due diligence before proceeding."
-        elif risk_score >= 40:
-            risk_description = "moderate risk"
-            recommendation = "Consider additional verification of flagged items before approval."
-        else:
-            risk_description = "low risk"
-            recommendation = "Deal appears suitable for standard processing workflow."
-        
-        # Build detailed summary
-        summary_parts = [
-            f"This financial agreement presents {risk_description} with an overall score of {risk_score}/100."
-        ]
-        
-        if critical_issues:
-            critical_fields = [issue["field"] for issue in critical_issues]
-            summary_parts.append(f"Critical concerns identified: {', '.join(critical_fields)}.")
-        
-        if warning_issues:
-            warning_fields = [issue["field"] for issue in warning_issues]
-            summary_parts.append(f"Additional attention required for: {', '.join(warning_fields)}.")
-        
-        summary_parts.append(recommendation)
-        
-        # Add specific insights
-        insights = []
-        if any("Interest Rate" in v.get("field", "") for v in validations if v.get("status") == "error"):
-            insights.append("Missing interest rate specification creates pricing uncertainty and regulatory compliance risk.")
-        
-        if any("Counterparty" in v.get("field", "") for v in validations if v.get("status") == "warning"):
-            insights.append("Counterparty verification incomplete - enhanced due diligence recommended.")
-        
-        return {
-            "deal_id": deal_id,
-            "risk_score": risk_score,
-            "risk_level": risk_assessment.get("risk_level", "Unknown"),
-            "summary": " ".join(summary_parts),
-            "key_insights": insights,
-            "critical_issues_count": len(critical_issues),
-            "warning_issues_count": len(warning_issues),
-            "generated_at": datetime.now().isoformat(),
-            "confidence": round(random.uniform(0.88, 0.96), 2)
-        }
-        
+        swapped = await asyncio.to_thread(screener.reload)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Summary generation failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Watchlist reload failed: {str(e)}")
+    
+    return {"reloaded": swapped, **screener.stats()}
 
 @app.get("/deals")
-async def list_deals():
-    """Get list of all processed deals for dashboard"""
+async def list_deals(
+    limit: int = Query(50, ge=1, le=1000),
+    after: Optional[str] = None,
+    risk_level: Optional[Literal["high", "medium", "low"]] = None,
+    status: Optional[str] = None,
+    currency: Optional[str] = None
+):
+    """Get a page of processed deals for dashboard, most recent first"""
     
-    deals_list = []
-    for deal_id, deal_data in deals_storage.items():
-        risk_assessment = deal_data.get("risk_assessment", {})
-        
-        deals_list.append({
-            "deal_id": deal_id,
-            "filename": deal_data.get("filename", "Unknown"),
-            "counterparty": deal_data.get("extracted_fields", {}).get("counterparty", "Unknown"),
-            "notional_amount": deal_data.get("extracted_fields", {}).get("notional_amount", "0"),
-            "currency": deal_data.get("extracted_fields", {}).get("currency", "USD"),
-            "risk_score": risk_assessment.get("risk_score", 0),
-            "risk_level": risk_assessment.get("risk_level", "Unknown"),
-            "status": deal_data.get("status", "uploaded"),
-            "uploaded_at": deal_data.get("uploaded_at"),
-            "validated_at": deal_data.get("validated_at")
-        })
+    try:
+        deals_list, next_cursor = deal_store.list_page(
+            limit, after=after, status=status, currency=currency, risk_level=risk_level
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Sort by upload date (most recent first)
-    deals_list.sort(key=lambda x: x.get("uploaded_at", ""), reverse=True)
+    # Counters are maintained by the store on every write and delete
+    risk_counts = deal_store.risk_counts()
     
-    return {
+    return FastJSONResponse({
         "deals": deals_list,
-        "total_count": len(deals_list),
-        "high_risk_count": len([d for d in deals_list if d["risk_score"] >= 70]),
-        "medium_risk_count": len([d for d in deals_list if 40 <= d["risk_score"] < 70]),
-        "low_risk_count": len([d for d in deals_list if d["risk_score"] < 40])
+        "next_cursor": next_cursor,
+        "total_count": sum(risk_counts.values()),
+        "high_risk_count": risk_counts["high"],
+        "medium_risk_count": risk_counts["medium"],
+        "low_risk_count": risk_counts["low"]
+    })
+
+@app.get("/search")
+async def search_deals(q: str, limit: int = Query(10, ge=1, le=MAX_RESULTS)):
+    """Best-matching passages across every deal's document, validations and AI explanations"""
+    
+    started = time.perf_counter()
+    if not search_index.ready:
+        raise HTTPException(status_code=503, detail="Search index is still loading",
+                            headers={"Retry-After": "1"})
+    sync_caches()
+    hits = await asyncio.to_thread(search_index.search, q, limit)
+    results = await asyncio.to_thread(search_sources, hits, q)
+    
+    return FastJSONResponse({
+        "query": q,
+        "results": results,
+        "processing_time_ms": round((time.perf_counter() - started) * 1000, 3)
+    })
+
+@app.get("/portfolio/exposure")
+async def portfolio_exposure():
+    """Notional and deal counts by currency, risk bucket and maturity, per deal currency"""
+    
+    maturity = deal_store.exposures("maturity")
+    return {
+        "as_of": date.today().isoformat(),
+        "by_currency": {row["key"]: {"notional": row["notional"], "deals": row["deals"]}
+                        for row in deal_store.exposures("currency")},
+        "by_risk_bucket": by_key(deal_store.exposures("risk_bucket")),
+        "by_maturity_month": by_key(maturity),
+        "maturity_ladder": maturity_ladder(maturity, date.today())
+    }
+
+@app.get("/portfolio/counterparties")
+async def portfolio_counterparties(currency: str = "USD", limit: int = Query(10, ge=1, le=1000)):
+    """The counterparties with the largest notional exposure in one currency"""
+    
+    top = deal_store.top_exposures("counterparty", currency, limit)
+    return {
+        "currency": currency,
+        "counterparties": [{"counterparty": row["key"], "notional": row["notional"], "deals": row["deals"]}
+                           for row in top]
+    }
+
+@app.get("/export")
+async def export_deals(
+    format: Literal["csv", "ndjson", "parquet", "arrow"] = "ndjson",
+    kind: Literal["deals", "validations", "benchmarks", "audit"] = "deals",
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    risk_level: Optional[Literal["high", "medium", "low"]] = None,
+    status: Optional[str] = None
+):
+    """Stream every matching deal, its validations or benchmarks (oldest upload first), or audit events"""
+    
+    try:
+        lower, upper = date_bounds(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not format_available(format):
+        raise HTTPException(status_code=400, detail=f"{format} export needs pyarrow installed on the server")
+    
+    if kind == "audit":
+        # start/end select event times; the deal filters do not apply
+        if risk_level is not None or status is not None:
+            raise HTTPException(status_code=400, detail="risk_level and status do not apply to audit exports")
+        source = audit_log.query(epoch_seconds(lower), epoch_seconds(upper))
+    else:
+        source = deal_store.iter_encoded(lower, upper, risk_level=risk_level, status=status)
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"{kind}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    # A plain generator: Starlette iterates it on a worker thread, keeping store reads off the event loop
+    return StreamingResponse(export_stream(kind, format, source), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.get("/audit")
+async def query_audit(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    type: Optional[Literal["upload", "extraction", "validation", "simulation", "delete"]] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    after: Optional[str] = None
+):
+    """Audit events across all deals in a time range, oldest first; pass ``next_cursor`` as ``after`` for the next page"""
+    
+    try:
+        lower, upper = date_bounds(start, end)
+        # query() is lazy: the segment reads and the cursor check happen as list() pulls events, on a worker thread
+        events = await asyncio.to_thread(
+            list, islice(audit_log.query(epoch_seconds(lower), epoch_seconds(upper), type, after), limit + 1))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    has_more = len(events) > limit
+    events = events[:limit]
+    return {
+        "events": events,
+        "count": len(events),
+        "next_cursor": events[-1]["id"] if has_more else None
     }
 
 @app.get("/deal/{deal_id}")
 async def get_deal_details(deal_id: str):
     """Get complete deal details including all analysis results"""
     
-    if deal_id not in deals_storage:
+    sync_caches()
+    body = deal_detail_cache.get(deal_id)
+    if body is None:
+        body = deal_store.get_encoded(deal_id)
+        if body is None:
+            raise HTTPException(status_code=404, detail="Deal not found")
+        deal_detail_cache.put(deal_id, body)
+    return Response(content=body, media_type="application/json")
+
+@app.get("/deal/{deal_id}/audit")
+async def get_deal_audit(deal_id: str):
+    """Recorded events for a deal, oldest first; a deleted deal keeps its history"""
+    
+    events = await asyncio.to_thread(audit_log.events, deal_id)
+    if not events and not await asyncio.to_thread(deal_store.contains, deal_id):
         raise HTTPException(status_code=404, detail="Deal not found")
+    return {"deal_id": deal_id, "events": events}
+
+@app.get("/deal/{deal_id}/text")
+async def get_deal_text(
+    deal_id: str,
+    around: Optional[int] = Query(None, ge=0, description="Byte offset to centre a window on"),
+    window: int = Query(4096, ge=1, le=MAX_WINDOW, description="Window size in bytes, with around"),
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Extracted document text (UTF-8, sections separated by form feeds)
+    
+    Serves the whole text, one byte range (``Range: bytes=start-end``) or,
+    with ``around``, a JSON window of about ``window`` bytes with the section
+    and line it falls in. Offsets match the ``start``/``end`` of extraction
+    and validation evidence.
+    """
+    
+    deal_data = get_deal_or_404(deal_id)
+    text_id = (deal_data.get("extraction") or {}).get("text_id")
+    text = await asyncio.to_thread(text_store.open, text_id) if text_id else None
+    if text is None:
+        raise HTTPException(status_code=404, detail="No extracted text for this deal")
+    
+    if around is not None:
+        with text:
+            return {"deal_id": deal_id, **text.window(around, window)}
+    
+    # A text ID names one document's text for good
+    etag = f'"{text_id}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if etag_matches(if_none_match, etag):
+        text.close()
+        return Response(status_code=304, headers=headers)
+    start, end, status_code = 0, text.size, 200
+    if range_header:
+        try:
+            requested = byte_range(range_header, text.size)
+        except ValueError:
+            text.close()
+            raise HTTPException(status_code=416, detail="Range not satisfiable",
+                                headers={"Content-Range": f"bytes */{text.size}"})
+        if requested is not None:
+            start, end = requested
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end - 1}/{text.size}"
+    headers["Content-Length"] = str(end - start)
+    
+    def body():
+        with text:
+            yield from text.iter_range(start, end)
+    
+    return StreamingResponse(body(), status_code=status_code, media_type="text/plain; charset=utf-8", headers=headers)
+
+@app.post("/deal/{deal_id}/ask")
+async def ask_deal(deal_id: str, request: AskRequest):
+    """Passages of a deal's document, validations and AI explanations that best answer a question
+    
+    Quote words (``"governing law"``) to match them as a phrase. Document
+    passages carry their byte offsets, section and line, and ``highlights``
+    gives the byte spans of the question's terms in each passage.
+    """
+    
+    started = time.perf_counter()
+    if not 1 <= request.limit <= MAX_RESULTS:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_RESULTS}")
+    get_deal_or_404(deal_id)
+    sync_caches()
+    # A deal written moments ago may still be queued for indexing
+    if not await asyncio.to_thread(search_index.wait_indexed, deal_id, SEARCH_INDEX_WAIT):
+        raise HTTPException(status_code=503, detail="Search index is still catching up",
+                            headers={"Retry-After": "1"})
+    hits = await asyncio.to_thread(search_index.search, request.question, request.limit, deal_id)
+    sources = await asyncio.to_thread(search_sources, hits, request.question)
     
-    return deals_storage[deal_id]
+    return FastJSONResponse({
+        "deal_id": deal_id,
+        "question": request.question,
+        "answer": sources[0]["text"] if sources else None,
+        "sources": sources,
+        "processing_time_ms": round((time.perf_counter() - started) * 1000, 3)
+    })
 
 @app.delete("/deal/{deal_id}")
 async def delete_deal(deal_id: str):
     """Delete a deal from storage"""
     
-    if deal_id not in deals_storage:
+    deal_data = deal_store.get(deal_id)
+    if deal_data is None or not deal_store.delete(deal_id):
         raise HTTPException(status_code=404, detail="Deal not found")
+    deal_written(deal_id)
+    # Re-uploads of the same document share its text; keep it while another deal refers to it
+    text_id = (deal_data.get("extraction") or {}).get("text_id")
+    if text_id and deal_store.find_by_content_hash(deal_data["content_hash"]) is None:
+        await asyncio.to_thread(text_store.delete, text_id)
+        # A cached extraction would hand a re-upload of the document the deleted text
+        await asyncio.to_thread(extraction_cache.invalidate, text_id)
+    summary_cache.invalidate(deal_id)
+    audit_log.record(deal_id, "delete", "Deal Deleted", "Deal and its analysis results removed from storage")
     
-    del deals_storage[deal_id]
     return {"message": f"Deal {deal_id} deleted successfully"}
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and result of an upload job"""
+    
+    job = job_queue.get(job_id)
+    if job is not None:
+        return job.to_dict()
+    state = shared_job(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return state
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-Sent Events stream of job progress until the job finishes"""
+    
+    if job_queue.get(job_id) is not None:
+        events = job_queue.events(job_id)
+    elif shared_job(job_id) is not None:
+        events = poll_shared_job(job_id)
+    else:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for event in events:
+            yield f"event: {event['status']}\ndata: {json.dumps(event)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued job, or a running one at its next stage"""
+    
+    job = job_queue.cancel(job_id)
+    if job is not None:
+        # A job cancelled while queued or waiting to retry never runs again to remove its document
+        if job.status == "cancelled" and "path" in job.payload:
+            discard_upload(job.payload["path"])
+        return job.to_dict()
+    state = shared_job(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if state["status"] not in TERMINAL_STATUSES:
+        # The owning process checks for this between stages
+        deal_store.put_shared("job_cancel", job_id, {"requested_at": datetime.now().isoformat()}, ttl=SHARED_JOB_TTL)
+    return state
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Extraction, assessment, summary and deal detail cache hit/miss/eviction counters"""
+    return {
+        "extraction_cache": extraction_cache.stats(),
+        "assessment_cache": assessment_cache.stats(),
+        "summary_cache": summary_cache.stats(),
+        "deal_detail_cache": deal_detail_cache.stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, rule, extraction and storage metrics in the Prometheus text format"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {
-        "status": "healthy",
+    # Not ready (503) until the restored caches and the search index snapshot are loaded
+    ready = state_snapshot.ready and search_index.ready
+    return FastJSONResponse({
+        "status": "healthy" if ready else "starting",
+        "ready": ready,
         "timestamp": datetime.now().isoformat(),
-        "deals_in_storage": len(deals_storage),
+        "deals_in_storage": deal_store.count(),
+        "extraction_cache": extraction_cache.stats(),
+        "jobs": job_queue.stats(),
+        "cpu_executor": cpu_executor.stats(),
+        "sanctions": get_screener().stats(),
+        "audit_log": audit_log.stats(),
+        "search_index": search_index.stats(),
+        "state_snapshot": state_snapshot.stats(),
+        "admission": {"upload": upload_gate.stats(), "validate": validate_gate.stats()},
         "api_version": "1.0.0"
-    }
+    }, status_code=200 if ready else 503)
+
+install_gates(app.routes, {("/upload", "POST"): upload_gate, ("/validate", "POST"): validate_gate})
 
 if __name__ == "__main__":
     import uvicorn
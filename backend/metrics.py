@@ -0,0 +1,221 @@
+"""
+In-process metrics, exposed at /metrics in the Prometheus text format.
+
+Recording is kept to a few hundred nanoseconds so it can stay on in
+production: histograms store per-bucket counts for each label set and only
+accumulate them when rendered, and series are looked up by a plain tuple
+key. Updates rely on the GIL rather than locks; an increment can very
+rarely be lost under thread contention, but counters never go backwards.
+
+Rule timings are kept per rule ID in RULE_STATS. Process pool workers record
+into their own copy, which the executor drains after every task and merges
+into the API process (see executors.py).
+"""
+
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException
+
+# Seconds; covers sub-millisecond cache hits up to slow uploads
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+class HistogramSeries:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Histogram:
+    """Latency histogram with one series per label value tuple"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple[Any, ...], HistogramSeries] = {}
+
+    def labels(self, *values: Any) -> HistogramSeries:
+        series = self.series.get(values)
+        if series is None:
+            series = self.series[values] = HistogramSeries(self.buckets)
+        return series
+
+    def observe(self, value: float, *values: Any) -> None:
+        self.labels(*values).observe(value)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for values, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labelnames, values)} {_number(series.sum)}"
+            yield f"{self.name}_count{_label_text(self.labelnames, values)} {series.count}"
+
+class Gauge:
+    """Current value per label value tuple, e.g. requests in flight"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.kind = kind
+        self.values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, *values: Any, amount: float = 1) -> None:
+        self.values[values] = self.values.get(values, 0) + amount
+
+    def dec(self, *values: Any, amount: float = 1) -> None:
+        self.values[values] = self.values.get(values, 0) - amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, value in sorted(self.values.items()):
+            yield f"{self.name}{_label_text(self.labelnames, values)} {_number(value)}"
+
+class RuleCounter:
+    """Evaluation count, time and outcome counts for one rule ID"""
+
+    __slots__ = ("evaluations", "seconds", "outcomes")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.seconds = 0.0
+        self.outcomes: Dict[Optional[str], int] = {}
+
+class RuleStats:
+    def __init__(self):
+        self.rules: Dict[str, RuleCounter] = {}
+
+    def counter(self, rule_id: str) -> RuleCounter:
+        """The shared counter for a rule, bound once by each compiled rule"""
+        counter = self.rules.get(rule_id)
+        if counter is None:
+            counter = self.rules[rule_id] = RuleCounter()
+        return counter
+
+    def drain(self) -> Dict[str, Tuple[int, float, Dict[Optional[str], int]]]:
+        """Take the counts recorded since the last drain, resetting them to zero"""
+        delta = {}
+        for rule_id, counter in self.rules.items():
+            if counter.evaluations:
+                delta[rule_id] = (counter.evaluations, counter.seconds, counter.outcomes)
+                counter.evaluations = 0
+                counter.seconds = 0.0
+                counter.outcomes = {}
+        return delta
+
+    def merge(self, delta: Dict[str, Tuple[int, float, Dict[Optional[str], int]]]) -> None:
+        for rule_id, (evaluations, seconds, outcomes) in delta.items():
+            counter = self.counter(rule_id)
+            counter.evaluations += evaluations
+            counter.seconds += seconds
+            for code, count in outcomes.items():
+                counter.outcomes[code] = counter.outcomes.get(code, 0) + count
+
+    def render(self) -> Iterable[str]:
+        rules = sorted(self.rules.items())
+        yield "# HELP deal_rule_evaluations_total Times each validation rule was evaluated"
+        yield "# TYPE deal_rule_evaluations_total counter"
+        for rule_id, counter in rules:
+            yield f'deal_rule_evaluations_total{{rule="{rule_id}"}} {counter.evaluations}'
+        yield "# HELP deal_rule_seconds_total Time spent evaluating each validation rule"
+        yield "# TYPE deal_rule_seconds_total counter"
+        for rule_id, counter in rules:
+            yield f'deal_rule_seconds_total{{rule="{rule_id}"}} {_number(counter.seconds)}'
+        yield "# HELP deal_rule_outcomes_total Rule evaluations by outcome code (none = no validation produced)"
+        yield "# TYPE deal_rule_outcomes_total counter"
+        for rule_id, counter in rules:
+            for code, count in sorted(counter.outcomes.items(), key=lambda item: item[0] or ""):
+                yield f'deal_rule_outcomes_total{{rule="{rule_id}",outcome="{code or "none"}"}} {count}'
+
+RULE_STATS = RuleStats()
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template, method and status",
+    ("route", "method", "status")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ("route", "method"))
+EXTRACTION_SECONDS = Histogram(
+    "deal_extraction_seconds", "Field extraction time per document", ("cached",)
+)
+STORAGE_SECONDS = Histogram(
+    "deal_store_operation_seconds", "Deal store operation latency", ("operation",)
+)
+
+REGISTRY: List[Any] = [HTTP_REQUEST_SECONDS, HTTP_IN_FLIGHT, EXTRACTION_SECONDS, STORAGE_SECONDS, RULE_STATS]
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class InstrumentedRoute(APIRoute):
+    """API route that records its latency histogram and in-flight count
+
+    Installed as the app's route class, so the route template is known up
+    front without re-matching the path. Latency covers the full response,
+    including streamed bodies.
+    """
+
+    async def handle(self, scope, receive, send) -> None:
+        method = scope["method"]
+        in_flight = HTTP_IN_FLIGHT.values
+        key = (self.path, method)
+        in_flight[key] = in_flight.get(key, 0) + 1
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await super().handle(scope, receive, send_with_status)
+        except HTTPException as exc:
+            # Rendered by the exception middleware outside the route
+            status = exc.status_code
+            raise
+        except RequestValidationError:
+            status = 422
+            raise
+        finally:
+            HTTP_REQUEST_SECONDS.labels(self.path, method, status).observe(time.perf_counter() - started)
+            in_flight[key] -= 1
@@ -0,0 +1,163 @@
+"""
+Parse-once normalization of extracted deal fields.
+
+The extracted strings are parsed a single time at upload into a typed
+NormalizedDeal record (dates, numeric notional and rate, currency enum,
+counterparty flags and sanctions screening, derived day counts). Validation,
+simulation, summary and benchmark generation read the record instead of
+re-parsing the strings, and any parse errors are recorded once on the record.
+"""
+
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from rules import DATE_FORMAT
+from sanctions import get_screener
+
+class Currency(str, Enum):
+    USD = "USD"
+    EUR = "EUR"
+    GBP = "GBP"
+    JPY = "JPY"
+    CHF = "CHF"
+    CAD = "CAD"
+    AUD = "AUD"
+
+_CURRENCIES = {c.value: c for c in Currency}
+_DATE_FIELDS = ("trade_date", "maturity_date", "settlement_date")
+_RAW_FIELDS = ("counterparty", "notional_amount", "currency", "interest_rate", "trade_date",
+               "maturity_date", "settlement_date", "collateral", "termination_clause")
+
+# NormalizedDeal attributes each extracted field sets or feeds into (every field counts toward fields_present)
+FIELD_ATTRIBUTES = {field: attributes + ("fields_present",) for field, attributes in {
+    "counterparty": ("counterparty", "counterparty_sanctioned", "counterparty_is_bank",
+                     "sanctions_match", "sanctions_version"),
+    "notional_amount": ("notional_amount", "notional"),
+    "currency": ("currency_code", "currency"),
+    "interest_rate": ("interest_rate", "rate"),
+    "trade_date": ("trade_date", "settlement_days", "tenor_days"),
+    "maturity_date": ("maturity_date", "tenor_days"),
+    "settlement_date": ("settlement_date", "settlement_days"),
+    "collateral": ("collateral",),
+    "termination_clause": ("termination_clause",),
+}.items()}
+
+def source_fields(attributes: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Extracted fields the given NormalizedDeal attributes are parsed from, in attribute order"""
+    fields: List[str] = []
+    for attribute in attributes:
+        for field in _RAW_FIELDS:
+            if attribute in FIELD_ATTRIBUTES[field] and attribute != "fields_present" and field not in fields:
+                fields.append(field)
+    return tuple(fields)
+
+class NormalizedDeal(BaseModel):
+    # Extracted text, kept for messages and snippets
+    counterparty: Optional[str] = None
+    notional_amount: Optional[str] = None
+    interest_rate: Optional[str] = None
+    collateral: Optional[str] = None
+    termination_clause: Optional[str] = None
+    currency_code: Optional[str] = None
+
+    # Typed values
+    notional: Optional[float] = None
+    rate: Optional[float] = None
+    currency: Optional[Currency] = None
+    trade_date: Optional[date] = None
+    maturity_date: Optional[date] = None
+    settlement_date: Optional[date] = None
+
+    # Precomputed flags and day counts
+    counterparty_sanctioned: bool = False
+    counterparty_is_bank: bool = False
+    sanctions_match: Optional[Dict[str, Any]] = None
+    sanctions_version: Optional[str] = None
+    settlement_days: Optional[int] = None
+    tenor_days: Optional[int] = None
+    fields_present: int = 0
+
+    parse_errors: Dict[str, str] = {}
+
+    def with_changes(self, fields: Dict[str, Any], changes: Dict[str, Any]) -> "NormalizedDeal":
+        """Apply raw field edits on top of ``fields``, re-parsing only the fields that changed"""
+        raw = {**fields, **changes}
+        values = self.model_dump()
+        errors = {k: v for k, v in self.parse_errors.items() if k not in changes}
+        for field in changes:
+            if field in _RAW_FIELDS:
+                values.update(_parse_field(field, raw.get(field), errors))
+        values["parse_errors"] = errors
+        values.update(_derived(values, raw))
+        return NormalizedDeal.model_construct(**values)
+
+def normalize_fields(fields: Dict[str, Any]) -> NormalizedDeal:
+    """Build the typed record for a set of extracted fields"""
+    values: Dict[str, Any] = {}
+    errors: Dict[str, str] = {}
+    for field in _RAW_FIELDS:
+        values.update(_parse_field(field, fields.get(field), errors))
+    values["parse_errors"] = errors
+    values.update(_derived(values, fields))
+    return NormalizedDeal.model_construct(**values)
+
+def _parse_field(field: str, raw: Optional[str], errors: Dict[str, str]) -> Dict[str, Any]:
+    if raw is not None and not isinstance(raw, str):
+        raw = str(raw)
+    if raw is not None and not raw.strip():
+        raw = None
+
+    if field in _DATE_FIELDS:
+        parsed = None
+        if raw:
+            try:
+                parsed = datetime.strptime(raw.strip(), DATE_FORMAT).date()
+            except ValueError:
+                errors[field] = f"Invalid date '{raw}', expected {DATE_FORMAT}"
+        return {field: parsed}
+
+    if field == "notional_amount":
+        notional = None
+        if raw:
+            try:
+                notional = float(raw)
+            except ValueError:
+                errors[field] = f"Invalid notional amount '{raw}'"
+        return {"notional_amount": raw, "notional": notional}
+
+    if field == "interest_rate":
+        rate = None
+        if raw:
+            try:
+                rate = float(raw.strip().rstrip("%"))
+            except ValueError:
+                errors[field] = f"Invalid interest rate '{raw}'"
+        return {"interest_rate": raw, "rate": rate}
+
+    if field == "currency":
+        code = raw
+        return {"currency_code": code, "currency": _CURRENCIES.get(code)}
+
+    if field == "counterparty":
+        counterparty = raw.strip() if raw else None
+        screening = get_screener().screen(counterparty, limit=1) if counterparty else None
+        return {
+            "counterparty": counterparty,
+            "counterparty_sanctioned": bool(screening and screening["sanctioned"]),
+            "sanctions_match": screening["matches"][0] if screening and screening["matches"] else None,
+            "sanctions_version": screening["watchlist_version"] if screening else None,
+            "counterparty_is_bank": bool(counterparty) and "Bank" in counterparty
+        }
+
+    return {field: raw}
+
+def _derived(values: Dict[str, Any], raw: Dict[str, Any]) -> Dict[str, Any]:
+    trade, maturity, settlement = values.get("trade_date"), values.get("maturity_date"), values.get("settlement_date")
+    return {
+        "settlement_days": (settlement - trade).days if trade and settlement else None,
+        "tenor_days": (maturity - trade).days if trade and maturity else None,
+        "fields_present": sum(1 for field in _RAW_FIELDS if raw.get(field))
+    }
@@ -0,0 +1,56 @@
+"""
+Portfolio exposure views.
+
+The deal store keeps one aggregate (notional and deal count) per
+counterparty, currency, risk bucket and maturity month, split by deal
+currency, and applies each write's delta to them (see storage.py). The
+views here only reshape those aggregates, so reading them costs the same
+however many deals are booked. Notionals are never converted between
+currencies; every total is reported per currency.
+"""
+
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+# Maturity ladder rungs: (label, first month offset, end month offset), by months from now
+LADDER_RUNGS: Tuple[Tuple[str, Optional[int], Optional[int]], ...] = (
+    ("matured", None, 0),
+    ("0-3M", 0, 3),
+    ("3-6M", 3, 6),
+    ("6-12M", 6, 12),
+    ("1-2Y", 12, 24),
+    ("2-5Y", 24, 60),
+    ("5Y+", 60, None),
+)
+
+def by_key(rows: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """``{key: {currency: {notional, deals}}}`` for one dimension's aggregates"""
+    grouped: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    for row in rows:
+        grouped.setdefault(row["key"], {})[row["currency"]] = {"notional": row["notional"], "deals": row["deals"]}
+    return grouped
+
+def _rung(month: str, today: date) -> str:
+    year, month_number = (int(part) for part in month.split("-"))
+    offset = (year - today.year) * 12 + month_number - today.month
+    for label, start, end in LADDER_RUNGS:
+        if (start is None or offset >= start) and (end is None or offset < end):
+            return label
+    return LADDER_RUNGS[-1][0]
+
+def maturity_ladder(rows: List[Dict[str, Any]], today: date) -> List[Dict[str, Any]]:
+    """Maturity-month aggregates bucketed into LADDER_RUNGS relative to ``today``
+
+    Months are the finest grain kept, so a deal maturing earlier this month
+    counts in the first rung rather than as matured.
+    """
+    rungs: Dict[str, Dict[str, Any]] = {label: {"rung": label, "deals": 0, "by_currency": {}}
+                                        for label, _, _ in LADDER_RUNGS}
+    rungs["unknown"] = {"rung": "unknown", "deals": 0, "by_currency": {}}
+    for row in rows:
+        rung = rungs["unknown" if row["key"] == "unknown" else _rung(row["key"], today)]
+        rung["deals"] += row["deals"]
+        totals = rung["by_currency"].setdefault(row["currency"], {"notional": 0.0, "deals": 0})
+        totals["notional"] += row["notional"]
+        totals["deals"] += row["deals"]
+    return list(rungs.values())
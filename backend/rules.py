@@ -0,0 +1,416 @@
+"""
+Declarative validation rules and the compiled rule-set evaluator.
+
+Every rule is plain data: the NormalizedDeal attributes it depends on, a
+classifier that maps those values onto an outcome code, and per-outcome status, severity,
+impact and message templates. A rule set (the defaults plus any per-desk
+overrides from the CustomizableRules panel) is compiled once into a flat
+list of steps and cached under a hash of its configuration, so requests that
+send a rule_set_id pay nothing extra once it has been compiled.
+"""
+
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import RULE_STATS
+
+CRITICAL_FIELDS = ["counterparty", "notional_amount", "interest_rate"]
+VALID_CURRENCIES = ["USD", "EUR", "GBP", "JPY", "CHF", "CAD", "AUD"]
+HIGH_RISK_ENTITIES = ["Sanctioned Corp", "Blocked Entity Ltd", "Restricted Bank"]
+
+DATE_FORMAT = "%Y-%m-%d"
+DEFAULT_RULE_SET_ID = "default"
+
+# Seed the mock AI noise from each document's content hash so identical inputs score identically
+DETERMINISTIC_SCORING = os.getenv("DETERMINISTIC_SCORING", "false").lower() == "true"
+
+INTEREST_RATE_EXPLANATION = {
+    "reasoning": "Interest rate is fundamental for derivative pricing and risk calculation. Without it, the deal cannot be properly valued or hedged.",
+    "regulation": "ISDA Master Agreement Section 4.3 requires explicit rate specification",
+    "recommendation": "Contact counterparty to confirm rate terms before proceeding"
+}
+
+def risk_level_for(risk_score: int) -> str:
+    """Map a clamped risk score onto its risk level label"""
+    if risk_score <= 30:
+        return "Low Risk"
+    elif risk_score <= 60:
+        return "Medium Risk"
+    return "High Risk"
+
+def noise_seed(content_hash: Optional[str]) -> Optional[str]:
+    """Seed for a document's mock AI noise, or None when scoring is not deterministic"""
+    return content_hash if DETERMINISTIC_SCORING and content_hash else None
+
+def noise_source(seed: Optional[str], purpose: str) -> Any:
+    """Random source for one kind of mock AI noise, reproducible when seeded"""
+    return random.Random(f"{seed}:{purpose}") if seed else random
+
+def finalize_score(raw_score: int, seed: Optional[str] = None) -> Tuple[int, str]:
+    """Add AI uncertainty noise, clamp to 0-100 and derive the risk level"""
+    if seed:
+        noise = hashlib.sha256(f"{seed}:score".encode("utf-8")).digest()[0] % 11 - 5
+    else:
+        noise = random.randint(-5, 5)
+    risk_score = raw_score + noise
+    risk_score = max(0, min(100, risk_score))
+    return risk_score, risk_level_for(risk_score)
+
+class RuleOutcome:
+    """One possible result of a rule, with the validation it produces"""
+
+    def __init__(self, status: str, severity: str, confidence: float, standard_value: str,
+                 explanation: str, snippet: str, impact: int = 0, field: Optional[str] = None,
+                 ai_explanation: Optional[Dict[str, str]] = None):
+        self.status = status
+        self.severity = severity
+        self.confidence = confidence
+        self.standard_value = standard_value
+        self.explanation = explanation
+        self.snippet = snippet
+        self.impact = impact
+        self.field = field
+        self.ai_explanation = ai_explanation
+
+    def copy(self, **changes) -> "RuleOutcome":
+        outcome = RuleOutcome(**self.__dict__)
+        outcome.__dict__.update(changes)
+        return outcome
+
+class Rule:
+    """A validation rule defined as data"""
+
+    def __init__(self, rule_id: str, name: str, field: str, depends_on: Tuple[str, ...],
+                 classify: Callable[[Tuple[Any, ...], Dict[str, Any]], Optional[str]],
+                 outcomes: Dict[str, RuleOutcome], primary: Optional[str] = None,
+                 params: Optional[Dict[str, Any]] = None,
+                 context: Optional[Callable[[Tuple[Any, ...], Dict[str, Any]], Dict[str, Any]]] = None,
+                 enabled: bool = True, description: str = ""):
+        self.rule_id = rule_id
+        self.name = name
+        self.field = field
+        self.depends_on = depends_on
+        self.classify = classify
+        self.outcomes = outcomes
+        self.primary = primary
+        self.params = params or {}
+        self.context = context
+        self.enabled = enabled
+        self.description = description
+
+    def describe(self) -> Dict[str, Any]:
+        primary = self.outcomes.get(self.primary) if self.primary else None
+        return {
+            "id": self.rule_id,
+            "name": self.name,
+            "description": self.description,
+            "depends_on": list(self.depends_on),
+            "enabled": self.enabled,
+            "severity": primary.severity if primary else None,
+            "impact": primary.impact if primary else 0,
+            "params": dict(self.params)
+        }
+
+# Classifiers: map a rule's values from the normalized deal record onto an
+# outcome code (None = no validation)
+
+def _missing(values, params):
+    return "present" if values[0] else "missing"
+
+def _date_sequence(values, params):
+    trade, maturity = values
+    if not (trade and maturity):
+        return None
+    return "error" if trade >= maturity else "valid"
+
+def _currency_code(values, params):
+    currency = values[0]
+    if not currency:
+        return None
+    return "valid" if currency in params["valid_currencies"] else "warning"
+
+def _counterparty_type(values, params):
+    counterparty, sanctioned, is_bank = values
+    if not counterparty:
+        return None
+    if sanctioned:
+        return "sanctioned"
+    if not is_bank:
+        return "non_bank"
+    return "bank"
+
+def _notional_limit(values, params):
+    raw, notional = values
+    if not raw:
+        return None
+    if notional is None:
+        return "invalid"
+    return "large" if notional > params["threshold"] else "within"
+
+def _settlement_period(values, params):
+    days = values[0]
+    if days is None:
+        return None
+    if days == params["standard_days"]:
+        return "standard"
+    if days > params["extended_days"]:
+        return "extended"
+    return None
+
+def _collateral_required(values, params):
+    notional, collateral = values
+    if notional is None or notional <= params["threshold"]:
+        return None
+    return "present" if collateral else "missing"
+
+# Template context builders, only called when a validation is materialized
+
+def _value_context(values, params):
+    return {"value": values[0]}
+
+def _dates_context(values, params):
+    return {"trade_date": values[0].isoformat(), "maturity_date": values[1].isoformat()}
+
+def _notional_context(values, params):
+    return {"value": values[0], "notional": values[1], "threshold_label": f"${params['threshold'] / 1e6:g}M"}
+
+def _settlement_context(values, params):
+    return {"days": values[0]}
+
+def _critical_field_rule(rule_id: str, field: str, impact: int, severity: str,
+                         standard_value: str, description: str) -> Rule:
+    label = field.replace("_", " ").title()
+    missing = RuleOutcome(
+        "error", severity, 0.95, standard_value,
+        f"Missing {field.replace('_', ' ')} - critical for risk assessment",
+        f'"{label}: [MISSING]" - Field not found in document', impact=impact,
+        ai_explanation=INTEREST_RATE_EXPLANATION if field == "interest_rate" else None
+    )
+    present = RuleOutcome(
+        "valid", "low", 0.98, "Present", f"{label} properly specified",
+        f'"{label}: {{value}}" - Successfully extracted'
+    )
+    return Rule(rule_id, f"{label} Required", label, (field,), _missing,
+                {"missing": missing, "present": present}, primary="missing",
+                context=_value_context, description=description)
+
+# Evaluation order matches the validations list the API has always returned
+DEFAULT_RULES: List[Rule] = [
+    _critical_field_rule("counterparty-required", "counterparty", 20, "medium", "Present",
+                         "Require the counterparty to be identified"),
+    _critical_field_rule("notional-required", "notional_amount", 20, "medium", "Present",
+                         "Require the notional amount to be specified"),
+    _critical_field_rule("interest-rate", "interest_rate", 30, "high", "Required",
+                         "Enforce that all deals must specify an interest rate"),
+    Rule("date-consistency", "Date Consistency", "Date Consistency", ("trade_date", "maturity_date"),
+         _date_sequence, {
+             "error": RuleOutcome(
+                 "error", "high", 0.99, "Trade < Maturity", "Trade date must be before maturity date",
+                 '"Trade Date: {trade_date}, Maturity Date: {maturity_date}" - Invalid sequence', impact=25),
+             "valid": RuleOutcome(
+                 "valid", "low", 0.99, "Trade < Maturity", "Trade and maturity dates are consistent",
+                 '"Trade Date: {trade_date}, Maturity Date: {maturity_date}" - Valid sequence'),
+         }, primary="error", context=_dates_context,
+         description="Trade date must precede maturity date"),
+    Rule("currency-validation", "Currency Code Validation", "Currency", ("currency_code",),
+         _currency_code, {
+             "valid": RuleOutcome(
+                 "valid", "low", 0.99, "ISO 4217", "Currency code follows ISO 4217 standard",
+                 '"Currency: {value}" - Valid ISO code'),
+             "warning": RuleOutcome(
+                 "warning", "medium", 0.85, "ISO 4217", "Non-standard currency code detected",
+                 '"Currency: {value}" - Non-standard code', impact=15),
+         }, primary="warning", params={"valid_currencies": VALID_CURRENCIES}, context=_value_context,
+         description="Ensure currency codes follow ISO standards"),
+    Rule("counterparty-verification", "Counterparty Verification", "Counterparty",
+         ("counterparty", "counterparty_sanctioned", "counterparty_is_bank"),
+         _counterparty_type, {
+             "sanctioned": RuleOutcome(
+                 "error", "high", 0.92, "Clean entity", "Entity appears on sanctions watchlist",
+                 '"Counterparty: {value}" - Flagged in sanctions database', impact=50,
+                 field="Counterparty Sanctions"),
+             "non_bank": RuleOutcome(
+                 "warning", "medium", 0.78, "Financial institution",
+                 "Non-bank counterparty may require additional due diligence",
+                 '"Counterparty: {value}" - Non-bank entity', impact=10, field="Counterparty Type"),
+             "bank": RuleOutcome(
+                 "valid", "low", 0.88, "Financial institution",
+                 "Counterparty appears to be legitimate financial institution",
+                 '"Counterparty: {value}" - Verified bank entity', field="Counterparty Verification"),
+         }, primary="sanctioned", context=_value_context, description="Require full sanctions database verification"),
+    Rule("notional-limits", "Notional Amount Limits", "Notional Amount", ("notional_amount", "notional"),
+         _notional_limit, {
+             "large": RuleOutcome(
+                 "warning", "medium", 0.95, "< {threshold_label}",
+                 "Large notional amount increases exposure risk",
+                 '"Notional Amount: ${notional:,.0f}" - Exceeds threshold', impact=15),
+             "within": RuleOutcome(
+                 "valid", "low", 0.95, "< {threshold_label}",
+                 "Notional amount within acceptable risk parameters",
+                 '"Notional Amount: ${notional:,.0f}" - Within limits'),
+             "invalid": RuleOutcome(
+                 "error", "high", 0.99, "Numeric format", "Invalid notional amount format",
+                 '"Notional Amount: {value}" - Invalid format', impact=20),
+         }, primary="large", params={"threshold": 100000000}, context=_notional_context,
+         description="Flag deals exceeding the notional amount threshold"),
+    Rule("settlement-period", "Settlement Period Check", "Settlement Period", ("settlement_days",),
+         _settlement_period, {
+             "standard": RuleOutcome(
+                 "valid", "low", 0.95, "T+2", "T+2 settlement aligns with market standards",
+                 '"Settlement: T+{days}" - Standard period'),
+             "extended": RuleOutcome(
+                 "warning", "medium", 0.88, "T+2", "Extended settlement period may increase counterparty risk",
+                 '"Settlement: T+{days}" - Extended period', impact=10),
+         }, primary="extended", params={"standard_days": 2, "extended_days": 5},
+         context=_settlement_context, description="Validate settlement dates against market standards"),
+    Rule("collateral-requirements", "Collateral Requirements", "Collateral", ("notional", "collateral"),
+         _collateral_required, {
+             "missing": RuleOutcome(
+                 "warning", "medium", 0.90, "Collateral specified",
+                 "High-value deal has no collateral specified",
+                 '"Collateral: [MISSING]" - Required above {threshold_label}', impact=18),
+             "present": RuleOutcome(
+                 "valid", "low", 0.95, "Collateral specified", "Collateral specified for high-value deal",
+                 '"Collateral: {collateral}" - Specified'),
+         }, primary="missing", params={"threshold": 50000000},
+         context=lambda values, params: {"collateral": values[1], "threshold_label": f"${params['threshold'] / 1e6:g}M"},
+         enabled=False, description="Require collateral specification for high-value deals"),
+]
+
+RULES_BY_ID = {rule.rule_id: rule for rule in DEFAULT_RULES}
+
+class CompiledRule:
+    """A rule with its overrides resolved, ready for evaluation"""
+
+    __slots__ = ("rule_id", "depends_on", "classify", "params", "outcomes", "impacts", "context", "stats")
+
+    def __init__(self, rule: Rule, override: Dict[str, Any]):
+        self.rule_id = rule.rule_id
+        self.depends_on = rule.depends_on
+        self.classify = rule.classify
+        self.params = {**rule.params, **override.get("params", {})}
+        self.context = rule.context
+        self.stats = RULE_STATS.counter(rule.rule_id)
+
+        outcome_impacts = dict(override.get("outcome_impacts", {}))
+        if "impact" in override and rule.primary:
+            outcome_impacts.setdefault(rule.primary, override["impact"])
+
+        self.outcomes: Dict[str, RuleOutcome] = {}
+        for code, outcome in rule.outcomes.items():
+            changes = {"field": outcome.field or rule.field}
+            if code in outcome_impacts:
+                changes["impact"] = int(outcome_impacts[code])
+            if code == rule.primary and "severity" in override:
+                changes["severity"] = override["severity"]
+            self.outcomes[code] = outcome.copy(**changes)
+        self.impacts = {code: outcome.impact for code, outcome in self.outcomes.items() if outcome.impact}
+
+    def values(self, record: Any) -> Tuple[Any, ...]:
+        return tuple(getattr(record, name) for name in self.depends_on)
+
+    def materialize(self, code: str, values: Tuple[Any, ...]) -> Dict[str, Any]:
+        """Build the validation dict for an outcome code"""
+        outcome = self.outcomes[code]
+        context = self.context(values, self.params) if self.context else {}
+        return {
+            "rule_id": self.rule_id,
+            "field": outcome.field,
+            "status": outcome.status,
+            "explanation": outcome.explanation,
+            "severity": outcome.severity,
+            "confidence": outcome.confidence,
+            "standard_value": outcome.standard_value.format_map(context),
+            "document_snippet": outcome.snippet.format_map(context)
+        }
+
+class RuleEvaluation:
+    """Result of running a compiled rule set over one deal"""
+
+    def __init__(self, raw_score: int, hits: List[Tuple[CompiledRule, str, Tuple[Any, ...]]]):
+        self.raw_score = raw_score
+        self.hits = hits
+
+    def validations(self) -> List[Dict[str, Any]]:
+        return [step.materialize(code, values) for step, code, values in self.hits]
+
+    def ai_explanations(self) -> Dict[str, Dict[str, str]]:
+        explanations = {}
+        for step, code, _ in self.hits:
+            outcome = step.outcomes[code]
+            if outcome.ai_explanation:
+                explanations[step.depends_on[0]] = dict(outcome.ai_explanation)
+        return explanations
+
+class CompiledRuleSet:
+    """A rule configuration compiled into a single-pass evaluator"""
+
+    def __init__(self, rule_set_id: str, overrides: Dict[str, Dict[str, Any]]):
+        self.rule_set_id = rule_set_id
+        self.overrides = overrides
+        self.steps: List[CompiledRule] = []
+        for rule in DEFAULT_RULES:
+            override = overrides.get(rule.rule_id, {})
+            if override.get("enabled", rule.enabled):
+                self.steps.append(CompiledRule(rule, override))
+
+    def evaluate(self, record: Any) -> RuleEvaluation:
+        """Classify every enabled rule once against a normalized deal record"""
+        raw_score = 0
+        hits = []
+        # One clock read per rule: each rule is charged from the end of the previous one
+        clock = time.perf_counter
+        last = clock()
+        for step in self.steps:
+            values = tuple(getattr(record, name) for name in step.depends_on)
+            code = step.classify(values, step.params)
+            now = clock()
+            stats = step.stats
+            stats.evaluations += 1
+            stats.seconds += now - last
+            stats.outcomes[code] = stats.outcomes.get(code, 0) + 1
+            last = now
+            if code is not None:
+                raw_score += step.impacts.get(code, 0)
+                hits.append((step, code, values))
+        return RuleEvaluation(raw_score, hits)
+
+    def describe(self) -> Dict[str, Any]:
+        rules = []
+        for rule in DEFAULT_RULES:
+            description = rule.describe()
+            override = self.overrides.get(rule.rule_id, {})
+            description.update({k: v for k, v in override.items() if k in ("enabled", "severity", "impact")})
+            description["params"].update(override.get("params", {}))
+            rules.append(description)
+        return {"rule_set_id": self.rule_set_id, "rules": rules}
+
+_compiled_rule_sets: Dict[str, CompiledRuleSet] = {}
+
+def rule_set_id_for(overrides: Dict[str, Dict[str, Any]]) -> str:
+    """Content hash of a rule configuration"""
+    if not overrides:
+        return DEFAULT_RULE_SET_ID
+    canonical = json.dumps(overrides, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+def register_rule_set(overrides: Dict[str, Dict[str, Any]]) -> CompiledRuleSet:
+    """Compile a rule configuration, reusing the cached one if already seen"""
+    unknown = [rule_id for rule_id in overrides if rule_id not in RULES_BY_ID]
+    if unknown:
+        raise KeyError(f"Unknown rule(s): {', '.join(sorted(unknown))}")
+
+    rule_set_id = rule_set_id_for(overrides)
+    if rule_set_id not in _compiled_rule_sets:
+        _compiled_rule_sets[rule_set_id] = CompiledRuleSet(rule_set_id, overrides)
+    return _compiled_rule_sets[rule_set_id]
+
+def get_rule_set(rule_set_id: Optional[str] = None) -> CompiledRuleSet:
+    """Look up a compiled rule set; raises KeyError for unknown IDs"""
+    return _compiled_rule_sets[rule_set_id or DEFAULT_RULE_SET_ID]
+
+register_rule_set({})
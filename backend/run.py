@@ -1,27 +1,37 @@
 #!/usr/bin/env python3
 """
 Development server runner for AI Deal Checker Backend
+
+Set WORKERS to serve from several processes. They share the SQLite deal
+store (DEAL_STORE=sqlite), so any process can serve any deal; reload is
+turned off in that mode.
 """
 
 import uvicorn
 import os
-from main import app
+import sys
 
 if __name__ == "__main__":
     # Get configuration from environment variables
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 8000))
-    reload = os.getenv("RELOAD", "true").lower() == "true"
-    
+    workers = int(os.getenv("WORKERS", 1))
+    reload = os.getenv("RELOAD", "true").lower() == "true" and workers == 1
+
+    if workers > 1 and os.getenv("DEAL_STORE", "sqlite").lower() != "sqlite":
+        sys.exit("WORKERS > 1 needs the shared SQLite deal store (DEAL_STORE=sqlite)")
+
     print(f"🚀 Starting AI Deal Checker Backend API")
     print(f"📍 Server: http://{host}:{port}")
     print(f"📚 Docs: http://{host}:{port}/docs")
     print(f"🔄 Reload: {reload}")
-    
+    print(f"👷 Workers: {workers}")
+
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
         log_level="info"
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,357 @@
+"""
+Sanctions screening against a local watchlist.
+
+Watchlist names and aliases are normalized (case, accents, punctuation and
+legal-form suffixes such as "Ltd" or "GmbH") and compiled into two indexes:
+
+* a token-level Aho-Corasick automaton, which finds every listed name that
+  occurs as a whole-word phrase anywhere in a counterparty string in one
+  pass over its tokens, and
+* a character trigram index for fuzzy matches, scored by the Dice
+  coefficient. Names are numbered in order of trigram count, so the length
+  filter is a slice of each sorted posting list, and a candidate must
+  appear in several of the query's rarest lists before it is verified.
+
+The compiled index is pickled next to the watchlist and reused on restart
+while the watchlist content is unchanged. ``SanctionsScreener.reload``
+builds a fresh index and swaps it in atomically, so screening continues
+against the old list until the new one is ready.
+
+Watchlist files are either plain text (one name per line) or CSV with a
+``name`` column and optional ``id``, ``aliases`` (separated by ``;``) and
+``source`` columns. Without a watchlist the built-in HIGH_RISK_ENTITIES
+list is used.
+"""
+
+import csv
+import hashlib
+import math
+import os
+import pickle
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import deque
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Tuple
+
+from rules import HIGH_RISK_ENTITIES
+
+SNAPSHOT_VERSION = 1
+DEFAULT_FUZZY_THRESHOLD = 0.85
+# Posting lists beyond the prefix-filter minimum used to prune fuzzy candidates
+FUZZY_EXTRA_LISTS = 2
+
+LEGAL_SUFFIXES = frozenset((
+    "ab", "ag", "as", "bv", "co", "company", "corp", "corporation", "gmbh", "inc",
+    "incorporated", "jsc", "kg", "kk", "llc", "llp", "lp", "ltd", "limited", "nv",
+    "oao", "ojsc", "ooo", "oy", "pjsc", "plc", "pte", "pty", "sa", "sarl", "sas",
+    "spa", "srl", "zao"
+))
+
+_DROP = {ord("."): None, ord("'"): None, ord("’"): None}
+
+def normalize_name(name: str) -> List[str]:
+    """Lower-cased, accent-free tokens of a name with legal suffixes removed"""
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower().translate(_DROP)
+    text = "".join(c if c.isalnum() else " " for c in text)
+    tokens = text.split()
+    stripped = [t for t in tokens if t not in LEGAL_SUFFIXES]
+    # A name made only of legal-form words ("The Company") keeps them
+    return stripped or tokens
+
+def _grams(text: str) -> set:
+    padded = f" {text} "
+    return set(map("".join, zip(padded, padded[1:], padded[2:])))
+
+class WatchlistEntry:
+    __slots__ = ("entry_id", "name", "aliases", "source")
+
+    def __init__(self, entry_id: str, name: str, aliases: List[str], source: Optional[str]):
+        self.entry_id = entry_id
+        self.name = name
+        self.aliases = aliases
+        self.source = source
+
+def load_watchlist(path: str) -> List[WatchlistEntry]:
+    """Read a plain-text or CSV watchlist file"""
+    entries = []
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for i, row in enumerate(csv.DictReader(f)):
+                name = (row.get("name") or "").strip()
+                if not name:
+                    continue
+                aliases = [a.strip() for a in (row.get("aliases") or "").split(";") if a.strip()]
+                entries.append(WatchlistEntry(row.get("id") or str(i), name, aliases, row.get("source") or None))
+        else:
+            for i, line in enumerate(f):
+                name = line.strip()
+                if name and not name.startswith("#"):
+                    entries.append(WatchlistEntry(str(i), name, [], None))
+    return entries
+
+class WatchlistIndex:
+    """Aho-Corasick automaton and trigram index over normalized watchlist names"""
+
+    def __init__(self, entries: List[WatchlistEntry], version: str):
+        self.version = version
+        self.entries = entries
+        self.names: List[str] = []           # normalized name / alias strings, by trigram count
+        self.name_entry = array("I")         # name id -> entry index
+        self.size_starts = array("I")        # trigram count -> first name id with at least that many
+        self.vocab: Dict[str, int] = {}
+        self.goto: Dict[int, int] = {}       # (node << 32 | token id) -> child node
+        self.fail = array("I", [0])
+        self.output: Dict[int, Tuple[int, ...]] = {}
+        self.postings: Dict[str, array] = {}  # trigram -> ascending name ids
+
+        names = []
+        seen = set()
+        for entry_index, entry in enumerate(entries):
+            for raw in [entry.name, *entry.aliases]:
+                tokens = normalize_name(raw)
+                text = " ".join(tokens)
+                if text and (entry_index, text) not in seen:
+                    seen.add((entry_index, text))
+                    names.append((len(_grams(text)), text, tokens, entry_index))
+        names.sort(key=lambda n: n[0])
+
+        children: List[List[int]] = [[]]
+        for name_id, (size, text, tokens, entry_index) in enumerate(names):
+            while len(self.size_starts) <= size:
+                self.size_starts.append(name_id)
+            self.names.append(text)
+            self.name_entry.append(entry_index)
+            self._insert(tokens, name_id, children)
+            for gram in _grams(text):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    posting = self.postings[gram] = array("I")
+                posting.append(name_id)
+        self.size_starts.append(len(names))
+        self._link(children)
+
+    def _insert(self, tokens: List[str], name_id: int, children: List[List[int]]) -> None:
+        node = 0
+        for token in tokens:
+            token_id = self.vocab.setdefault(token, len(self.vocab))
+            key = node << 32 | token_id
+            child = self.goto.get(key)
+            if child is None:
+                child = self.goto[key] = len(children)
+                children.append([])
+                children[node].append(token_id)
+                self.fail.append(0)
+            node = child
+        self.output[node] = self.output.get(node, ()) + (name_id,)
+
+    def _link(self, children: List[List[int]]) -> None:
+        """Breadth-first failure links, folding each node's suffix outputs into its own"""
+        goto, fail, output = self.goto, self.fail, self.output
+        queue = deque(goto[t] for t in children[0])
+        while queue:
+            node = queue.popleft()
+            for token_id in children[node]:
+                child = goto[node << 32 | token_id]
+                state = fail[node]
+                while state and (state << 32 | token_id) not in goto:
+                    state = fail[state]
+                target = goto.get(state << 32 | token_id, 0)
+                fail[child] = target if target != child else 0
+                if fail[child] in output:
+                    output[child] = output.get(child, ()) + output[fail[child]]
+                queue.append(child)
+
+    def exact(self, tokens: List[str]) -> List[int]:
+        """Name ids of every listed name occurring as a token phrase in ``tokens``"""
+        goto, fail, output, vocab = self.goto, self.fail, self.output, self.vocab
+        hits: List[int] = []
+        node = 0
+        for token in tokens:
+            token_id = vocab.get(token)
+            if token_id is None:
+                node = 0
+                continue
+            while node and (node << 32 | token_id) not in goto:
+                node = fail[node]
+            node = goto.get(node << 32 | token_id, 0)
+            if node in output:
+                hits.extend(output[node])
+        return hits
+
+    def fuzzy(self, text: str, threshold: float) -> List[Tuple[int, float]]:
+        """(name id, Dice score) for names whose trigram similarity reaches ``threshold``"""
+        query = _grams(text)
+        size = len(query)
+        min_overlap = math.ceil(threshold * size / (2 - threshold))
+
+        # Dice >= threshold bounds the candidate's trigram count; names are numbered by it
+        starts = self.size_starts
+        low = starts[min(len(starts) - 1, math.ceil(threshold * size / (2 - threshold)))]
+        high = starts[min(len(starts) - 1, math.floor(size * (2 - threshold) / threshold) + 1)]
+        if low >= high:
+            return []
+
+        lists = []
+        for gram in query:
+            posting = self.postings.get(gram)
+            if posting is None:
+                lists.append(())
+            else:
+                lists.append(posting[bisect_left(posting, low):bisect_left(posting, high)])
+        lists.sort(key=len)
+
+        # A match misses at most (size - min_overlap) query grams, so it appears in at least
+        # ``extra + 1`` of the (size - min_overlap + 1 + extra) rarest lists
+        prefix = size - min_overlap + 1
+        considered = min(size, prefix + FUZZY_EXTRA_LISTS)
+        sets = [set(posting) for posting in lists[:considered]]
+        candidates = set()
+        for group in combinations(sets, considered - prefix + 1):
+            candidates.update(set.intersection(*group))
+
+        matches = []
+        names = self.names
+        for name_id in candidates:
+            grams = _grams(names[name_id])
+            score = 2 * len(query & grams) / (size + len(grams))
+            if score >= threshold:
+                matches.append((name_id, score))
+        return matches
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "entries": len(self.entries),
+            "names": len(self.names),
+            "automaton_states": len(self.fail),
+            "trigrams": len(self.postings)
+        }
+
+class SanctionsScreener:
+    """Screens counterparty names against the current watchlist index"""
+
+    def __init__(self, watchlist_path: Optional[str] = None, snapshot_path: Optional[str] = None,
+                 fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD):
+        self.watchlist_path = watchlist_path
+        self.snapshot_path = snapshot_path or (f"{watchlist_path}.idx" if watchlist_path else None)
+        self.fuzzy_threshold = fuzzy_threshold
+        self._reload_lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self.index = self._build()
+
+    @property
+    def version(self) -> str:
+        return self.index.version
+
+    def screen(self, counterparty: Optional[str], limit: int = 5) -> Dict[str, Any]:
+        """Exact and fuzzy watchlist matches for a name, best first"""
+        index = self.index  # one reference for the whole call, so a swap mid-screen is harmless
+        if not counterparty:
+            return {"sanctioned": False, "matches": [], "watchlist_version": index.version}
+
+        tokens = normalize_name(counterparty)
+        best: Dict[int, Dict[str, Any]] = {}
+        for name_id in index.exact(tokens):
+            self._keep(best, index, name_id, 1.0, "exact")
+        # Fuzzy scores never beat an exact hit, so skip the search once ``limit`` entries hit exactly
+        if len(best) < limit:
+            for name_id, score in index.fuzzy(" ".join(tokens), self.fuzzy_threshold):
+                self._keep(best, index, name_id, round(score, 4), "fuzzy")
+
+        matches = sorted(best.values(), key=lambda m: -m["score"])[:limit]
+        return {"sanctioned": bool(matches), "matches": matches, "watchlist_version": index.version}
+
+    @staticmethod
+    def _keep(best: Dict[int, Dict[str, Any]], index: WatchlistIndex, name_id: int, score: float, match_type: str) -> None:
+        entry_index = index.name_entry[name_id]
+        current = best.get(entry_index)
+        if current is not None and current["score"] >= score:
+            return
+        entry = index.entries[entry_index]
+        best[entry_index] = {
+            "entry_id": entry.entry_id,
+            "name": entry.name,
+            "matched_name": index.names[name_id],
+            "source": entry.source,
+            "score": score,
+            "match_type": match_type
+        }
+
+    def is_sanctioned(self, counterparty: Optional[str]) -> bool:
+        return self.screen(counterparty, limit=1)["sanctioned"]
+
+    def reload(self) -> bool:
+        """Rebuild from the watchlist file if it changed; returns whether the index was swapped"""
+        with self._reload_lock:
+            if not self.watchlist_path:
+                return False
+            if self._mtime == _mtime(self.watchlist_path):
+                return False
+            index = self._build()
+            swapped = index.version != self.index.version
+            self.index = index
+            return swapped
+
+    def _build(self) -> WatchlistIndex:
+        if not self.watchlist_path:
+            entries = [WatchlistEntry(str(i), name, [], "builtin") for i, name in enumerate(HIGH_RISK_ENTITIES)]
+            return WatchlistIndex(entries, "builtin")
+
+        self._mtime = _mtime(self.watchlist_path)
+        with open(self.watchlist_path, "rb") as f:
+            version = hashlib.sha256(f.read()).hexdigest()[:16]
+        index = self._load_snapshot(version)
+        if index is None:
+            index = WatchlistIndex(load_watchlist(self.watchlist_path), version)
+            self._write_snapshot(index)
+        return index
+
+    def _load_snapshot(self, version: str) -> Optional[WatchlistIndex]:
+        if not self.snapshot_path:
+            return None
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            return None
+        if snapshot.get("format") != SNAPSHOT_VERSION or snapshot["index"].version != version:
+            return None
+        return snapshot["index"]
+
+    def _write_snapshot(self, index: WatchlistIndex) -> None:
+        if not self.snapshot_path:
+            return
+        # Write then rename so a concurrent restart never loads a partial snapshot
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"format": SNAPSHOT_VERSION, "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.index.stats(), "watchlist_path": self.watchlist_path, "fuzzy_threshold": self.fuzzy_threshold}
+
+def _mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+_screener: Optional[SanctionsScreener] = None
+_screener_lock = threading.Lock()
+
+def get_screener() -> SanctionsScreener:
+    """The process-wide screener configured by SANCTIONS_WATCHLIST / SANCTIONS_SNAPSHOT"""
+    global _screener
+    if _screener is None:
+        with _screener_lock:
+            if _screener is None:
+                _screener = SanctionsScreener(
+                    watchlist_path=os.getenv("SANCTIONS_WATCHLIST") or None,
+                    snapshot_path=os.getenv("SANCTIONS_SNAPSHOT") or None,
+                    fuzzy_threshold=float(os.getenv("SANCTIONS_FUZZY_THRESHOLD", DEFAULT_FUZZY_THRESHOLD))
+                )
+    return _screener
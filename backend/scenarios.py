@@ -0,0 +1,159 @@
+"""
+Scenario grid sweeps for /simulate/grid.
+
+A grid is a set of axes, each a list of values for one extracted field, and
+is evaluated over the Cartesian product of the axes. Rules are evaluated
+incrementally against a baseline computed once from the deal's stored
+record:
+
+* a field -> rule dependency map finds the rules each axis can affect;
+  every other rule keeps its baseline outcome for the whole grid, and
+* each affected rule's outcome is memoized over the product of only the
+  axes it depends on, so a rule driven by the interest rate alone is
+  classified once per rate value, not once per grid point.
+
+Each grid point then costs one memo lookup per affected rule plus score
+finalization, and points are produced lazily so /simulate/grid can stream
+them.
+"""
+
+import itertools
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from normalization import FIELD_ATTRIBUTES, NormalizedDeal
+from rules import DATE_FORMAT, CompiledRuleSet, finalize_score
+
+def axis_size(field: str, values: Optional[List[str]] = None, start: Optional[str] = None,
+              stop: Optional[str] = None, step: Optional[float] = None) -> int:
+    """Number of values expand_axis would produce, without producing them; raises ValueError likewise"""
+    if field not in FIELD_ATTRIBUTES:
+        raise ValueError(f"Unknown field '{field}'")
+    if values is not None:
+        if not values:
+            raise ValueError(f"Axis '{field}' has no values")
+        return len(values)
+    if start is None or stop is None:
+        raise ValueError(f"Axis '{field}' needs either values or start and stop")
+
+    if field.endswith("_date"):
+        try:
+            first, last = datetime.strptime(start, DATE_FORMAT), datetime.strptime(stop, DATE_FORMAT)
+        except ValueError:
+            raise ValueError(f"Axis '{field}' range must use {DATE_FORMAT} dates")
+        days = int(step or 1)
+        if days <= 0 or last < first:
+            raise ValueError(f"Axis '{field}' range is empty")
+        return (last - first).days // days + 1
+
+    try:
+        first, last = float(start), float(stop)
+    except ValueError:
+        raise ValueError(f"Axis '{field}' range must be numeric")
+    if not step or step <= 0 or last < first:
+        raise ValueError(f"Axis '{field}' range needs a positive step and start <= stop")
+    count = round((last - first) / step, 9)
+    if not math.isfinite(count):
+        raise ValueError(f"Axis '{field}' range must be finite")
+    return int(count) + 1
+
+def expand_axis(field: str, values: Optional[List[str]] = None, start: Optional[str] = None,
+                stop: Optional[str] = None, step: Optional[float] = None) -> List[str]:
+    """Values for one axis: an explicit list, or an inclusive numeric / date range
+
+    Date ranges step in days (default 1); raises ValueError for malformed ranges.
+    Check axis_size first: a range is materialized in full.
+    """
+    count = axis_size(field, values, start, stop, step)
+    if values is not None:
+        return [str(v) for v in values]
+    if field.endswith("_date"):
+        first, days = datetime.strptime(start, DATE_FORMAT), int(step or 1)
+        return [(first + timedelta(days=i * days)).strftime(DATE_FORMAT) for i in range(count)]
+    first, step = float(start), float(step)
+    return [_format_number(first + i * step) for i in range(count)]
+
+def _format_number(value: float) -> str:
+    value = round(value, 9)
+    return str(int(value)) if value == int(value) else repr(value)
+
+class ScenarioGrid:
+    """Incremental evaluation of one deal over the product of field axes"""
+
+    def __init__(self, record: NormalizedDeal, fields: Dict[str, Any], axes: List[Tuple[str, List[str]]],
+                 rule_set: CompiledRuleSet, seed: Optional[str] = None):
+        self.record = record
+        self.seed = seed
+        self.fields = fields
+        self.axes = axes
+        self.rule_set = rule_set
+        self.size = 1
+        for _, values in axes:
+            self.size *= len(values)
+
+        # Baseline outcome of every rule on the stored record
+        self.baseline_codes = []
+        self.baseline_raw = 0
+        for step in rule_set.steps:
+            code = step.classify(step.values(record), step.params)
+            self.baseline_codes.append(code)
+            self.baseline_raw += step.impacts.get(code, 0)
+
+        # Field -> rule dependency map: the axes each rule reads, for the rules any axis touches
+        self.affected: List[Tuple[int, Tuple[int, ...]]] = []
+        for index, step in enumerate(rule_set.steps):
+            axis_indexes = tuple(i for i, (field, _) in enumerate(axes)
+                                 if set(step.depends_on) & set(FIELD_ATTRIBUTES[field]))
+            if axis_indexes:
+                self.affected.append((index, axis_indexes))
+        self._memo: List[Dict[Tuple[int, ...], Tuple[Optional[str], Tuple[Any, ...]]]] = [{} for _ in rule_set.steps]
+
+    def _outcome(self, step_index: int, axis_indexes: Tuple[int, ...], key: Tuple[int, ...]) -> Tuple[Optional[str], Tuple[Any, ...]]:
+        """Memoized (code, values) of one rule for a combination of its axes' values"""
+        memo = self._memo[step_index]
+        outcome = memo.get(key)
+        if outcome is None:
+            changes = {self.axes[a][0]: self.axes[a][1][v] for a, v in zip(axis_indexes, key)}
+            record = self.record.with_changes(self.fields, changes)
+            step = self.rule_set.steps[step_index]
+            values = step.values(record)
+            outcome = memo[key] = (step.classify(values, step.params), values)
+        return outcome
+
+    def points(self, include_validations: bool = False) -> Iterator[Dict[str, Any]]:
+        """Evaluate every grid point in row-major axis order"""
+        steps = self.rule_set.steps
+        baseline_impacts = [step.impacts.get(code, 0) for step, code in zip(steps, self.baseline_codes)]
+        ranges = [range(len(values)) for _, values in self.axes]
+
+        for point, combo in enumerate(itertools.product(*ranges)):
+            raw = self.baseline_raw
+            keys = {}
+            for step_index, axis_indexes in self.affected:
+                key = tuple(combo[a] for a in axis_indexes)
+                code, _ = self._outcome(step_index, axis_indexes, key)
+                raw += steps[step_index].impacts.get(code, 0) - baseline_impacts[step_index]
+                keys[step_index] = key
+            risk_score, risk_level = finalize_score(raw, self.seed)
+
+            result = {
+                "point": point,
+                "fields": {name: values[v] for (name, values), v in zip(self.axes, combo)},
+                "risk_score": risk_score,
+                "risk_level": risk_level
+            }
+            if include_validations:
+                result["validations"] = self._validations(keys)
+            yield result
+
+    def _validations(self, keys: Dict[int, Tuple[int, ...]]) -> List[Dict[str, Any]]:
+        validations = []
+        for index, step in enumerate(self.rule_set.steps):
+            if index in keys:
+                code, values = self._memo[index][keys[index]]
+            else:
+                code, values = self.baseline_codes[index], None
+            if code is not None:
+                validations.append(step.materialize(code, values if values is not None else step.values(self.record)))
+        return validations
@@ -0,0 +1,1041 @@
+"""
+Full-text retrieval over deal documents and validation results.
+
+Every deal contributes three kinds of passage: its extracted document text,
+cut at section boundaries into runs of lines of about PASSAGE_BYTES; one per
+validation (field, status and explanation); and one per ``ai_explanations``
+entry. Passages are ranked by BM25 over an inverted index with positional
+postings, so a quoted phrase in a query only matches word for word.
+
+The index is log-structured. New passages go to an in-memory buffer that is
+scored exhaustively. Once the buffer holds BUFFER_PASSAGES it is sealed into
+an immutable segment of flat arrays, and runs of MERGE_FACTOR segments of
+the same size tier are merged, dropping deleted passages. A segment keeps
+each term's postings twice:
+
+* in passage order, with positions, for phrase checks and lookups, and
+* ranked by quantized BM25 term weight ("impact"), in blocks of equal impact.
+
+A search takes impact blocks from the heaviest down and stops once no
+passage it has not reached could enter the top k. It then finishes the
+scores of the remaining contenders by lookup. Its cost follows the answer
+rather than the posting list lengths. A quoted phrase is checked against
+positions only for passages about to enter the top k, so a phrase of common
+words that seldom appear together can run into the postings budget. Asking about one deal
+scores only the postings inside that deal's passage ranges. Segments never
+change once built, so a long search lets go of the index lock every
+LOCK_SLICE seconds and carries on with the segments it started with.
+
+Deals are indexed by a background thread from a queue of deal IDs.
+Uploads, validations and deletes only mark a deal as changed, and each pass
+re-reads the deal and replaces whichever of its passages are out of date.
+
+Sealed segments are written once to SEARCH_INDEX_DIR. A manifest naming the
+live segments, the deleted passages and each deal's passage ranges is
+rewritten every SEARCH_SNAPSHOT_INTERVAL seconds and at shutdown, so a
+restart loads the index instead of rebuilding it. Deals that changed after
+the last manifest are found by comparing their validation stamps with the
+deal store. Each server process claims its own ``index-N`` directory.
+"""
+
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one index directory per process
+    fcntl = None
+
+SNAPSHOT_VERSION = 1
+PASSAGE_KINDS = ("document", "validation", "explanation")
+# Target size of a document passage; no passage gets near the 65536 positions a posting can hold
+PASSAGE_BYTES = 1024
+# Passages held in the exhaustively scored buffer before it is sealed into a segment
+BUFFER_PASSAGES = 4096
+# Segments of one size tier merged at a time
+MERGE_FACTOR = 8
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Impacts are BM25 term weights quantized to 1..IMPACT_LEVELS
+IMPACT_LEVELS = 255
+# Impact-ordered postings are read in blocks of whole levels: at least MIN_BLOCK_POSTINGS,
+# and no more than about MAX_BLOCKS per list
+MIN_BLOCK_POSTINGS = 128
+MAX_BLOCKS = 16
+DEFAULT_SNAPSHOT_INTERVAL = 60.0
+# Postings processed between checks of whether a search can stop early
+MIN_CHECK_INTERVAL = 256
+# Most postings one cross-deal search reads, and partial scores per result it completes,
+# before settling for the best passages found so far
+DEFAULT_POSTINGS_BUDGET = 50000
+COMPLETION_FACTOR = 32
+# Postings read in the time of one lookup, for choosing between reading on and completing by lookup
+LOOKUP_POSTINGS = 16
+# Longest a search holds the index lock before letting the indexer and other searches in, in seconds
+LOCK_SLICE = 0.002
+# Most passages one /search or /ask returns
+MAX_RESULTS = 100
+DEALS_PER_SCAN = 1000
+
+STOP_WORDS = frozenset((
+    "a", "about", "an", "and", "any", "are", "as", "at", "be", "by", "can", "did", "do", "does",
+    "for", "from", "has", "have", "how", "i", "if", "in", "is", "it", "its", "me", "of", "on",
+    "or", "so", "than", "that", "the", "their", "there", "these", "this", "those", "to", "was",
+    "we", "were", "what", "when", "where", "which", "who", "why", "will", "with", "you"
+))
+
+_WORD = re.compile(r"[^\W_]+")
+_PHRASE = re.compile(r'"([^"]*)"')
+
+def tokenize(text: str) -> List[Tuple[str, int]]:
+    """Lower-cased terms of ``text`` with their word positions, stop words left out"""
+    return [(word, position) for position, word in enumerate(_WORD.findall(text.lower()))
+            if word not in STOP_WORDS]
+
+def parse_query(query: str) -> Tuple[List[str], List[List[Tuple[str, int]]]]:
+    """Distinct query terms, and each quoted phrase as (term, offset from its first term)"""
+    phrases = []
+    for match in _PHRASE.finditer(query):
+        tokens = tokenize(match.group(1))
+        if len(tokens) > 1:
+            phrases.append([(term, position - tokens[0][1]) for term, position in tokens])
+    return list(dict.fromkeys(term for term, _ in tokenize(query))), phrases
+
+def highlights(text: str, terms: Iterable[str], offset: int = 0) -> List[Tuple[int, int]]:
+    """Byte ``[start, end)`` spans of ``terms`` in ``text``, which starts at byte ``offset``"""
+    wanted = set(terms)
+    spans = []
+    char, byte = 0, offset
+    for match in _WORD.finditer(text):
+        if match.group().lower() in wanted:
+            byte += len(text[char:match.start()].encode("utf-8"))
+            char = match.end()
+            start = byte
+            byte += len(match.group().encode("utf-8"))
+            spans.append((start, byte))
+    return spans
+
+def impact(tf: int, length: int, average_length: float) -> int:
+    """A term's BM25 weight in a passage, quantized to 1..IMPACT_LEVELS"""
+    weight = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / average_length))
+    return max(1, min(IMPACT_LEVELS, round(weight * IMPACT_LEVELS / (K1 + 1))))
+
+def _group(tokens: List[Tuple[str, int]]) -> Dict[str, List[int]]:
+    positions: Dict[str, List[int]] = {}
+    for term, position in tokens:
+        positions.setdefault(term, []).append(position)
+    return positions
+
+class _Postings:
+    """Term postings accumulated in passage order: passages, impacts, term counts and flat positions"""
+
+    __slots__ = ("docs", "impacts", "counts", "positions")
+
+    def __init__(self):
+        self.docs = array("I")
+        self.impacts = array("B")
+        self.counts = array("I")
+        self.positions = array("H")
+
+class _Segment:
+    """An immutable run of passages ``[base, limit)`` with its postings in flat arrays"""
+
+    __slots__ = ("segment_id", "base", "limit", "passages", "lengths", "terms", "term_starts",
+                 "docs", "impacts", "pos_starts", "positions", "ranked", "ranked_impacts",
+                 "block_starts", "block_ends", "block_levels", "size")
+
+    def __init__(self, segment_id: int, base: int, limit: int,
+                 passages: List[Optional[tuple]], lengths: array):
+        self.segment_id = segment_id
+        self.base = base
+        self.limit = limit
+        self.passages = passages             # passage metadata by ordinal - base; None once dropped
+        self.lengths = lengths               # passage lengths in terms, by ordinal - base
+        self.terms: Dict[str, int] = {}
+        self.term_starts = array("I", [0])   # term -> first posting; postings run in passage order
+        self.docs = array("I")               # posting -> passage ordinal
+        self.impacts = array("B")            # posting -> impact
+        self.pos_starts = array("I", [0])    # posting -> first position
+        self.positions = array("H")
+        self.ranked = array("I")             # per term, passage ordinals by impact, heaviest first
+        self.ranked_impacts = array("B")     # impacts in ranked order
+        self.block_starts = array("I", [0])  # term -> first impact block
+        self.block_ends = array("I")         # block -> end offset into ranked
+        self.block_levels = array("B")       # block -> highest impact in it
+        self.size = sum(1 for passage in passages if passage is not None)
+
+    def add_term(self, term: str, postings: _Postings) -> None:
+        self.terms[term] = len(self.term_starts) - 1
+        self.docs.extend(postings.docs)
+        self.impacts.extend(postings.impacts)
+        offset = self.pos_starts[-1]
+        for count in postings.counts:
+            offset += count
+            self.pos_starts.append(offset)
+        self.positions.extend(postings.positions)
+        self.term_starts.append(len(self.docs))
+        by_level: Dict[int, List[int]] = {}
+        for doc, level in zip(postings.docs, postings.impacts):
+            by_level.setdefault(level, []).append(doc)
+        # Blocks span whole impact levels, so a posting was read iff it outweighs the next block
+        block_size = max(MIN_BLOCK_POSTINGS, len(postings.docs) // MAX_BLOCKS)
+        block_start = len(self.ranked)
+        for level in sorted(by_level, reverse=True):
+            if len(self.ranked) == block_start:
+                self.block_levels.append(level)
+            docs = by_level[level]
+            self.ranked.extend(docs)
+            self.ranked_impacts.extend([level] * len(docs))
+            if len(self.ranked) - block_start >= block_size:
+                self.block_ends.append(len(self.ranked))
+                block_start = len(self.ranked)
+        if len(self.ranked) > block_start:
+            self.block_ends.append(len(self.ranked))
+        self.block_starts.append(len(self.block_ends))
+
+    def postings(self, term: str, deleted: Set[int]) -> Optional[_Postings]:
+        """A term's live postings, copied out for a merge"""
+        t = self.terms.get(term)
+        if t is None:
+            return None
+        start, end = self.term_starts[t], self.term_starts[t + 1]
+        pos_starts = self.pos_starts
+        postings = _Postings()
+        if not deleted:
+            postings.docs = self.docs[start:end]
+            postings.impacts = self.impacts[start:end]
+            postings.counts = array("I", (pos_starts[p + 1] - pos_starts[p] for p in range(start, end)))
+            postings.positions = self.positions[pos_starts[start]:pos_starts[end]]
+            return postings
+        for p in range(start, end):
+            if self.docs[p] not in deleted:
+                postings.docs.append(self.docs[p])
+                postings.impacts.append(self.impacts[p])
+                postings.counts.append(pos_starts[p + 1] - pos_starts[p])
+                postings.positions.extend(self.positions[pos_starts[p]:pos_starts[p + 1]])
+        return postings if postings.docs else None
+
+    def df(self, term: str) -> int:
+        t = self.terms.get(term)
+        return 0 if t is None else self.term_starts[t + 1] - self.term_starts[t]
+
+    def lookup(self, term: str, doc: int) -> int:
+        """Posting of ``doc`` in a term's list, or -1"""
+        t = self.terms.get(term)
+        if t is None:
+            return -1
+        end = self.term_starts[t + 1]
+        p = bisect_left(self.docs, doc, self.term_starts[t], end)
+        return p if p < end and self.docs[p] == doc else -1
+
+    def term_positions(self, p: int) -> array:
+        return self.positions[self.pos_starts[p]:self.pos_starts[p + 1]]
+
+class _Buffer:
+    """Passages indexed since the last seal"""
+
+    __slots__ = ("base", "passages", "lengths", "postings")
+
+    def __init__(self, base: int):
+        self.base = base
+        self.passages: List[Optional[tuple]] = []
+        self.lengths = array("I")
+        self.postings: Dict[str, _Postings] = {}
+
+    @property
+    def limit(self) -> int:
+        return self.base + len(self.passages)
+
+    def add(self, passage: tuple, tokens: List[Tuple[str, int]], average_length: float) -> int:
+        ordinal = self.limit
+        self.passages.append(passage)
+        self.lengths.append(len(tokens))
+        for term, positions in _group(tokens).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = _Postings()
+            postings.docs.append(ordinal)
+            postings.impacts.append(impact(len(positions), len(tokens), average_length))
+            postings.counts.append(len(positions))
+            postings.positions.extend(positions)
+        return ordinal
+
+    def df(self, term: str) -> int:
+        postings = self.postings.get(term)
+        return 0 if postings is None else len(postings.docs)
+
+    def lookup(self, term: str, doc: int) -> Tuple[int, Optional[array]]:
+        """Impact and positions of ``doc`` in a term's list, or (0, None)"""
+        postings = self.postings.get(term)
+        if postings is None:
+            return 0, None
+        p = bisect_left(postings.docs, doc)
+        if p == len(postings.docs) or postings.docs[p] != doc:
+            return 0, None
+        first = sum(postings.counts[:p])
+        return postings.impacts[p], postings.positions[first:first + postings.counts[p]]
+
+def _phrase_at(positions: List[Sequence[int]], offsets: List[int]) -> bool:
+    """Whether the phrase's terms occur at its offsets from some start"""
+    starts = set(positions[0])
+    for term_positions, offset in zip(positions[1:], offsets[1:]):
+        present = set(term_positions)
+        starts = {start for start in starts if start + offset in present}
+        if not starts:
+            return False
+    return bool(starts)
+
+def deal_passages(deal_data: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """(kind, label, text) for a deal's validations and AI explanations"""
+    assessment = deal_data.get("risk_assessment") or {}
+    passages = []
+    for validation in assessment.get("validations") or []:
+        passages.append(("validation", validation.get("rule_id") or validation["field"],
+                         f"{validation['field']} ({validation['status']}): {validation['explanation']}"))
+    for field, explanation in (assessment.get("ai_explanations") or {}).items():
+        label = field.replace("_", " ")
+        passages.append(("explanation", field, f"{label}: " + " ".join(str(v) for v in explanation.values())))
+    return passages
+
+class SearchIndex:
+    """BM25 index over every deal's document and validation passages
+
+    ``open_text(text_id)`` returns a stored document (see document_text.py)
+    and ``load_deal`` / ``list_deals`` read the deal store.
+    """
+
+    def __init__(self, directory: str, open_text: Callable[[str], Any],
+                 load_deal: Callable[[str], Optional[Dict[str, Any]]],
+                 list_deals: Callable[[int, Optional[str]], Tuple[List[Dict[str, Any]], Optional[str]]],
+                 snapshot_interval: float = DEFAULT_SNAPSHOT_INTERVAL,
+                 postings_budget: int = DEFAULT_POSTINGS_BUDGET):
+        self.directory = directory
+        self.snapshot_interval = snapshot_interval
+        self.postings_budget = postings_budget
+        self._open_text = open_text
+        self._load_deal = load_deal
+        self._list_deals = list_deals
+        os.makedirs(directory, exist_ok=True)
+        self.number, self._dir_lock = self._claim_directory()
+        self._dir = os.path.join(directory, f"index-{self.number}")
+
+        # Held by searches and by the indexer thread while it changes what searches read
+        self._lock = threading.Lock()
+        self._segments: List[_Segment] = []
+        self._bases: List[int] = []
+        self._buffer = _Buffer(0)
+        self._deleted: Set[int] = set()
+        # deal ID -> (text ID, document passage range, validation stamp, assessment passage range)
+        self._deals: Dict[str, Tuple[Optional[str], Tuple[int, int], Optional[str], Tuple[int, int]]] = {}
+        self._live = 0
+        self._total_length = 0
+        self._next_segment = 0
+        self._saved: Set[int] = set()
+
+        self._pending: Dict[str, None] = {}
+        self._pending_lock = threading.Condition(threading.Lock())
+        # Taken off the queue but not yet searchable
+        self._indexing: Optional[str] = None
+        self._reconcile = True
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._dirty = False
+        self.ready = False
+
+        self.deals_indexed = 0
+        self.merges = 0
+        self.snapshots = 0
+        self.index_errors = 0
+        self.budget_stops = 0
+        self.last_snapshot: Optional[float] = None
+
+    # Queueing
+
+    def mark(self, deal_id: str) -> None:
+        """Queue a deal for (re-)indexing after it is written or deleted"""
+        with self._pending_lock:
+            self._pending[deal_id] = None
+            self._pending_lock.notify_all()
+
+    def mark_all(self) -> None:
+        """Compare every deal with the deal store, e.g. after missing other processes' changes"""
+        with self._pending_lock:
+            self._reconcile = True
+            self._pending_lock.notify_all()
+
+    def wait_indexed(self, deal_id: str, timeout: float) -> bool:
+        """Wait until a queued deal has been indexed"""
+        with self._pending_lock:
+            return self._pending_lock.wait_for(
+                lambda: self.ready and deal_id not in self._pending and deal_id != self._indexing, timeout)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="search-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Index what is queued, write a snapshot and stop the indexer thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._pending_lock:
+            self._stopping = True
+            self._pending_lock.notify_all()
+        thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        if not self.ready:
+            self._load()
+            with self._pending_lock:
+                self.ready = True
+                self._pending_lock.notify_all()
+        last_snapshot = time.monotonic()
+        while True:
+            with self._pending_lock:
+                while not self._pending and not self._reconcile and not self._stopping:
+                    wait = last_snapshot + self.snapshot_interval - time.monotonic()
+                    if self._dirty and wait <= 0:
+                        break
+                    self._pending_lock.wait(wait if self._dirty else None)
+                reconcile, self._reconcile = self._reconcile, False
+                stopping = self._stopping and not self._pending
+            try:
+                if reconcile:
+                    self._reconcile_all()
+                self._drain()
+                if self._dirty and (stopping or time.monotonic() - last_snapshot >= self.snapshot_interval):
+                    last_snapshot = time.monotonic()
+                    self._snapshot()
+            except Exception:
+                # Keep serving the index as it is; the next change or snapshot retries
+                self.index_errors += 1
+                time.sleep(0.1)
+            if stopping:
+                return
+
+    def _drain(self) -> None:
+        while True:
+            with self._pending_lock:
+                if not self._pending:
+                    return
+                # A mark arriving while the deal is indexed queues it again
+                deal_id = next(iter(self._pending))
+                del self._pending[deal_id]
+                self._indexing = deal_id
+            try:
+                self._index_deal(deal_id)
+            except Exception:
+                self.index_errors += 1
+            with self._pending_lock:
+                self._indexing = None
+                self._pending_lock.notify_all()
+
+    def _reconcile_all(self) -> None:
+        """Queue deals whose stamp differs from the indexed one, and drop deals no longer stored"""
+        seen = set()
+        stale = []
+        cursor = None
+        while True:
+            rows, cursor = self._list_deals(DEALS_PER_SCAN, cursor)
+            for row in rows:
+                seen.add(row["deal_id"])
+                indexed = self._deals.get(row["deal_id"])
+                if indexed is None or indexed[2] != (row.get("validated_at") or row.get("uploaded_at")):
+                    stale.append(row["deal_id"])
+            if cursor is None:
+                break
+        stale.extend(deal_id for deal_id in self._deals if deal_id not in seen)
+        with self._pending_lock:
+            self._pending.update(dict.fromkeys(stale))
+
+    # Indexing (indexer thread only)
+
+    def _index_deal(self, deal_id: str) -> None:
+        deal_data = self._load_deal(deal_id)
+        indexed = self._deals.get(deal_id)
+        if deal_data is None:
+            if indexed is not None:
+                with self._lock:
+                    self._delete_range(indexed[1])
+                    self._delete_range(indexed[3])
+                    del self._deals[deal_id]
+                self._dirty = True
+            return
+
+        text_id = (deal_data.get("extraction") or {}).get("text_id")
+        stamp = deal_data.get("validated_at") or deal_data.get("uploaded_at")
+        document_range = indexed[1] if indexed is not None else (0, 0)
+        assessment_range = indexed[3] if indexed is not None else (0, 0)
+        if indexed is None or indexed[0] != text_id:
+            # Tokenize outside the lock; only the buffer append holds up searches
+            tokenized = self._document_passages(deal_id, text_id)
+            with self._lock:
+                self._delete_range(document_range)
+                document_range = self._add(tokenized)
+        if indexed is None or indexed[2] != stamp:
+            tokenized = [((deal_id, kind, label, text, -1, -1), tokenize(text))
+                         for kind, label, text in deal_passages(deal_data)]
+            with self._lock:
+                self._delete_range(assessment_range)
+                assessment_range = self._add(tokenized)
+        with self._lock:
+            self._deals[deal_id] = (text_id, document_range, stamp, assessment_range)
+        self._dirty = True
+        self.deals_indexed += 1
+        if len(self._buffer.passages) >= BUFFER_PASSAGES:
+            self._seal()
+
+    def _document_passages(self, deal_id: str, text_id: Optional[str]) -> List[Tuple[tuple, List[Tuple[str, int]]]]:
+        text = self._open_text(text_id) if text_id else None
+        if text is None:
+            return []
+        with text:
+            return [((deal_id, "document", text_id, None, start, end),
+                     tokenize(text.read(start, end).decode("utf-8", errors="ignore")))
+                    for start, end in text.passages(PASSAGE_BYTES)]
+
+    def _add(self, tokenized: List[Tuple[tuple, List[Tuple[str, int]]]]) -> Tuple[int, int]:
+        first = self._buffer.limit
+        for passage, tokens in tokenized:
+            self._live += 1
+            self._total_length += len(tokens)
+            self._buffer.add(passage, tokens, self._average_length())
+        return first, self._buffer.limit
+
+    def _delete_range(self, ordinals: Tuple[int, int]) -> None:
+        for ordinal in range(*ordinals):
+            if ordinal not in self._deleted:
+                self._deleted.add(ordinal)
+                self._live -= 1
+                self._total_length -= self._length(ordinal)
+
+    def _average_length(self) -> float:
+        return max(1.0, self._total_length / self._live) if self._live else 1.0
+
+    def _length(self, ordinal: int) -> int:
+        if ordinal >= self._buffer.base:
+            return self._buffer.lengths[ordinal - self._buffer.base]
+        segment = self._segments[bisect_right(self._bases, ordinal) - 1]
+        return segment.lengths[ordinal - segment.base]
+
+    def _seal(self) -> None:
+        """Turn the buffer into a segment, then merge segment runs that have filled a tier"""
+        buffer = self._buffer
+        if not buffer.passages:
+            return
+        deleted = {ordinal for ordinal in self._deleted if ordinal >= buffer.base}
+        segment = self._build([buffer], deleted, {term: [buffer] for term in buffer.postings})
+        with self._lock:
+            self._segments = self._segments + [segment]
+            self._bases = self._bases + [segment.base]
+            self._buffer = _Buffer(buffer.limit)
+            self._deleted -= deleted
+        self._merge()
+
+    def _merge(self) -> None:
+        while True:
+            run = self._mergeable()
+            if run is None:
+                return
+            first, last = run
+            sources = self._segments[first:last]
+            deleted = {ordinal for ordinal in self._deleted
+                       if sources[0].base <= ordinal < sources[-1].limit}
+            holders: Dict[str, List[Any]] = {}
+            for source in sources:
+                for term in source.terms:
+                    holders.setdefault(term, []).append(source)
+            merged = self._build(sources, deleted, holders)
+            with self._lock:
+                self._segments = self._segments[:first] + [merged] + self._segments[last:]
+                self._bases = [segment.base for segment in self._segments]
+                self._deleted -= deleted
+            self.merges += 1
+
+    def _mergeable(self) -> Optional[Tuple[int, int]]:
+        """The segment run to merge next: the newest MERGE_FACTOR of one tier, or one mostly deleted"""
+        segments = self._segments
+        if len(segments) >= MERGE_FACTOR:
+            tiers = [self._tier(segment) for segment in segments[-MERGE_FACTOR:]]
+            if len(set(tiers)) == 1:
+                return len(segments) - MERGE_FACTOR, len(segments)
+        counts = [0] * len(segments)
+        for ordinal in self._deleted:
+            index = bisect_right(self._bases, ordinal) - 1
+            if 0 <= index < len(segments) and ordinal < segments[index].limit:
+                counts[index] += 1
+        for index, segment in enumerate(segments):
+            if counts[index] * 2 > segment.size:
+                return index, index + 1
+        return None
+
+    @staticmethod
+    def _tier(segment: _Segment) -> int:
+        tier = 0
+        size = segment.size
+        while size >= BUFFER_PASSAGES * MERGE_FACTOR:
+            size //= MERGE_FACTOR
+            tier += 1
+        return tier
+
+    def _build(self, sources: List[Any], deleted: Set[int], holders: Dict[str, List[Any]]) -> _Segment:
+        """A segment from a buffer or adjacent segments, leaving out ``deleted``"""
+        passages: List[Optional[tuple]] = []
+        lengths = array("I")
+        for source in sources:
+            passages.extend(source.passages)
+            lengths.extend(source.lengths)
+        base = sources[0].base
+        for ordinal in deleted:
+            passages[ordinal - base] = None
+            lengths[ordinal - base] = 0
+        segment = _Segment(self._next_segment, base, sources[-1].limit, passages, lengths)
+        self._next_segment += 1
+        # Each source only walks its postings one by one if some of its passages were deleted
+        dropped = {id(source): {ordinal for ordinal in deleted if source.base <= ordinal < source.limit}
+                   for source in sources}
+        for term, holding in holders.items():
+            if isinstance(holding[0], _Buffer):
+                postings = holding[0].postings[term]
+                postings = _filter(postings, deleted) if deleted else postings
+            else:
+                parts = [source.postings(term, dropped[id(source)]) for source in holding]
+                postings = _concat([part for part in parts if part is not None])
+            if postings is not None and postings.docs:
+                segment.add_term(term, postings)
+        return segment
+
+    # Searching
+
+    def search(self, query: str, limit: int = 10, deal_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Best passages for ``query``, across every deal or within one"""
+        terms, phrases = parse_query(query)
+        if not terms:
+            return []
+        with self._lock:
+            accept = self._phrase_filter(phrases) if phrases else None
+            if deal_id is not None:
+                indexed = self._deals.get(deal_id)
+                if indexed is None:
+                    return []
+                ranges = [r for r in (indexed[1], indexed[3]) if r[1] > r[0]]
+                scores = self._score_ranges(terms, ranges)
+            else:
+                scores = self._top_k(terms, limit, accept)
+        candidates = [(-score, doc) for doc, score in scores.items()]
+        heapq.heapify(candidates)
+        # Best first, checking phrases only until ``limit`` pass; a passage merged away meanwhile has no metadata
+        with self._lock:
+            hits = []
+            deadline = time.perf_counter() + LOCK_SLICE
+            while candidates and len(hits) < limit:
+                negated, doc = heapq.heappop(candidates)
+                if doc in self._deleted or self._passage(doc) is None:
+                    continue
+                if accept is None or accept(doc):
+                    hits.append(self._hit(doc, -negated))
+                deadline = self._pause(deadline)
+            return hits
+
+    def _weights(self, terms: List[str]) -> List[float]:
+        """Per-term score of one impact level: BM25 IDF scaled back from the quantized weights"""
+        weights = []
+        n = max(1, self._live)
+        for term in terms:
+            df = sum(segment.df(term) for segment in self._segments) + self._buffer.df(term)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            weights.append(max(idf, 0.0) * (K1 + 1) / IMPACT_LEVELS)
+        return weights
+
+    def _score_buffer(self, terms: List[str], weights: List[float], scores: Dict[int, float],
+                      first: int = 0, end: Optional[int] = None) -> None:
+        for term, weight in zip(terms, weights):
+            postings = self._buffer.postings.get(term)
+            if postings is None:
+                continue
+            docs, impacts = postings.docs, postings.impacts
+            lo = bisect_left(docs, first) if first else 0
+            hi = bisect_left(docs, end) if end is not None else len(docs)
+            get = scores.get
+            for p in range(lo, hi):
+                doc = docs[p]
+                scores[doc] = get(doc, 0.0) + weight * impacts[p]
+
+    def _score_ranges(self, terms: List[str], ranges: List[Tuple[int, int]]) -> Dict[int, float]:
+        """Exact scores of the passages in ``ranges`` (one deal's)"""
+        weights = self._weights(terms)
+        scores: Dict[int, float] = {}
+        for first, end in ranges:
+            for segment in self._segments:
+                if segment.limit <= first or segment.base >= end:
+                    continue
+                for term, weight in zip(terms, weights):
+                    t = segment.terms.get(term)
+                    if t is None:
+                        continue
+                    docs, impacts = segment.docs, segment.impacts
+                    lo = bisect_left(docs, first, segment.term_starts[t], segment.term_starts[t + 1])
+                    hi = bisect_left(docs, end, lo, segment.term_starts[t + 1])
+                    get = scores.get
+                    for p in range(lo, hi):
+                        doc = docs[p]
+                        scores[doc] = get(doc, 0.0) + weight * impacts[p]
+            if end > self._buffer.base:
+                self._score_buffer(terms, weights, scores, max(first, self._buffer.base), end)
+        return scores
+
+    def _top_k(self, terms: List[str], k: int, accept: Optional[Callable[[int], bool]] = None) -> Dict[int, float]:
+        """Scores that contain the top ``k``, reading impact blocks heaviest first
+
+        Blocks span whole impact levels, so while a list's next block starts at
+        level L every unread posting in it weighs at most L. Reading stops when
+        the k-th best partial score reaches the most a passage not yet seen
+        could score in its segment, or after SEARCH_POSTINGS_BUDGET postings.
+        The partial scores still in reach of the k-th are then completed:
+        by reading the rest of the lists when that is cheaper, otherwise by
+        lookup from the best down until none left could reach the k-th
+        completed score or COMPLETION_FACTOR * k have been completed. Results
+        are exact unless a budget ran out first. With ``accept`` (a phrase
+        check), only accepted passages count towards the top k.
+
+        Called holding the index lock, which it releases between blocks
+        every LOCK_SLICE seconds; it keeps reading the segments it started
+        with, which outlive a seal or merge unchanged.
+        """
+        weights = self._weights(terms)
+        scores: Dict[int, float] = {}
+        self._score_buffer(terms, weights, scores)
+
+        segments = self._segments
+        bases = self._bases
+        buffer_base = self._buffer.base
+        # Per (segment, term) list: [segment index, term number, next block, end block, weight, term]
+        lists = []
+        remaining = [0.0] * len(segments)
+        heap = []
+        for s, segment in enumerate(segments):
+            for term, weight in zip(terms, weights):
+                t = segment.terms.get(term)
+                if t is None or weight <= 0:
+                    continue
+                block = segment.block_starts[t]
+                top = weight * segment.block_levels[block]
+                remaining[s] += top
+                heap.append((-top, len(lists)))
+                lists.append([s, t, block, segment.block_starts[t + 1], weight, term])
+        heapq.heapify(heap)
+
+        def read(index: int) -> array:
+            """Add the next block of a list to the partial scores"""
+            state = lists[index]
+            s, t, block, end_block, weight, _ = state
+            segment = segments[s]
+            start = segment.block_ends[block - 1] if block > segment.block_starts[t] else segment.term_starts[t]
+            end = segment.block_ends[block]
+            get = scores.get
+            ranked = segment.ranked[start:end]
+            for doc, level in zip(ranked, segment.ranked_impacts[start:end]):
+                scores[doc] = get(doc, 0.0) + weight * level
+            remaining[s] -= weight * segment.block_levels[block]
+            state[2] = block + 1
+            if block + 1 < end_block:
+                top = weight * segment.block_levels[block + 1]
+                remaining[s] += top
+                heapq.heappush(heap, (-top, index))
+            return ranked
+
+        deleted = self._deleted
+        # Partial scores only grow, so the top k can only change among itself and the passages read since
+        leaders: List[int] = [doc for doc in scores if doc not in deleted]
+        touched: List[array] = []
+        kth = 0.0
+        processed = 0
+        next_check = MIN_CHECK_INTERVAL
+        deadline = time.perf_counter() + LOCK_SLICE
+        exhausted = False
+        while heap:
+            if processed >= next_check:
+                contenders = set(leaders)
+                for ranked in touched:
+                    contenders.update(ranked)
+                contenders -= deleted
+                leaders, deadline = self._leaders(contenders, scores, k, accept, deadline)
+                touched = []
+                if len(leaders) == k:
+                    kth = scores[leaders[-1]]
+                    if kth >= max(remaining):
+                        break
+                next_check = processed + MIN_CHECK_INTERVAL
+                deadline = self._pause(deadline)
+            if processed >= self.postings_budget:
+                exhausted = True
+                break
+            ranked = read(heapq.heappop(heap)[1])
+            touched.append(ranked)
+            processed += len(ranked)
+        if not heap:
+            return scores
+
+        open_lists: Dict[int, List[List[Any]]] = {}
+        unread = 0
+        for state in lists:
+            if state[2] < state[3]:
+                open_lists.setdefault(state[0], []).append(state)
+                segment = segments[state[0]]
+                t = state[1]
+                read_to = segment.block_ends[state[2] - 1] if state[2] > segment.block_starts[t] else segment.term_starts[t]
+                unread += segment.term_starts[t + 1] - read_to
+        deadline = self._pause(deadline)
+        bound = max(remaining)
+        # Only partial scores within reach of the k-th can change the answer
+        cutoff = kth - bound
+        contenders = [(-score, doc) for doc, score in scores.items() if score > cutoff and doc not in deleted]
+        if not exhausted and unread <= min(len(contenders) * len(terms) * LOOKUP_POSTINGS,
+                                           self.postings_budget - processed):
+            while heap:
+                read(heapq.heappop(heap)[1])
+            return scores
+
+        truncated = len(contenders) > k * COMPLETION_FACTOR
+        if truncated:
+            contenders = heapq.nsmallest(k * COMPLETION_FACTOR, contenders)
+        heapq.heapify(contenders)
+        completed: List[float] = []
+        while contenders:
+            negated, doc = heapq.heappop(contenders)
+            score = -negated
+            if len(completed) == k and score + bound <= completed[0]:
+                break
+            if doc < buffer_base:
+                s = bisect_right(bases, doc) - 1
+                segment = segments[s]
+                for _, _, block, _, weight, term in open_lists.get(s, ()):
+                    p = segment.lookup(term, doc)
+                    # Postings above the list's next block level were read already
+                    if p >= 0 and segment.impacts[p] <= segment.block_levels[block]:
+                        score += weight * segment.impacts[p]
+                scores[doc] = score
+            deadline = self._pause(deadline)
+            if accept is not None and not accept(doc):
+                continue
+            if len(completed) < k:
+                heapq.heappush(completed, score)
+            elif score > completed[0]:
+                heapq.heapreplace(completed, score)
+        if exhausted or (truncated and not contenders):
+            self.budget_stops += 1
+        return scores
+
+    def _pause(self, deadline: float) -> float:
+        """Let writers take the index lock once ``deadline`` has passed; returns the next deadline"""
+        if time.perf_counter() < deadline:
+            return deadline
+        self._lock.release()
+        time.sleep(0)
+        self._lock.acquire()
+        return time.perf_counter() + LOCK_SLICE
+
+    def _leaders(self, contenders: Set[int], scores: Dict[int, float], k: int,
+                 accept: Optional[Callable[[int], bool]], deadline: float) -> Tuple[List[int], float]:
+        """The ``k`` best contenders by partial score, skipping those ``accept`` rejects, and the next deadline"""
+        if accept is None:
+            return heapq.nlargest(k, contenders, key=scores.__getitem__), deadline
+        ordered = [(-scores[doc], doc) for doc in contenders]
+        heapq.heapify(ordered)
+        leaders = []
+        while ordered and len(leaders) < k:
+            doc = heapq.heappop(ordered)[1]
+            if accept(doc):
+                leaders.append(doc)
+            deadline = self._pause(deadline)
+        return leaders, deadline
+
+    def _phrase_filter(self, phrases: List[List[Tuple[str, int]]]) -> Callable[[int], bool]:
+        """Whether a passage holds every phrase, memoized for the length of one search"""
+        checked: Dict[int, bool] = {}
+
+        def accept(doc: int) -> bool:
+            found = checked.get(doc)
+            if found is None:
+                found = checked[doc] = self._has_phrases(doc, phrases)
+            return found
+
+        return accept
+
+    def _positions(self, term: str, doc: int) -> Optional[Sequence[int]]:
+        if doc >= self._buffer.base:
+            return self._buffer.lookup(term, doc)[1]
+        segment = self._segments[bisect_right(self._bases, doc) - 1]
+        p = segment.lookup(term, doc)
+        return segment.term_positions(p) if p >= 0 else None
+
+    def _has_phrases(self, doc: int, phrases: List[List[Tuple[str, int]]]) -> bool:
+        for phrase in phrases:
+            positions = [self._positions(term, doc) for term, _ in phrase]
+            if any(p is None for p in positions) or not _phrase_at(positions, [o for _, o in phrase]):
+                return False
+        return True
+
+    def _passage(self, doc: int) -> tuple:
+        if doc >= self._buffer.base:
+            return self._buffer.passages[doc - self._buffer.base]
+        segment = self._segments[bisect_right(self._bases, doc) - 1]
+        return segment.passages[doc - segment.base]
+
+    def _hit(self, doc: int, score: float) -> Dict[str, Any]:
+        deal_id, kind, label, text, start, end = self._passage(doc)
+        hit = {"deal_id": deal_id, "kind": kind, "score": round(score, 4)}
+        if kind == "document":
+            hit.update({"text_id": label, "start": start, "end": end})
+        else:
+            hit.update({"field": label, "text": text})
+        return hit
+
+    # Snapshots
+
+    def _claim_directory(self) -> Tuple[int, Optional[int]]:
+        """The first index directory no other live process holds"""
+        number = 0
+        while True:
+            index_dir = os.path.join(self.directory, f"index-{number}")
+            os.makedirs(index_dir, exist_ok=True)
+            if fcntl is None:
+                return number, None
+            fd = os.open(os.path.join(index_dir, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return number, fd
+            except OSError:
+                os.close(fd)
+                number += 1
+
+    def _segment_path(self, segment_id: int) -> str:
+        return os.path.join(self._dir, f"{segment_id:08d}.seg")
+
+    def _snapshot(self) -> None:
+        """Seal the buffer, write new segments, then the manifest that names them"""
+        self._seal()
+        for segment in self._segments:
+            if segment.segment_id not in self._saved:
+                _write_pickle(self._segment_path(segment.segment_id), segment)
+                self._saved.add(segment.segment_id)
+        manifest = {
+            "format": SNAPSHOT_VERSION,
+            "segments": [segment.segment_id for segment in self._segments],
+            "next_segment": self._next_segment,
+            "deleted": self._deleted,
+            "deals": self._deals,
+            "live": self._live,
+            "total_length": self._total_length
+        }
+        _write_pickle(os.path.join(self._dir, "manifest"), manifest)
+        live = {segment.segment_id for segment in self._segments}
+        for name in os.listdir(self._dir):
+            if name.endswith(".seg") and int(name[:-4]) not in live:
+                os.remove(os.path.join(self._dir, name))
+        self._saved &= live
+        self._dirty = False
+        self.snapshots += 1
+        self.last_snapshot = time.time()
+
+    def _load(self) -> None:
+        try:
+            with open(os.path.join(self._dir, "manifest"), "rb") as f:
+                manifest = pickle.load(f)
+            if manifest.get("format") != SNAPSHOT_VERSION:
+                return
+            segments = []
+            for segment_id in manifest["segments"]:
+                with open(self._segment_path(segment_id), "rb") as f:
+                    segments.append(pickle.load(f))
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError):
+            # No usable snapshot: reconciling with the deal store indexes everything
+            return
+        with self._lock:
+            self._segments = segments
+            self._bases = [segment.base for segment in segments]
+            self._buffer = _Buffer(segments[-1].limit if segments else 0)
+            self._deleted = manifest["deleted"]
+            self._deals = manifest["deals"]
+            self._live = manifest["live"]
+            self._total_length = manifest["total_length"]
+            self._next_segment = manifest["next_segment"]
+            self._saved = {segment.segment_id for segment in segments}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._pending_lock:
+            pending = len(self._pending)
+        return {
+            "ready": self.ready,
+            "index_dir": self._dir,
+            "deals": len(self._deals),
+            "passages": self._live,
+            "segments": len(self._segments),
+            "buffered": len(self._buffer.passages),
+            "pending": pending,
+            "deals_indexed": self.deals_indexed,
+            "merges": self.merges,
+            "snapshots": self.snapshots,
+            "last_snapshot": self.last_snapshot,
+            "index_errors": self.index_errors,
+            "budget_stops": self.budget_stops
+        }
+
+    def close(self) -> None:
+        self.stop()
+        if self._dir_lock is not None:
+            os.close(self._dir_lock)
+
+def _filter(postings: _Postings, deleted: Set[int]) -> Optional[_Postings]:
+    kept = _Postings()
+    offset = 0
+    for doc, level, count in zip(postings.docs, postings.impacts, postings.counts):
+        if doc not in deleted:
+            kept.docs.append(doc)
+            kept.impacts.append(level)
+            kept.counts.append(count)
+            kept.positions.extend(postings.positions[offset:offset + count])
+        offset += count
+    return kept if kept.docs else None
+
+def _concat(parts: List[_Postings]) -> Optional[_Postings]:
+    if len(parts) <= 1:
+        return parts[0] if parts else None
+    joined = _Postings()
+    for part in parts:
+        joined.docs.extend(part.docs)
+        joined.impacts.extend(part.impacts)
+        joined.counts.extend(part.counts)
+        joined.positions.extend(part.positions)
+    return joined
+
+def _write_pickle(path: str, value: Any) -> None:
+    # Write then rename so a crash never leaves a partial file under the real name
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+def create_search_index(open_text: Callable[[str], Any], load_deal: Callable[[str], Optional[Dict[str, Any]]],
+                        list_deals: Callable[[int, Optional[str]], Tuple[List[Dict[str, Any]], Optional[str]]]) -> SearchIndex:
+    """Build the index configured by SEARCH_INDEX_DIR / SEARCH_SNAPSHOT_INTERVAL / SEARCH_POSTINGS_BUDGET"""
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_index")
+    return SearchIndex(
+        os.getenv("SEARCH_INDEX_DIR", default_dir),
+        open_text, load_deal, list_deals,
+        snapshot_interval=float(os.getenv("SEARCH_SNAPSHOT_INTERVAL", DEFAULT_SNAPSHOT_INTERVAL)),
+        postings_budget=int(os.getenv("SEARCH_POSTINGS_BUDGET", DEFAULT_POSTINGS_BUDGET))
+    )
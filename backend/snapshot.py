@@ -0,0 +1,449 @@
+"""
+Snapshots of in-process state, so a restart resumes warm.
+
+The memory deal store (DEAL_STORE=memory) and the assessment and summary
+caches live only in this process. A snapshot thread writes them to
+STATE_SNAPSHOT_DIR every STATE_SNAPSHOT_INTERVAL seconds and at shutdown,
+and the next start restores them.
+
+Deals are written incrementally. Each snapshot writes a delta file holding
+only the deals written or deleted since the previous one. Once the deltas
+hold COMPACT_RATIO as many deals as the base file (or MAX_DELTAS files
+pile up) they are folded with it into a new base, copying the encoded
+bodies from file to file without touching live state. Taking a delta holds
+the store's lock only to swap out its set of changed deals; the deals are
+encoded afterwards, so requests never wait on a snapshot. A deal stored
+again while its delta is being encoded is in the next delta as well.
+
+Every file has the same binary layout: a header (magic, format version,
+section count), a table of (name, offset, length) and the sections. These
+are each deal's listing row, exposure keys and content hash (``meta``),
+the encoded bodies and their offsets, deleted deal IDs and the shared
+records. A base also holds the risk counters and exposure aggregates of
+its deals, so those are not recomputed at startup.
+
+Restoring memory-maps the base and its deltas and loads only their
+metadata, so deal listings, counters and portfolio views are complete as
+soon as the server starts. A deal's body is decoded from the map on its
+first read, and GET /deal serves the stored encoding without decoding it.
+The caches are restored afterwards in the background; /health reports
+ready once they are.
+
+Each server process claims its own ``state-N`` directory.
+"""
+
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from array import array
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: one state directory per process
+    fcntl = None
+
+from storage import SUMMARY_FIELDS, DealStore, MemoryDealStore, snapshot_record
+
+SNAPSHOT_MAGIC = b"DCSS"
+SNAPSHOT_VERSION = 1
+# Magic, version, section count; then each section's name, offset and length
+HEADER = struct.Struct("<4sHxxI")
+SECTION = struct.Struct("<16sQQ")
+DEFAULT_INTERVAL = 60.0
+# Deltas are folded into a new base once they hold this many deals per deal in the base...
+COMPACT_RATIO = 0.5
+# ...and at least this many, or once there are MAX_DELTAS of them
+COMPACT_MIN_DEALS = 10000
+MAX_DELTAS = 64
+# Tries at encoding a deal that a request is changing meanwhile
+ENCODE_ATTEMPTS = 3
+CACHES_FILE = "caches"
+
+UPLOADED_AT = SUMMARY_FIELDS.index("uploaded_at")
+
+def write_snapshot(path: str, sections: List[Tuple[str, Iterable[bytes]]]) -> int:
+    """Write each section's chunks to ``path`` via a temporary file; returns the file size
+
+    Sections are consumed in order, so a later section may be generated from
+    lists that an earlier one filled while it was written.
+    """
+    tmp_path = f"{path}.tmp"
+    table = []
+    offset = HEADER.size + SECTION.size * len(sections)
+    with open(tmp_path, "wb") as f:
+        f.seek(offset)
+        for name, chunks in sections:
+            start = offset
+            for chunk in chunks:
+                f.write(chunk)
+                offset += len(chunk)
+            table.append(SECTION.pack(name.encode("ascii"), start, offset - start))
+        f.seek(0)
+        f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(sections)))
+        f.write(b"".join(table))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return offset
+
+def _pickled(value: Any) -> Iterator[bytes]:
+    # A generator, so a list filled while earlier sections are written is pickled complete
+    yield pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+def _packed(values: array) -> Iterator[bytes]:
+    yield values.tobytes()
+
+class SnapshotFile:
+    """A snapshot file, memory-mapped, with its metadata sections loaded"""
+
+    def __init__(self, path: str, metas: Optional[List[tuple]] = None):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count = HEADER.unpack_from(self._map)
+            if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot {path}")
+            self._sections: Dict[str, Tuple[int, int]] = {}
+            for number in range(count):
+                name, offset, length = SECTION.unpack_from(self._map, HEADER.size + number * SECTION.size)
+                self._sections[name.rstrip(b"\0").decode("ascii")] = (offset, length)
+            # Written just now: the caller still holds the metadata
+            self.metas: List[tuple] = metas if metas is not None else self.load("meta", [])
+            self.deleted: List[str] = self.load("deleted", [])
+            self.shared: Dict[Tuple[str, str], Dict[str, Any]] = self.load("shared", {})
+            # Only a base carries (risk counters, exposure aggregates)
+            self.aggregates: Optional[Tuple[Dict[str, int], Dict[str, Any]]] = self.load("aggregates", None)
+            self._bodies = self._sections.get("bodies", (0, 0))[0]
+            offset, length = self._sections.get("offsets", (0, 0))
+            self._offsets = array("Q", self._map[offset:offset + length])
+        except Exception:
+            self.close()
+            raise
+
+    def load(self, name: str, default: Any) -> Any:
+        """A pickled section, or ``default`` if the file has none"""
+        if name not in self._sections:
+            return default
+        offset, length = self._sections[name]
+        return pickle.loads(self._map[offset:offset + length])
+
+    def body(self, index: int) -> bytes:
+        """The encoded body of the ``index``-th deal in ``metas``"""
+        return self._map[self._bodies + self._offsets[index]:self._bodies + self._offsets[index + 1]]
+
+    @property
+    def size(self) -> int:
+        return len(self._map)
+
+    def close(self) -> None:
+        mapped = getattr(self, "_map", None)
+        if mapped is not None:
+            mapped.close()
+        self._file.close()
+
+def _encode_record(deal_data: Dict[str, Any]) -> Optional[Tuple[tuple, bytes]]:
+    for _ in range(ENCODE_ATTEMPTS):
+        try:
+            return snapshot_record(deal_data)
+        except RuntimeError:
+            # Changed by a request while being encoded ("dictionary changed size during iteration")
+            continue
+    return None
+
+class StateSnapshotter:
+    """Writes the memory deal store and the caches to disk, and restores them at startup
+
+    ``summary_is_current(deal_id, cached)`` tells whether a restored summary
+    still matches its deal's assessment.
+    """
+
+    def __init__(self, directory: str, deal_store: DealStore, assessment_cache: Any, summary_cache: Any,
+                 summary_is_current: Callable[[str, Any], bool], interval: float = DEFAULT_INTERVAL):
+        self.directory = directory
+        self.deal_store = deal_store
+        self.assessment_cache = assessment_cache
+        self.summary_cache = summary_cache
+        self.summary_is_current = summary_is_current
+        self.interval = interval
+        os.makedirs(directory, exist_ok=True)
+        self.number, self._dir_lock = self._claim_directory()
+        self._dir = os.path.join(directory, f"state-{self.number}")
+        # Durable stores have nothing to snapshot; the new store has no changes to lose yet
+        self.snapshots_deals = deal_store.snapshot_changes() is not None
+
+        # The current base (if any) and its deltas, oldest first
+        self._chain: List[SnapshotFile] = []
+        self.generation = 0
+        self._sequence = 0
+        self._cache_versions: Optional[Tuple[int, int]] = None
+
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+
+        self.restored_deals = 0
+        self.restore_seconds: Optional[float] = None
+        self.restored_cache_entries = 0
+        self.snapshots = 0
+        self.compactions = 0
+        self.last_snapshot: Optional[float] = None
+        self.last_snapshot_deals = 0
+        self.last_snapshot_seconds: Optional[float] = None
+        self.errors = 0
+
+    # Restoring
+
+    def restore(self) -> None:
+        """Load the newest base and its deltas into the deal store; bodies stay in the mapped files"""
+        started = time.perf_counter()
+        names = os.listdir(self._dir)
+        bases = sorted(name for name in names if name.endswith(".base"))
+        self.generation = int(bases[-1][:8]) if bases else 0
+        deltas = sorted(name for name in names if name.endswith(".delta") and int(name[:8]) == self.generation)
+        for name in names:
+            # Left behind by a crash during compaction or while writing
+            if name.endswith(".tmp") or (name[:8].isdigit() and int(name[:8]) < self.generation):
+                os.remove(os.path.join(self._dir, name))
+        if deltas:
+            self._sequence = int(deltas[-1][9:15]) + 1
+        if not self.snapshots_deals:
+            return
+
+        chain = []
+        for name in bases[-1:] + deltas:
+            path = os.path.join(self._dir, name)
+            try:
+                chain.append(SnapshotFile(path))
+            except (OSError, ValueError, pickle.UnpicklingError, EOFError):
+                # Later deltas build on this one, so the restore stops here; keep the files for inspection
+                self.errors += 1
+                for unusable in (bases[-1:] + deltas)[len(chain):]:
+                    os.replace(os.path.join(self._dir, unusable), os.path.join(self._dir, f"{unusable}.damaged"))
+                break
+        self.restored_deals = self.deal_store.restore(chain) if chain else 0
+        self._chain = chain
+        self.restore_seconds = round(time.perf_counter() - started, 3)
+
+    def _restore_caches(self) -> None:
+        try:
+            caches = SnapshotFile(os.path.join(self._dir, CACHES_FILE))
+        except FileNotFoundError:
+            return
+        try:
+            assessments = caches.load("assessment", [])
+            summaries = caches.load("summary", [])
+        finally:
+            caches.close()
+        summaries = [(deal_id, cached) for deal_id, cached in summaries if self.summary_is_current(deal_id, cached)]
+        self.assessment_cache.load(assessments)
+        self.summary_cache.load(summaries)
+        self.restored_cache_entries = len(assessments) + len(summaries)
+
+    # Writing
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="state-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write a last snapshot and stop the snapshot thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        try:
+            self._restore_caches()
+        except Exception:
+            # Start with cold caches rather than not at all
+            self.errors += 1
+        self.ready = True
+        while True:
+            with self._condition:
+                if not self._stopping:
+                    self._condition.wait(self.interval if self.interval > 0 else None)
+                stopping = self._stopping
+            try:
+                self.snapshot()
+            except Exception:
+                # Changes stay queued; the next snapshot retries
+                self.errors += 1
+            if stopping:
+                return
+
+    def snapshot(self) -> None:
+        """Write the deals changed since the last snapshot and any changed cache"""
+        started = time.perf_counter()
+        deals = 0
+        if self.snapshots_deals:
+            deals = self._write_delta()
+            if self._compaction_due():
+                self._compact()
+        self._write_caches()
+        self.snapshots += 1
+        self.last_snapshot = time.time()
+        self.last_snapshot_deals = deals
+        self.last_snapshot_seconds = round(time.perf_counter() - started, 3)
+
+    def _write_delta(self) -> int:
+        changed, shared = self.deal_store.snapshot_changes()
+        if not changed:
+            return 0
+        metas: List[tuple] = []
+        deleted: List[str] = []
+        retry: List[str] = []
+        offsets = array("Q", [0])
+
+        def bodies() -> Iterator[bytes]:
+            for deal_id, deal_data in changed:
+                if deal_data is None:
+                    deleted.append(deal_id)
+                    continue
+                record = _encode_record(deal_data)
+                if record is None:
+                    retry.append(deal_id)
+                    continue
+                meta, body = record
+                metas.append(meta)
+                offsets.append(offsets[-1] + len(body))
+                yield body
+
+        path = os.path.join(self._dir, f"{self.generation:08d}-{self._sequence:06d}.delta")
+        try:
+            write_snapshot(path, [("bodies", bodies()), ("offsets", _packed(offsets)), ("meta", _pickled(metas)),
+                                  ("deleted", _pickled(deleted)), ("shared", _pickled(shared))])
+        except Exception:
+            self.deal_store.requeue_changes(deal_id for deal_id, _ in changed)
+            raise
+        if retry:
+            self.deal_store.requeue_changes(retry)
+        self._sequence += 1
+        self._chain.append(SnapshotFile(path, metas))
+        return len(changed)
+
+    def _split_chain(self) -> Tuple[Optional[SnapshotFile], List[SnapshotFile]]:
+        if self._chain and self._chain[0].aggregates is not None:
+            return self._chain[0], self._chain[1:]
+        return None, self._chain
+
+    def _compaction_due(self) -> bool:
+        base, deltas = self._split_chain()
+        delta_deals = sum(len(delta.metas) + len(delta.deleted) for delta in deltas)
+        base_deals = len(base.metas) if base is not None else 0
+        return len(deltas) >= MAX_DELTAS or delta_deals >= max(COMPACT_MIN_DEALS, COMPACT_RATIO * base_deals)
+
+    def _compact(self) -> None:
+        """Fold the base and its deltas into a new base, copying encoded bodies between files"""
+        latest: Dict[str, Tuple[SnapshotFile, int]] = {}
+        for snapshot in self._chain:
+            for deal_id in snapshot.deleted:
+                latest.pop(deal_id, None)
+            for index, meta in enumerate(snapshot.metas):
+                latest[meta[0][0]] = (snapshot, index)
+        # Upload order, as the store lists deals
+        order = sorted(latest.values(), key=lambda ref: (ref[0].metas[ref[1]][0][UPLOADED_AT] or "",
+                                                         ref[0].metas[ref[1]][0][0]))
+        del latest
+        metas = [snapshot.metas[index] for snapshot, index in order]
+        offsets = array("Q", [0])
+
+        def bodies() -> Iterator[bytes]:
+            for snapshot, index in order:
+                body = snapshot.body(index)
+                offsets.append(offsets[-1] + len(body))
+                yield body
+
+        generation = self.generation + 1
+        path = os.path.join(self._dir, f"{generation:08d}.base")
+        write_snapshot(path, [("bodies", bodies()), ("offsets", _packed(offsets)), ("meta", _pickled(metas)),
+                              ("aggregates", _pickled(MemoryDealStore.aggregate(metas))),
+                              ("shared", _pickled(self._chain[-1].shared))])
+        base = SnapshotFile(path, metas)
+        # Unread deals move to the new base before the files they were read from close
+        self.deal_store.rebase(base)
+        replaced, self._chain = self._chain, [base]
+        self.generation = generation
+        self._sequence = 0
+        for snapshot in replaced:
+            snapshot.close()
+            os.remove(snapshot.path)
+        self.compactions += 1
+
+    def _write_caches(self) -> None:
+        versions = (self.assessment_cache.version, self.summary_cache.version)
+        if versions == self._cache_versions:
+            return
+        write_snapshot(os.path.join(self._dir, CACHES_FILE), [
+            ("assessment", _pickled(self.assessment_cache.entries())),
+            ("summary", _pickled(self.summary_cache.entries()))
+        ])
+        self._cache_versions = versions
+
+    def _claim_directory(self) -> Tuple[int, Optional[int]]:
+        """The first state directory no other live process holds"""
+        number = 0
+        while True:
+            state_dir = os.path.join(self.directory, f"state-{number}")
+            os.makedirs(state_dir, exist_ok=True)
+            if fcntl is None:
+                return number, None
+            fd = os.open(os.path.join(state_dir, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return number, fd
+            except OSError:
+                os.close(fd)
+                number += 1
+
+    def stats(self) -> Dict[str, Any]:
+        base, deltas = self._split_chain()
+        return {
+            "ready": self.ready,
+            "state_dir": self._dir,
+            "deal_store": self.snapshots_deals,
+            "generation": self.generation,
+            "base_deals": len(base.metas) if base is not None else 0,
+            "deltas": len(deltas),
+            "delta_deals": sum(len(delta.metas) + len(delta.deleted) for delta in deltas),
+            "bytes": sum(snapshot.size for snapshot in self._chain),
+            "restored_deals": self.restored_deals,
+            "restore_seconds": self.restore_seconds,
+            "restored_cache_entries": self.restored_cache_entries,
+            "snapshots": self.snapshots,
+            "compactions": self.compactions,
+            "last_snapshot": self.last_snapshot,
+            "last_snapshot_deals": self.last_snapshot_deals,
+            "last_snapshot_seconds": self.last_snapshot_seconds,
+            "errors": self.errors
+        }
+
+    def close(self) -> None:
+        self.stop()
+        for snapshot in self._chain:
+            snapshot.close()
+        if self._dir_lock is not None:
+            os.close(self._dir_lock)
+
+def create_state_snapshotter(deal_store: DealStore, assessment_cache: Any, summary_cache: Any,
+                             summary_is_current: Callable[[str, Any], bool]) -> StateSnapshotter:
+    """Build the snapshotter configured by STATE_SNAPSHOT_DIR / STATE_SNAPSHOT_INTERVAL"""
+    default_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snapshots")
+    return StateSnapshotter(
+        os.getenv("STATE_SNAPSHOT_DIR", default_dir),
+        deal_store, assessment_cache, summary_cache, summary_is_current,
+        interval=float(os.getenv("STATE_SNAPSHOT_INTERVAL", DEFAULT_INTERVAL))
+    )
@@ -0,0 +1,1039 @@
+"""
+Pluggable deal storage.
+
+DealStore is the interface every endpoint reads and writes deals through.
+MemoryDealStore keeps the original in-process dict behaviour, made durable
+across restarts by snapshot.py; SQLiteDealStore persists deals to a local
+WAL-mode database with the listing columns (uploaded_at, risk_score,
+status, counterparty, currency) broken out and indexed, and the full deal
+kept as a JSON document alongside them.
+
+Both keep deals ordered by upload time for cursor pagination and maintain
+the dashboard risk-bucket counters as deals are written and deleted, so a
+listing page and its counts cost O(page size) rather than O(total deals).
+Portfolio exposure (deal count and notional per counterparty, currency,
+risk bucket and maturity month, each split by currency) is maintained the
+same way, by applying each write's delta.
+
+The backend is chosen with DEAL_STORE ("sqlite" or "memory") and, for SQLite,
+DEAL_STORE_PATH. The configured store is wrapped in TimedDealStore, which
+records per-operation latency for /metrics.
+
+Several server processes can share one SQLite file. Every write is logged
+in a deal_changes table in the same transaction, and external_changes()
+reports the deals other processes have written so each process can drop its
+cached copies. Small shared records (registered rule sets, upload job state)
+live in a shared_state table next to the deals.
+"""
+
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from metrics import STORAGE_SECONDS
+from normalization import NormalizedDeal
+
+SUMMARY_FIELDS = ["deal_id", "filename", "counterparty", "notional_amount", "currency",
+                  "risk_score", "risk_level", "status", "uploaded_at", "validated_at"]
+
+# Dashboard risk buckets by score
+RISK_BUCKETS = ("high", "medium", "low")
+
+def risk_bucket(risk_score: Optional[int]) -> str:
+    risk_score = risk_score or 0
+    if risk_score >= 70:
+        return "high"
+    elif risk_score >= 40:
+        return "medium"
+    return "low"
+
+# Portfolio exposure views; every aggregate is split by deal currency
+EXPOSURE_DIMENSIONS = ("counterparty", "currency", "risk_bucket", "maturity")
+
+def exposure_keys(deal_data: Dict[str, Any]) -> Tuple[Tuple[str, ...], str, float]:
+    """A deal's key in each exposure dimension, its currency and notional"""
+    summary = deal_summary(deal_data)
+    normalized = deal_data.get("normalized")
+    notional = normalized.notional if isinstance(normalized, NormalizedDeal) else None
+    maturity_date = normalized.maturity_date if isinstance(normalized, NormalizedDeal) else None
+    currency = summary["currency"] or "UNKNOWN"
+    keys = (
+        summary["counterparty"] or "Unknown",
+        currency,
+        risk_bucket(summary["risk_score"]),
+        maturity_date.isoformat()[:7] if maturity_date else "unknown"
+    )
+    return keys, currency, notional or 0.0
+
+def encode_cursor(uploaded_at: str, deal_id: str) -> str:
+    """Opaque keyset cursor for the last row of a page"""
+    return base64.urlsafe_b64encode(f"{uploaded_at}|{deal_id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors"""
+    try:
+        uploaded_at, deal_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return uploaded_at, deal_id
+
+def deal_summary(deal_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The dashboard listing row for a deal"""
+    risk_assessment = deal_data.get("risk_assessment", {})
+    extracted_fields = deal_data.get("extracted_fields", {})
+    return {
+        "deal_id": deal_data["deal_id"],
+        "filename": deal_data.get("filename", "Unknown"),
+        "counterparty": extracted_fields.get("counterparty", "Unknown"),
+        "notional_amount": extracted_fields.get("notional_amount", "0"),
+        "currency": extracted_fields.get("currency", "USD"),
+        "risk_score": risk_assessment.get("risk_score", 0),
+        "risk_level": risk_assessment.get("risk_level", "Unknown"),
+        "status": deal_data.get("status", "uploaded"),
+        "uploaded_at": deal_data.get("uploaded_at"),
+        "validated_at": deal_data.get("validated_at")
+    }
+
+class DealStore:
+    """Interface for deal persistence"""
+
+    def get(self, deal_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def get_many(self, deal_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Fetch several deals at once; missing IDs are left out"""
+        deals = {}
+        for deal_id in deal_ids:
+            deal_data = self.get(deal_id)
+            if deal_data is not None:
+                deals[deal_id] = deal_data
+        return deals
+
+    def get_encoded(self, deal_id: str) -> Optional[bytes]:
+        """The deal as UTF-8 JSON, without building the dict where the backend can avoid it"""
+        deal_data = self.get(deal_id)
+        return _encode(deal_data).encode("utf-8") if deal_data is not None else None
+
+    def put(self, deal_data: Dict[str, Any]) -> None:
+        """Insert or replace a deal"""
+        self.put_many([deal_data])
+
+    def put_many(self, deals: Iterable[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def delete(self, deal_id: str) -> bool:
+        raise NotImplementedError
+
+    def contains(self, deal_id: str) -> bool:
+        return self.get(deal_id) is not None
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        """ID of the first deal uploaded with this document body, if any"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+    def risk_counts(self) -> Dict[str, int]:
+        """Deal counts per risk bucket, maintained incrementally"""
+        raise NotImplementedError
+
+    def list_page(self, limit: int, after: Optional[str] = None, status: Optional[str] = None,
+                  currency: Optional[str] = None, counterparty: Optional[str] = None,
+                  risk_level: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of listing rows, most recently uploaded first, plus the next-page cursor"""
+        raise NotImplementedError
+
+    def exposures(self, dimension: str) -> List[Dict[str, Any]]:
+        """Every ``{key, currency, notional, deals}`` aggregate of a dimension, maintained incrementally"""
+        raise NotImplementedError
+
+    def top_exposures(self, dimension: str, currency: str, limit: int) -> List[Dict[str, Any]]:
+        """The ``limit`` largest aggregates of a dimension in one currency, by notional"""
+        raise NotImplementedError
+
+    def iter_encoded(self, uploaded_from: Optional[str] = None, uploaded_before: Optional[str] = None,
+                     risk_level: Optional[str] = None, status: Optional[str] = None,
+                     batch_size: int = 1000) -> Iterator[bytes]:
+        """Every matching deal as UTF-8 JSON, oldest upload first
+
+        Bounds compare against ``uploaded_at`` (ISO 8601, ``uploaded_before``
+        exclusive). Deals are fetched ``batch_size`` at a time and no lock is
+        held between batches, so memory stays flat however many deals match.
+        """
+        raise NotImplementedError
+
+    def external_changes(self) -> Optional[List[str]]:
+        """IDs of deals written or deleted by other processes since the last call
+
+        None means the change log no longer reaches back that far and every
+        cached deal should be dropped.
+        """
+        return []
+
+    def put_shared(self, namespace: str, key: str, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Store a small record visible to every process using this store; ``ttl`` is in seconds"""
+        raise NotImplementedError
+
+    def get_shared(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    # Snapshots of stores that keep deals only in memory (see snapshot.py)
+
+    def snapshot_changes(self) -> Optional[Tuple[List[Tuple[str, Optional[Dict[str, Any]]]], Dict[Tuple[str, str], Dict[str, Any]]]]:
+        """Deals written since the last call (None for deleted ones) and the shared records
+
+        Durable stores return None: they have nothing to snapshot.
+        """
+        return None
+
+    def requeue_changes(self, deal_ids: Iterable[str]) -> None:
+        """Report deals as changed again after their snapshot failed"""
+        raise NotImplementedError
+
+    def restore(self, snapshots: List[Any]) -> int:
+        """Load snapshot files, the base first and then each delta, returning the deal count
+
+        Listing rows, counters and exposure come from the files' metadata; a
+        deal's body stays in its file until the deal is first read.
+        """
+        raise NotImplementedError
+
+    def rebase(self, snapshot: Any) -> None:
+        """Read bodies not yet decoded from a compacted snapshot file instead of the files it replaced"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __contains__(self, deal_id: str) -> bool:
+        return self.contains(deal_id)
+
+    def __len__(self) -> int:
+        return self.count()
+
+# Positions in the listing-row tuples MemoryDealStore keeps, which follow SUMMARY_FIELDS
+_COUNTERPARTY, _CURRENCY, _RISK_SCORE, _STATUS, _UPLOADED_AT = (
+    SUMMARY_FIELDS.index(field) for field in ("counterparty", "currency", "risk_score", "status", "uploaded_at")
+)
+# A reference to a body in a snapshot file packs the file's slot above the record's index
+_REF_BITS = 32
+_REF_INDEX = (1 << _REF_BITS) - 1
+
+def snapshot_record(deal_data: Dict[str, Any]) -> Tuple[tuple, bytes]:
+    """A deal's snapshot metadata (listing row, exposure keys, content hash) and its encoded body"""
+    summary = deal_summary(deal_data)
+    meta = (tuple(summary[field] for field in SUMMARY_FIELDS), exposure_keys(deal_data), deal_data.get("content_hash"))
+    return meta, _encode(deal_data).encode("utf-8")
+
+class MemoryDealStore(DealStore):
+    """Process-local dict storage; deals are lost on restart unless snapshotted (see snapshot.py)"""
+
+    def __init__(self):
+        # deal ID -> deal, or until its first read a deal restored from a snapshot as a body reference
+        self._deals: Dict[str, Any] = {}
+        # deal ID -> listing row as a tuple in SUMMARY_FIELDS order
+        self._summaries: Dict[str, tuple] = {}
+        # Ascending (uploaded_at, deal_id) keys, kept sorted on insert and delete
+        self._upload_order: List[Tuple[str, str]] = []
+        self._counts = {bucket: 0 for bucket in RISK_BUCKETS}
+        # dimension -> (key, currency) -> [notional, deals], plus ascending (notional, key) per
+        # (dimension, currency) so the largest aggregates are a slice
+        self._exposure: Dict[str, Dict[Tuple[str, str], List[Any]]] = {dimension: {} for dimension in EXPOSURE_DIMENSIONS}
+        self._ranked: Dict[Tuple[str, str], List[Tuple[float, str]]] = {}
+        self._exposure_keys: Dict[str, Tuple[Tuple[str, ...], str, float]] = {}
+        self._by_content_hash: Dict[str, str] = {}
+        self._shared: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # Snapshot files that restored deal bodies are read from, by reference slot
+        self._sources: List[Any] = []
+        # Deals written or deleted since the last snapshot_changes()
+        self._changed: Dict[str, None] = {}
+        self._lock = threading.RLock()
+
+    def get(self, deal_id: str) -> Optional[Dict[str, Any]]:
+        deal_data = self._deals.get(deal_id)
+        if type(deal_data) is int:
+            with self._lock:
+                deal_data = self._deals.get(deal_id)
+                if type(deal_data) is int:
+                    deal_data = self._deals[deal_id] = _decode(self._body(deal_data))
+        return deal_data
+
+    def get_encoded(self, deal_id: str) -> Optional[bytes]:
+        with self._lock:
+            deal_data = self._deals.get(deal_id)
+            if type(deal_data) is int:
+                # Still the snapshot's encoding; serve it without decoding
+                return self._body(deal_data)
+        return _encode(deal_data).encode("utf-8") if deal_data is not None else None
+
+    def _body(self, ref: int) -> bytes:
+        return self._sources[ref >> _REF_BITS].body(ref & _REF_INDEX)
+
+    def iter_encoded(self, uploaded_from=None, uploaded_before=None, risk_level=None, status=None, batch_size=1000):
+        last = (uploaded_from or "", "")
+        while True:
+            with self._lock:
+                position = bisect.bisect_right(self._upload_order, last)
+                keys = self._upload_order[position:position + batch_size]
+                # Bodies still in snapshot files are copied out while the lock keeps their files open
+                batch = []
+                for _, deal_id in keys:
+                    deal_data = self._deals[deal_id]
+                    batch.append((self._summaries[deal_id],
+                                  self._body(deal_data) if type(deal_data) is int else deal_data))
+            if not keys:
+                return
+            for (uploaded_at, _), (summary, deal_data) in zip(keys, batch):
+                if uploaded_before is not None and uploaded_at >= uploaded_before:
+                    return
+                if risk_level is not None and risk_bucket(summary[_RISK_SCORE]) != risk_level:
+                    continue
+                if status is not None and summary[_STATUS] != status:
+                    continue
+                yield deal_data if isinstance(deal_data, bytes) else _encode(deal_data).encode("utf-8")
+            last = keys[-1]
+
+    def put_shared(self, namespace, key, value, ttl=None):
+        # Process-local, like the deals themselves; entries are small and not expired
+        self._shared[(namespace, key)] = value
+
+    def get_shared(self, namespace, key):
+        return self._shared.get((namespace, key))
+
+    def put_many(self, deals: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            for deal_data in deals:
+                deal_id = deal_data["deal_id"]
+                self._unindex(deal_id)
+                summary = deal_summary(deal_data)
+                row = tuple(summary[field] for field in SUMMARY_FIELDS)
+                self._deals[deal_id] = deal_data
+                self._summaries[deal_id] = row
+                bisect.insort(self._upload_order, (row[_UPLOADED_AT] or "", deal_id))
+                self._counts[risk_bucket(row[_RISK_SCORE])] += 1
+                keys = self._exposure_keys[deal_id] = exposure_keys(deal_data)
+                self._apply_exposure(keys, 1)
+                content_hash = deal_data.get("content_hash")
+                if content_hash:
+                    self._by_content_hash.setdefault(content_hash, deal_id)
+                self._changed[deal_id] = None
+
+    def delete(self, deal_id: str) -> bool:
+        with self._lock:
+            if deal_id not in self._deals:
+                return False
+            # A restored deal is decoded for its content hash
+            deal_data = self.get(deal_id)
+            self._unindex(deal_id)
+            del self._deals[deal_id]
+            content_hash = deal_data.get("content_hash")
+            if content_hash and self._by_content_hash.get(content_hash) == deal_id:
+                del self._by_content_hash[content_hash]
+            self._changed[deal_id] = None
+            return True
+
+    def _unindex(self, deal_id: str, rank: bool = True) -> None:
+        summary = self._summaries.pop(deal_id, None)
+        if summary is None:
+            return
+        if rank:
+            key = (summary[_UPLOADED_AT] or "", deal_id)
+            position = bisect.bisect_left(self._upload_order, key)
+            if position < len(self._upload_order) and self._upload_order[position] == key:
+                del self._upload_order[position]
+        self._counts[risk_bucket(summary[_RISK_SCORE])] -= 1
+        self._apply_exposure(self._exposure_keys.pop(deal_id), -1, rank)
+
+    def _apply_exposure(self, exposure: Tuple[Tuple[str, ...], str, float], sign: int, rank: bool = True) -> None:
+        keys, currency, notional = exposure
+        for dimension, key in zip(EXPOSURE_DIMENSIONS, keys):
+            aggregates = self._exposure[dimension]
+            ranked = self._ranked.setdefault((dimension, currency), []) if rank else None
+            entry = aggregates.get((key, currency))
+            if entry is None:
+                entry = aggregates[(key, currency)] = [0.0, 0]
+            elif rank:
+                del ranked[bisect.bisect_left(ranked, (entry[0], key))]
+            entry[0] += sign * notional
+            entry[1] += sign
+            if entry[1] <= 0:
+                del aggregates[(key, currency)]
+            elif rank:
+                bisect.insort(ranked, (entry[0], key))
+
+    def contains(self, deal_id: str) -> bool:
+        return deal_id in self._deals
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        return self._by_content_hash.get(content_hash)
+
+    def count(self) -> int:
+        return len(self._deals)
+
+    def risk_counts(self) -> Dict[str, int]:
+        return dict(self._counts)
+
+    def exposures(self, dimension):
+        with self._lock:
+            return [{"key": key, "currency": currency, "notional": notional, "deals": deals}
+                    for (key, currency), (notional, deals) in self._exposure[dimension].items()]
+
+    def top_exposures(self, dimension, currency, limit):
+        with self._lock:
+            ranked = self._ranked.get((dimension, currency), [])
+            aggregates = self._exposure[dimension]
+            return [{"key": key, "currency": currency, "notional": notional,
+                     "deals": aggregates[(key, currency)][1]}
+                    for notional, key in reversed(ranked[-limit:])] if limit > 0 else []
+
+    def list_page(self, limit, after=None, status=None, currency=None, counterparty=None, risk_level=None):
+        with self._lock:
+            position = len(self._upload_order)
+            if after is not None:
+                position = bisect.bisect_left(self._upload_order, decode_cursor(after))
+
+            rows = []
+            while position > 0 and len(rows) < limit:
+                position -= 1
+                row = self._summaries[self._upload_order[position][1]]
+                if status is not None and row[_STATUS] != status:
+                    continue
+                if currency is not None and row[_CURRENCY] != currency:
+                    continue
+                if counterparty is not None and row[_COUNTERPARTY] != counterparty:
+                    continue
+                if risk_level is not None and risk_bucket(row[_RISK_SCORE]) != risk_level:
+                    continue
+                rows.append(dict(zip(SUMMARY_FIELDS, row)))
+
+            next_cursor = None
+            if len(rows) == limit and position > 0:
+                next_cursor = encode_cursor(rows[-1]["uploaded_at"] or "", rows[-1]["deal_id"])
+            return rows, next_cursor
+
+    # Snapshots (see snapshot.py)
+
+    def snapshot_changes(self):
+        with self._lock:
+            changed, self._changed = self._changed, {}
+            return [(deal_id, self.get(deal_id)) for deal_id in changed], dict(self._shared)
+
+    def requeue_changes(self, deal_ids: Iterable[str]) -> None:
+        with self._lock:
+            self._changed.update(dict.fromkeys(deal_ids))
+
+    @staticmethod
+    def aggregate(metas: Iterable[tuple]) -> Tuple[Dict[str, int], Dict[str, Dict[Tuple[str, str], List[Any]]]]:
+        """Risk counters and exposure aggregates of the deals with these snapshot metadata"""
+        counts = {bucket: 0 for bucket in RISK_BUCKETS}
+        exposure: Dict[str, Dict[Tuple[str, str], List[Any]]] = {dimension: {} for dimension in EXPOSURE_DIMENSIONS}
+        for row, (keys, currency, notional), _ in metas:
+            counts[risk_bucket(row[_RISK_SCORE])] += 1
+            for dimension, key in zip(EXPOSURE_DIMENSIONS, keys):
+                entry = exposure[dimension].get((key, currency))
+                if entry is None:
+                    exposure[dimension][(key, currency)] = [notional, 1]
+                else:
+                    entry[0] += notional
+                    entry[1] += 1
+        return counts, exposure
+
+    def restore(self, snapshots: List[Any]) -> int:
+        with self._lock:
+            content_hashes: Dict[str, Optional[str]] = {}
+            for snapshot in snapshots:
+                slot = len(self._sources) << _REF_BITS
+                self._sources.append(snapshot)
+                if snapshot.aggregates is not None:
+                    # A base file carries its deals' counters and exposure; only deltas are applied one by one
+                    self._counts, self._exposure = snapshot.aggregates
+                for deal_id in snapshot.deleted:
+                    self._unindex(deal_id, rank=False)
+                    self._deals.pop(deal_id, None)
+                    content_hashes.pop(deal_id, None)
+                for index, (row, keys, content_hash) in enumerate(snapshot.metas):
+                    deal_id = row[0]
+                    if snapshot.aggregates is None:
+                        self._unindex(deal_id, rank=False)
+                        self._counts[risk_bucket(row[_RISK_SCORE])] += 1
+                        self._apply_exposure(keys, 1, rank=False)
+                    self._deals[deal_id] = slot | index
+                    self._summaries[deal_id] = row
+                    self._exposure_keys[deal_id] = keys
+                    content_hashes[deal_id] = content_hash
+                self._shared = dict(snapshot.shared)
+
+            # Sorted views are rebuilt once rather than kept sorted per deal
+            self._upload_order = sorted((row[_UPLOADED_AT] or "", deal_id) for deal_id, row in self._summaries.items())
+            self._ranked = {}
+            for dimension, aggregates in self._exposure.items():
+                for (key, currency), (notional, _) in aggregates.items():
+                    self._ranked.setdefault((dimension, currency), []).append((notional, key))
+            for ranked in self._ranked.values():
+                ranked.sort()
+            self._by_content_hash = {}
+            for _, deal_id in self._upload_order:
+                content_hash = content_hashes[deal_id]
+                if content_hash:
+                    self._by_content_hash.setdefault(content_hash, deal_id)
+            return len(self._deals)
+
+    def rebase(self, snapshot: Any, batch_size: int = 10000) -> None:
+        with self._lock:
+            slot = len(self._sources) << _REF_BITS
+            self._sources.append(snapshot)
+            replaced = len(self._sources) - 1
+        metas = snapshot.metas
+        for start in range(0, len(metas), batch_size):
+            with self._lock:
+                for index in range(start, min(start + batch_size, len(metas))):
+                    deal_id = metas[index][0][0]
+                    if type(self._deals.get(deal_id)) is int:
+                        self._deals[deal_id] = slot | index
+        with self._lock:
+            # Nothing refers to the replaced files any more
+            for old in range(replaced):
+                self._sources[old] = None
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS deals (
+        deal_id TEXT PRIMARY KEY,
+        filename TEXT,
+        counterparty TEXT,
+        notional_amount TEXT,
+        currency TEXT,
+        risk_score INTEGER,
+        risk_level TEXT,
+        status TEXT NOT NULL,
+        uploaded_at TEXT NOT NULL,
+        validated_at TEXT,
+        content_hash TEXT,
+        notional REAL,
+        maturity_date TEXT,
+        data TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_deals_uploaded_at ON deals (uploaded_at, deal_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_risk_score ON deals (risk_score)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_status ON deals (status, uploaded_at, deal_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_counterparty ON deals (counterparty, uploaded_at, deal_id)",
+    "CREATE INDEX IF NOT EXISTS idx_deals_currency ON deals (currency, uploaded_at, deal_id)",
+    # Risk-bucket counters, kept current by triggers in the same transaction as the write
+    "CREATE TABLE IF NOT EXISTS deal_counts (bucket TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    """CREATE TRIGGER IF NOT EXISTS deals_count_insert AFTER INSERT ON deals BEGIN
+        UPDATE deal_counts SET value = value + 1 WHERE bucket = {new_bucket};
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS deals_count_delete AFTER DELETE ON deals BEGIN
+        UPDATE deal_counts SET value = value - 1 WHERE bucket = {old_bucket};
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS deals_count_update AFTER UPDATE OF risk_score ON deals
+    WHEN {old_bucket} != {new_bucket} BEGIN
+        UPDATE deal_counts SET value = value - 1 WHERE bucket = {old_bucket};
+        UPDATE deal_counts SET value = value + 1 WHERE bucket = {new_bucket};
+    END""",
+    # Deals written or deleted, by writer process, for cross-process cache invalidation
+    """CREATE TABLE IF NOT EXISTS deal_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        deal_id TEXT NOT NULL,
+        writer INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS shared_state (
+        namespace TEXT NOT NULL,
+        key TEXT NOT NULL,
+        data TEXT NOT NULL,
+        expires_at TEXT,
+        PRIMARY KEY (namespace, key)
+    )""",
+]
+
+_BUCKET_SQL = (
+    "(CASE WHEN COALESCE({row}.risk_score, 0) >= 70 THEN 'high' "
+    "WHEN COALESCE({row}.risk_score, 0) >= 40 THEN 'medium' ELSE 'low' END)"
+)
+_SCHEMA = [
+    statement.format(new_bucket=_BUCKET_SQL.format(row="NEW"), old_bucket=_BUCKET_SQL.format(row="OLD"))
+    if "TRIGGER" in statement else statement
+    for statement in _SCHEMA
+]
+# Columns added after the first schema, applied to existing databases on open:
+# (column, type, statement run on every open, backfill run once when the column is added)
+_COLUMN_MIGRATIONS = [
+    ("content_hash", "TEXT", "CREATE INDEX IF NOT EXISTS idx_deals_content_hash ON deals (content_hash)", None),
+    ("notional", "REAL", None, "UPDATE deals SET notional = json_extract(data, '$.normalized.notional')"),
+    ("maturity_date", "TEXT", None,
+     "UPDATE deals SET maturity_date = json_extract(data, '$.normalized.maturity_date')"),
+]
+
+# Exposure aggregates, kept current by triggers like deal_counts. Created after the
+# column migrations, since the triggers read the notional and maturity_date columns.
+_EXPOSURE_KEYS = {
+    "counterparty": "COALESCE({row}.counterparty, 'Unknown')",
+    "currency": "COALESCE({row}.currency, 'UNKNOWN')",
+    "risk_bucket": _BUCKET_SQL,
+    "maturity": "COALESCE(substr({row}.maturity_date, 1, 7), 'unknown')",
+}
+
+def _exposure_statements(row: str, sign: int) -> str:
+    currency = _EXPOSURE_KEYS["currency"].format(row=row)
+    notional = f"COALESCE({row}.notional, 0)"
+    statements = []
+    for dimension in EXPOSURE_DIMENSIONS:
+        key = _EXPOSURE_KEYS[dimension].format(row=row)
+        if sign > 0:
+            statements.append(
+                f"INSERT INTO deal_exposure (dimension, key, currency, notional, deals) "
+                f"VALUES ('{dimension}', {key}, {currency}, {notional}, 1) "
+                f"ON CONFLICT (dimension, key, currency) DO UPDATE SET "
+                f"notional = notional + excluded.notional, deals = deals + 1;"
+            )
+        else:
+            match = f"dimension = '{dimension}' AND key = {key} AND currency = {currency}"
+            statements.append(
+                f"UPDATE deal_exposure SET notional = notional - {notional}, deals = deals - 1 WHERE {match};"
+            )
+            statements.append(f"DELETE FROM deal_exposure WHERE {match} AND deals <= 0;")
+    return "\n        ".join(statements)
+
+_EXPOSURE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS deal_exposure (
+        dimension TEXT NOT NULL,
+        key TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        notional REAL NOT NULL,
+        deals INTEGER NOT NULL,
+        PRIMARY KEY (dimension, key, currency)
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_deal_exposure_rank ON deal_exposure (dimension, currency, notional)",
+    f"""CREATE TRIGGER IF NOT EXISTS deals_exposure_insert AFTER INSERT ON deals BEGIN
+        {_exposure_statements("NEW", 1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS deals_exposure_delete AFTER DELETE ON deals BEGIN
+        {_exposure_statements("OLD", -1)}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS deals_exposure_update AFTER UPDATE OF
+        counterparty, currency, notional, risk_score, maturity_date ON deals
+    WHEN OLD.counterparty IS NOT NEW.counterparty OR OLD.currency IS NOT NEW.currency
+        OR OLD.notional IS NOT NEW.notional OR OLD.maturity_date IS NOT NEW.maturity_date
+        OR {_BUCKET_SQL.format(row="OLD")} != {_BUCKET_SQL.format(row="NEW")} BEGIN
+        {_exposure_statements("OLD", -1)}
+        {_exposure_statements("NEW", 1)}
+    END""",
+]
+# Builds every aggregate from the deals table; run once, when the table is first created
+_SEED_EXPOSURE = [
+    f"INSERT INTO deal_exposure (dimension, key, currency, notional, deals) "
+    f"SELECT '{dimension}', {key.format(row='d')}, {_EXPOSURE_KEYS['currency'].format(row='d')}, "
+    f"SUM(COALESCE(d.notional, 0)), COUNT(*) FROM deals AS d GROUP BY 2, 3"
+    for dimension, key in _EXPOSURE_KEYS.items()
+]
+_RISK_LEVEL_FILTERS = {
+    "high": "COALESCE(risk_score, 0) >= 70",
+    "medium": "COALESCE(risk_score, 0) >= 40 AND COALESCE(risk_score, 0) < 70",
+    "low": "COALESCE(risk_score, 0) < 40",
+}
+
+# Statement text is kept constant so sqlite3's per-connection statement cache
+# reuses the prepared statements
+_SELECT_DEAL = "SELECT data FROM deals WHERE deal_id = ?"
+_SELECT_EXISTS = "SELECT 1 FROM deals WHERE deal_id = ?"
+_SELECT_BY_CONTENT_HASH = "SELECT deal_id FROM deals WHERE content_hash = ? ORDER BY uploaded_at LIMIT 1"
+_DELETE_DEAL = "DELETE FROM deals WHERE deal_id = ?"
+_SELECT_COUNTS = "SELECT bucket, value FROM deal_counts"
+_SELECT_EXPOSURES = "SELECT key, currency, notional, deals FROM deal_exposure WHERE dimension = ?"
+_SELECT_TOP_EXPOSURES = (
+    "SELECT key, currency, notional, deals FROM deal_exposure WHERE dimension = ? AND currency = ? "
+    "ORDER BY notional DESC LIMIT ?"
+)
+# An upsert (rather than INSERT OR REPLACE) so replacing a deal fires the
+# UPDATE trigger instead of silently deleting the old row
+_UPSERT_DEAL = (
+    "INSERT INTO deals (deal_id, filename, counterparty, notional_amount, currency, "
+    "risk_score, risk_level, status, uploaded_at, validated_at, content_hash, notional, maturity_date, data) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (deal_id) DO UPDATE SET filename = excluded.filename, "
+    "counterparty = excluded.counterparty, notional_amount = excluded.notional_amount, "
+    "currency = excluded.currency, risk_score = excluded.risk_score, risk_level = excluded.risk_level, "
+    "status = excluded.status, uploaded_at = excluded.uploaded_at, validated_at = excluded.validated_at, "
+    "content_hash = excluded.content_hash, notional = excluded.notional, "
+    "maturity_date = excluded.maturity_date, data = excluded.data"
+)
+_SUMMARY_COLUMNS = ", ".join(SUMMARY_FIELDS)
+_IN_CHUNK = 500
+
+_LOG_CHANGE = "INSERT INTO deal_changes (deal_id, writer) VALUES (?, ?)"
+_SELECT_CHANGES = "SELECT seq, deal_id, writer FROM deal_changes WHERE seq > ? ORDER BY seq"
+# Changes kept for processes that fall behind; one that misses more drops all cached deals
+CHANGE_LOG_RETAIN = 10000
+CHANGE_LOG_TRIM_INTERVAL = 1000
+_UPSERT_SHARED = (
+    "INSERT INTO shared_state (namespace, key, data, expires_at) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (namespace, key) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at"
+)
+_SELECT_SHARED = "SELECT data FROM shared_state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)"
+
+class SQLiteDealStore(DealStore):
+    """Deals persisted to a local SQLite database in WAL mode"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, cached_statements=256,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=268435456")
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for statement in _SCHEMA:
+                self._conn.execute(statement)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(deals)")}
+            for column, column_type, statement, backfill in _COLUMN_MIGRATIONS:
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE deals ADD COLUMN {column} {column_type}")
+                    if backfill:
+                        self._conn.execute(backfill)
+                if statement:
+                    self._conn.execute(statement)
+            exposure_exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'deal_exposure'"
+            ).fetchone()
+            for statement in _EXPOSURE_SCHEMA:
+                self._conn.execute(statement)
+            if not exposure_exists:
+                for statement in _SEED_EXPOSURE:
+                    self._conn.execute(statement)
+            seeded = self._conn.execute("SELECT COUNT(*) FROM deal_counts").fetchone()[0]
+            if not seeded:
+                # Counters start from the rows already present, once
+                self._conn.executemany(
+                    "INSERT INTO deal_counts (bucket, value) VALUES (?, 0)", [(bucket,) for bucket in RISK_BUCKETS]
+                )
+                self._conn.execute(
+                    f"UPDATE deal_counts SET value = (SELECT COUNT(*) FROM deals AS d "
+                    f"WHERE {_BUCKET_SQL.format(row='d')} = deal_counts.bucket)"
+                )
+            self._conn.execute("COMMIT")
+            self._writer = os.getpid()
+            self._change_seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM deal_changes").fetchone()[0]
+            self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            self._logged = 0
+            self._shared_writes = 0
+
+    def get(self, deal_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(_SELECT_DEAL, (deal_id,)).fetchone()
+        return _decode(row[0]) if row else None
+
+    def get_encoded(self, deal_id: str) -> Optional[bytes]:
+        # Rows are stored as JSON already
+        with self._lock:
+            row = self._conn.execute(_SELECT_DEAL, (deal_id,)).fetchone()
+        return row[0].encode("utf-8") if row else None
+
+    def get_many(self, deal_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        deals = {}
+        unique_ids = list(dict.fromkeys(deal_ids))
+        with self._lock:
+            for start in range(0, len(unique_ids), _IN_CHUNK):
+                chunk = unique_ids[start:start + _IN_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT deal_id, data FROM deals WHERE deal_id IN ({placeholders})", chunk
+                ).fetchall()
+                for deal_id, data in rows:
+                    deals[deal_id] = _decode(data)
+        return deals
+
+    def put_many(self, deals: Iterable[Dict[str, Any]]) -> None:
+        rows = [_row(deal_data) for deal_data in deals]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(_UPSERT_DEAL, rows)
+                self._conn.executemany(_LOG_CHANGE, [(row[0], self._writer) for row in rows])
+                self._trim_changes(len(rows))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def delete(self, deal_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                deleted = self._conn.execute(_DELETE_DEAL, (deal_id,)).rowcount > 0
+                if deleted:
+                    self._conn.execute(_LOG_CHANGE, (deal_id, self._writer))
+                    self._trim_changes(1)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def iter_encoded(self, uploaded_from=None, uploaded_before=None, risk_level=None, status=None, batch_size=1000):
+        clauses, params = _filters(status, None, None, risk_level)
+        if uploaded_before is not None:
+            clauses.append("uploaded_at < ?")
+            params.append(uploaded_before)
+        # Keyset pagination on the upload index; the first page starts at uploaded_from
+        clauses.append("(uploaded_at, deal_id) > (?, ?)")
+        sql = (f"SELECT uploaded_at, deal_id, data FROM deals WHERE {' AND '.join(clauses)} "
+               f"ORDER BY uploaded_at, deal_id LIMIT ?")
+        last = (uploaded_from or "", "")
+        while True:
+            with self._lock:
+                rows = self._conn.execute(sql, [*params, *last, batch_size]).fetchall()
+            for row in rows:
+                yield row[2].encode("utf-8")
+            if len(rows) < batch_size:
+                return
+            last = (rows[-1][0], rows[-1][1])
+
+    def _trim_changes(self, logged: int) -> None:
+        self._logged += logged
+        if self._logged >= CHANGE_LOG_TRIM_INTERVAL:
+            self._logged = 0
+            self._shared_writes = 0
+            self._conn.execute(
+                "DELETE FROM deal_changes WHERE seq <= (SELECT MAX(seq) FROM deal_changes) - ?",
+                (CHANGE_LOG_RETAIN,)
+            )
+
+    def external_changes(self) -> Optional[List[str]]:
+        with self._lock:
+            # data_version only moves when another connection commits, so the common case is one pragma
+            version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if version == self._data_version:
+                return []
+            self._data_version = version
+            rows = self._conn.execute(_SELECT_CHANGES, (self._change_seq,)).fetchall()
+            if not rows:
+                return []
+            missed = rows[0][0] > self._change_seq + 1
+            self._change_seq = rows[-1][0]
+        if missed:
+            return None
+        return list(dict.fromkeys(deal_id for _, deal_id, writer in rows if writer != self._writer))
+
+    def put_shared(self, namespace, key, value, ttl=None):
+        expires_at = (datetime.now() + timedelta(seconds=ttl)).isoformat() if ttl else None
+        with self._lock:
+            self._conn.execute(_UPSERT_SHARED, (namespace, key, json.dumps(value, separators=(",", ":")), expires_at))
+            self._shared_writes += 1
+            if self._shared_writes % CHANGE_LOG_TRIM_INTERVAL == 0:
+                self._conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (datetime.now().isoformat(),))
+
+    def get_shared(self, namespace, key):
+        with self._lock:
+            row = self._conn.execute(_SELECT_SHARED, (namespace, key, datetime.now().isoformat())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def contains(self, deal_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute(_SELECT_EXISTS, (deal_id,)).fetchone() is not None
+
+    def find_by_content_hash(self, content_hash: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(_SELECT_BY_CONTENT_HASH, (content_hash,)).fetchone()
+        return row[0] if row else None
+
+    def count(self) -> int:
+        return sum(self.risk_counts().values())
+
+    def risk_counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute(_SELECT_COUNTS).fetchall())
+        return {bucket: counts.get(bucket, 0) for bucket in RISK_BUCKETS}
+
+    def exposures(self, dimension):
+        with self._lock:
+            rows = self._conn.execute(_SELECT_EXPOSURES, (dimension,)).fetchall()
+        return [{"key": key, "currency": currency, "notional": notional, "deals": deals}
+                for key, currency, notional, deals in rows]
+
+    def top_exposures(self, dimension, currency, limit):
+        with self._lock:
+            rows = self._conn.execute(_SELECT_TOP_EXPOSURES, (dimension, currency, limit)).fetchall()
+        return [{"key": key, "currency": currency, "notional": notional, "deals": deals}
+                for key, currency, notional, deals in rows]
+
+    def list_page(self, limit, after=None, status=None, currency=None, counterparty=None, risk_level=None):
+        clauses, params = _filters(status, currency, counterparty, risk_level)
+        if after is not None:
+            clauses.append("(uploaded_at, deal_id) < (?, ?)")
+            params.extend(decode_cursor(after))
+        sql = f"SELECT {_SUMMARY_COLUMNS} FROM deals"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY uploaded_at DESC, deal_id DESC LIMIT ?"
+        params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last[SUMMARY_FIELDS.index("uploaded_at")], last[0])
+        return [_summary_row(row) for row in rows], next_cursor
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class TimedDealStore(DealStore):
+    """Delegates to another store, recording each operation's latency"""
+
+    OPERATIONS = ("get", "get_many", "get_encoded", "put", "put_many", "delete", "contains",
+                  "find_by_content_hash", "count", "risk_counts", "list_page", "exposures", "top_exposures")
+
+    def __init__(self, store: DealStore):
+        self.store = store
+        self._series = {operation: STORAGE_SECONDS.labels(operation) for operation in self.OPERATIONS}
+
+    def _timed(self, operation: str, fn, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._series[operation].observe(time.perf_counter() - started)
+
+    def get(self, deal_id):
+        return self._timed("get", self.store.get, deal_id)
+
+    def get_many(self, deal_ids):
+        return self._timed("get_many", self.store.get_many, deal_ids)
+
+    def get_encoded(self, deal_id):
+        return self._timed("get_encoded", self.store.get_encoded, deal_id)
+
+    def put(self, deal_data):
+        return self._timed("put", self.store.put, deal_data)
+
+    def put_many(self, deals):
+        return self._timed("put_many", self.store.put_many, deals)
+
+    def delete(self, deal_id):
+        return self._timed("delete", self.store.delete, deal_id)
+
+    def contains(self, deal_id):
+        return self._timed("contains", self.store.contains, deal_id)
+
+    def find_by_content_hash(self, content_hash):
+        return self._timed("find_by_content_hash", self.store.find_by_content_hash, content_hash)
+
+    def count(self):
+        return self._timed("count", self.store.count)
+
+    def risk_counts(self):
+        return self._timed("risk_counts", self.store.risk_counts)
+
+    def exposures(self, dimension):
+        return self._timed("exposures", self.store.exposures, dimension)
+
+    def top_exposures(self, dimension, currency, limit):
+        return self._timed("top_exposures", self.store.top_exposures, dimension, currency, limit)
+
+    def list_page(self, limit, after=None, status=None, currency=None, counterparty=None, risk_level=None):
+        return self._timed("list_page", self.store.list_page, limit, after=after, status=status,
+                           currency=currency, counterparty=counterparty, risk_level=risk_level)
+
+    def iter_encoded(self, uploaded_from=None, uploaded_before=None, risk_level=None, status=None, batch_size=1000):
+        # Untimed: a lazily consumed stream's latency mostly measures the client
+        return self.store.iter_encoded(uploaded_from, uploaded_before, risk_level, status, batch_size)
+
+    def external_changes(self):
+        return self.store.external_changes()
+
+    def put_shared(self, namespace, key, value, ttl=None):
+        return self.store.put_shared(namespace, key, value, ttl)
+
+    def get_shared(self, namespace, key):
+        return self.store.get_shared(namespace, key)
+
+    def snapshot_changes(self):
+        return self.store.snapshot_changes()
+
+    def requeue_changes(self, deal_ids):
+        return self.store.requeue_changes(deal_ids)
+
+    def restore(self, snapshots):
+        return self.store.restore(snapshots)
+
+    def rebase(self, snapshot):
+        return self.store.rebase(snapshot)
+
+    def close(self) -> None:
+        self.store.close()
+
+def _filters(status, currency, counterparty, risk_level):
+    clauses: List[str] = []
+    params: List[Any] = []
+    if status is not None:
+        clauses.append("status = ?")
+        params.append(status)
+    if currency is not None:
+        clauses.append("currency = ?")
+        params.append(currency)
+    if counterparty is not None:
+        clauses.append("counterparty = ?")
+        params.append(counterparty)
+    if risk_level is not None:
+        clauses.append(_RISK_LEVEL_FILTERS[risk_level])
+    return clauses, params
+
+def _summary_row(row) -> Dict[str, Any]:
+    summary = dict(zip(SUMMARY_FIELDS, row))
+    if summary["risk_score"] is None:
+        summary["risk_score"] = 0
+    if summary["risk_level"] is None:
+        summary["risk_level"] = "Unknown"
+    return summary
+
+def _row(deal_data: Dict[str, Any]) -> tuple:
+    summary = deal_summary(deal_data)
+    risk_assessment = deal_data.get("risk_assessment")
+    normalized = deal_data.get("normalized")
+    if not isinstance(normalized, NormalizedDeal):
+        normalized = None
+    return (
+        summary["deal_id"], summary["filename"], summary["counterparty"], summary["notional_amount"],
+        summary["currency"],
+        risk_assessment.get("risk_score") if risk_assessment else None,
+        risk_assessment.get("risk_level") if risk_assessment else None,
+        summary["status"], summary["uploaded_at"] or "", summary["validated_at"],
+        deal_data.get("content_hash"),
+        normalized.notional if normalized else None,
+        normalized.maturity_date.isoformat() if normalized and normalized.maturity_date else None,
+        _encode(deal_data)
+    )
+
+def _encode(deal_data: Dict[str, Any]) -> str:
+    normalized = deal_data.get("normalized")
+    if isinstance(normalized, NormalizedDeal):
+        deal_data = {**deal_data, "normalized": normalized.model_dump(mode="json")}
+    return json.dumps(deal_data, separators=(",", ":"))
+
+def _decode(data: Union[str, bytes]) -> Dict[str, Any]:
+    deal_data = json.loads(data)
+    if deal_data.get("normalized") is not None:
+        deal_data["normalized"] = NormalizedDeal.model_validate(deal_data["normalized"])
+    return deal_data
+
+def create_deal_store() -> DealStore:
+    """Build the deal store configured by DEAL_STORE / DEAL_STORE_PATH"""
+    backend = os.getenv("DEAL_STORE", "sqlite").lower()
+    if backend == "memory":
+        return TimedDealStore(MemoryDealStore())
+    if backend == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deals.db")
+        return TimedDealStore(SQLiteDealStore(os.getenv("DEAL_STORE_PATH", default_path)))
+    raise ValueError(f"Unknown DEAL_STORE backend: {backend}")
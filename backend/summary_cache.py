@@ -0,0 +1,127 @@
+"""
+Materialized deal summaries for /summary.
+
+A summary is built when a new risk assessment is written and kept as its
+encoded JSON body with a strong ETag. It is replaced only when the
+assessment it was built from changes; re-validating to an identical result
+keeps the same body and ETag. Serving a summary is then one dictionary
+lookup, and clients revalidating with If-None-Match get a 304.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+class CachedSummary:
+    __slots__ = ("fingerprint", "etag", "body")
+
+    def __init__(self, fingerprint: str, etag: str, body: bytes):
+        self.fingerprint = fingerprint
+        self.etag = etag
+        self.body = body
+
+def assessment_fingerprint(risk_assessment: Dict[str, Any]) -> str:
+    """Digest of the assessment fields a summary is generated from"""
+    basis = [risk_assessment.get("risk_score", 0), risk_assessment.get("risk_level"),
+             risk_assessment.get("validations", [])]
+    return hashlib.sha256(json.dumps(basis, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches ``etag`` (weak comparison, as RFC 9110 requires)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+class SummaryCache:
+    """Bounded LRU of encoded summaries keyed by deal ID"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.builds = 0
+        # Bumped on every change, so a snapshot can skip an unchanged cache
+        self.version = 0
+
+    def get(self, deal_id: str) -> Optional[CachedSummary]:
+        with self._lock:
+            cached = self._entries.get(deal_id)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(deal_id)
+            self.hits += 1
+            return cached
+
+    def current(self, deal_id: str, fingerprint: str) -> Optional[CachedSummary]:
+        """The cached summary if it was built from the assessment with this fingerprint"""
+        with self._lock:
+            cached = self._entries.get(deal_id)
+        return cached if cached is not None and cached.fingerprint == fingerprint else None
+
+    def put(self, deal_id: str, fingerprint: str, summary: Dict[str, Any]) -> CachedSummary:
+        body = json.dumps(summary, separators=(",", ":")).encode("utf-8")
+        cached = CachedSummary(fingerprint, f'"{hashlib.sha256(body).hexdigest()[:32]}"', body)
+        with self._lock:
+            self._entries[deal_id] = cached
+            self._entries.move_to_end(deal_id)
+            self.builds += 1
+            self.version += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached
+
+    def invalidate_if_changed(self, deal_id: str, risk_assessment: Dict[str, Any]) -> None:
+        """Drop a cached summary whose assessment has been replaced by a different one"""
+        with self._lock:
+            cached = self._entries.get(deal_id)
+        if cached is not None and cached.fingerprint != assessment_fingerprint(risk_assessment):
+            self.invalidate(deal_id)
+
+    def invalidate(self, deal_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(deal_id, None) is not None:
+                self.version += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.version += 1
+
+    def entries(self) -> List[Tuple[str, CachedSummary]]:
+        """Every entry, least recently used first"""
+        with self._lock:
+            return list(self._entries.items())
+
+    def load(self, entries: List[Tuple[str, CachedSummary]]) -> None:
+        """Add restored entries (see snapshot.py) behind those added since startup"""
+        with self._lock:
+            current = self._entries
+            self._entries = OrderedDict((deal_id, cached) for deal_id, cached in entries if deal_id not in current)
+            self._entries.update(current)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "builds": self.builds,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }